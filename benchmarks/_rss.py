@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+from typing import Optional
+
+
+def peak_rss_mb(code: str) -> Optional[float]:
+    """
+    Runs ``code`` in a fresh interpreter and returns its peak resident set size in MB.
+
+    Returns None on platforms without ``os.wait4`` (Windows).
+    """
+    if not hasattr(os, 'wait4'):
+        return None
+    proc = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+    stderr = proc.stderr.read().decode('utf-8', 'replace')
+    proc.stderr.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark subprocess failed:\n{stderr}")
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return usage.ru_maxrss / divisor
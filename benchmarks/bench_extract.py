@@ -0,0 +1,67 @@
+"""
+Offline throughput and memory benchmarks against a local mock ArcGIS server.
+
+Usage:
+    pip install ezesri[bench]
+    python -m pytest benchmarks/bench_extract.py --benchmark-only
+    EZESRI_BENCH_SCALE=10 python -m pytest benchmarks/bench_extract.py --benchmark-only
+
+Each benchmark records features per second and the peak RSS of the same
+workload run in a fresh interpreter in ``extra_info`` (shown with
+``--benchmark-json``).
+"""
+
+import os
+import shutil
+import textwrap
+
+import pytest
+
+from ezesri import bulk_export, extract_layer
+from ezesri.utils import has_filegdb_write_support
+
+from _rss import peak_rss_mb
+from conftest import LAYERS, LAYER_IDS
+
+OUTPUT_FORMATS = ['geojson', 'shapefile', 'csv', 'gpkg', 'geoparquet', 'parquet', 'ndjson', 'gdb']
+
+
+@pytest.mark.parametrize('layer', list(LAYERS))
+def test_extract_layer(benchmark, mock_server, layer):
+    url = mock_server.layer_url(LAYER_IDS[layer])
+
+    df = benchmark.pedantic(extract_layer, args=(url,), rounds=3, iterations=1)
+
+    assert len(df) == LAYERS[layer]['count']
+    benchmark.extra_info['features'] = len(df)
+    benchmark.extra_info['features_per_second'] = len(df) / benchmark.stats.stats.mean
+    benchmark.extra_info['peak_rss_mb'] = peak_rss_mb(textwrap.dedent(f"""
+        import os
+        os.environ['EZESRI_CACHE_DIR'] = {os.environ['EZESRI_CACHE_DIR']!r}
+        from ezesri import extract_layer
+        extract_layer({url!r})
+    """))
+
+
+@pytest.mark.parametrize('output_format', OUTPUT_FORMATS)
+def test_bulk_export(benchmark, mock_server, tmp_path, output_format):
+    if output_format == 'gdb' and not has_filegdb_write_support()[0]:
+        pytest.skip('FileGDB write driver not available')
+    out_dir = tmp_path / 'out'
+
+    def run():
+        shutil.rmtree(out_dir, ignore_errors=True)
+        bulk_export(mock_server.url, str(out_dir), output_format=output_format, workers=2)
+
+    benchmark.pedantic(run, rounds=2, iterations=1)
+
+    spatial_only = output_format in ('geojson', 'shapefile', 'gdb', 'gpkg', 'geoparquet')
+    expected = sum(spec['count'] for spec in LAYERS.values() if spec['geometry'] or not spatial_only)
+    benchmark.extra_info['features'] = expected
+    benchmark.extra_info['features_per_second'] = expected / benchmark.stats.stats.mean
+    benchmark.extra_info['peak_rss_mb'] = peak_rss_mb(textwrap.dedent(f"""
+        import os
+        os.environ['EZESRI_CACHE_DIR'] = {os.environ['EZESRI_CACHE_DIR']!r}
+        from ezesri import bulk_export
+        bulk_export({mock_server.url!r}, {str(tmp_path / 'rss')!r}, output_format={output_format!r}, workers=2)
+    """))
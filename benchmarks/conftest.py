@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from ezesri.testing import MockArcGISServer, SyntheticLayer
+
+# Multiply layer sizes with EZESRI_BENCH_SCALE=10 for longer, steadier runs.
+SCALE = float(os.environ.get('EZESRI_BENCH_SCALE', '1'))
+
+LAYERS = {
+    'points': dict(name='Points', count=int(20000 * SCALE), geometry='point', extra_fields=4),
+    'lines': dict(name='Lines', count=int(5000 * SCALE), geometry='polyline', vertices=20),
+    'polygons': dict(name='Polygons', count=int(5000 * SCALE), geometry='polygon', vertices=40),
+    'table': dict(name='Table', count=int(20000 * SCALE), geometry=None, extra_fields=8),
+}
+LAYER_IDS = {key: i for i, key in enumerate(LAYERS)}
+
+
+@pytest.fixture(scope='session')
+def mock_server():
+    """One mock FeatureServer with a layer per benchmark shape."""
+    layers = {LAYER_IDS[key]: SyntheticLayer(**spec) for key, spec in LAYERS.items()}
+    with MockArcGISServer(layers, service_name='Benchmark') as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Learned batch sizes from earlier runs would skew comparisons."""
+    monkeypatch.setenv('EZESRI_CACHE_DIR', str(tmp_path / 'ezesri-cache'))
@@ -0,0 +1,74 @@
+"""
+Import-time benchmark for the ezesri CLI.
+
+Measures how long a fresh interpreter takes to import `ezesri.cli` (the work
+done before `ezesri metadata <url>` sends its first request) and checks that
+the heavy geospatial stack is not loaded on that path.
+
+Usage:
+    python benchmarks/import_time.py [--runs 10] [--budget-ms 200]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules that must only load on code paths that build frames or write files.
+HEAVY_MODULES = ["geopandas", "pandas", "shapely", "fiona", "pyogrio", "pyproj", "tqdm"]
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import ezesri.cli
+elapsed = time.perf_counter() - t
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import(runs: int = 10) -> dict:
+    """
+    Imports `ezesri.cli` in fresh interpreters and reports timings.
+
+    Returns:
+        A dict with the median and best import time in milliseconds, and the
+        heavy modules (if any) that were loaded as a side effect.
+    """
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        timings.append(result["seconds"] * 1000)
+        loaded.update(m for m in HEAVY_MODULES if m in result["modules"])
+    return {
+        "median_ms": statistics.median(timings),
+        "best_ms": min(timings),
+        "heavy_modules_loaded": sorted(loaded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    result = measure_import(args.runs)
+    print(f"import ezesri.cli: median {result['median_ms']:.1f} ms, best {result['best_ms']:.1f} ms")
+    if result["heavy_modules_loaded"]:
+        print(f"Heavy modules loaded at import: {result['heavy_modules_loaded']}")
+        sys.exit(1)
+    if result["median_ms"] > args.budget_ms:
+        print(f"Import time exceeds budget of {args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
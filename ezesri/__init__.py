@@ -1,17 +1,37 @@
 from .extract import (
     get_metadata,
     extract_layer,
+    extract_related,
+    FeatureStream,
     bulk_export,
+    export_partitioned,
     summarize_metadata,
+    cache_service_metadata,
+    clear_metadata_cache,
     EsriLayerError,
     DEFAULT_MAX_BATCH_SIZE,
 )
+from .profiling import Profiler, profile
+from .retry import RetryPolicy, CircuitOpenError
+from .store import LayerStore
+from .utils import set_retry_policy
 
 __all__ = [
     'get_metadata',
     'extract_layer',
+    'extract_related',
+    'FeatureStream',
     'bulk_export',
+    'export_partitioned',
     'summarize_metadata',
+    'cache_service_metadata',
+    'clear_metadata_cache',
     'EsriLayerError',
     'DEFAULT_MAX_BATCH_SIZE',
+    'RetryPolicy',
+    'CircuitOpenError',
+    'set_retry_policy',
+    'Profiler',
+    'profile',
+    'LayerStore',
 ] 
\ No newline at end of file
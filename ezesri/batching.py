@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from typing import Optional
+from urllib.parse import urlparse
+
+from .utils import get_cache_dir
+
+_LEARNED_SIZES_FILE = "batch_sizes.json"
+_learned_sizes_lock = threading.Lock()
+
+
+class BatchSizeController:
+    """
+    Additive-increase / multiplicative-decrease (AIMD) controller for feature batch sizes.
+
+    The batch size halves when a request fails, or when a response is slower or
+    larger than the configured target, and grows by a fixed step after several
+    consecutive successful full-size batches, up to ``max_size``.
+    """
+
+    def __init__(
+        self,
+        initial_size: int,
+        max_size: Optional[int] = None,
+        min_size: int = 1,
+        target_seconds: Optional[float] = None,
+        target_bytes: Optional[int] = None,
+        increase_after: int = 3,
+        increase_step: Optional[int] = None,
+    ):
+        self.min_size = max(1, min_size)
+        self.size = max(self.min_size, int(initial_size))
+        self.max_size = max(self.size, int(max_size or self.size))
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.increase_after = max(1, increase_after)
+        self.increase_step = increase_step or max(1, self.size // 4)
+        self._successes = 0
+
+    def record_failure(self, attempted_size: int) -> int:
+        """Halves the batch size after a failed request. Returns the new size."""
+        self._decrease(attempted_size)
+        return self.size
+
+    def record_success(self, attempted_size: int, elapsed: float, nbytes: Optional[int] = None) -> int:
+        """
+        Records a successful batch and adjusts the size. Returns the new size.
+
+        A response over the latency or payload target counts as congestion and
+        shrinks the batch even though its features are kept.
+        """
+        too_slow = self.target_seconds is not None and elapsed > self.target_seconds
+        too_large = self.target_bytes is not None and nbytes is not None and nbytes > self.target_bytes
+        if too_slow or too_large:
+            self._decrease(attempted_size)
+            return self.size
+
+        # Only full-size batches are evidence that a bigger batch would work.
+        if attempted_size < self.size:
+            return self.size
+        self._successes += 1
+        if self._successes >= self.increase_after and self.size < self.max_size:
+            self.size = min(self.max_size, self.size + self.increase_step)
+            self._successes = 0
+        return self.size
+
+    def _decrease(self, attempted_size: int):
+        self.size = max(self.min_size, min(self.size, attempted_size // 2))
+        self._successes = 0
+
+
+def _host_key(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def _learned_sizes_path() -> str:
+    return os.path.join(get_cache_dir(), _LEARNED_SIZES_FILE)
+
+
+def _read_learned_sizes() -> dict:
+    try:
+        with open(_learned_sizes_path(), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def load_learned_batch_size(url: str) -> Optional[int]:
+    """Returns the batch size learned for this URL's host on a previous run, if any."""
+    with _learned_sizes_lock:
+        size = _read_learned_sizes().get(_host_key(url))
+    return int(size) if isinstance(size, int) and size > 0 else None
+
+
+def save_learned_batch_size(url: str, size: int):
+    """Persists the batch size the controller settled on for this URL's host."""
+    host = _host_key(url)
+    if not host or size < 1:
+        return
+    path = _learned_sizes_path()
+    with _learned_sizes_lock:
+        sizes = _read_learned_sizes()
+        if sizes.get(host) == size:
+            return
+        sizes[host] = int(size)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sizes, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not save learned batch size to {path}: {e}")
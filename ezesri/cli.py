@@ -1,9 +1,12 @@
 import click
 import json
-from . import get_metadata, extract_layer, bulk_export, summarize_metadata, EsriLayerError
-import geopandas as gpd
+from . import get_metadata, extract_layer, bulk_export, export_partitioned, summarize_metadata, EsriLayerError
 import warnings
-from .utils import truncate_field_names, has_filegdb_write_support, drop_empty_geometries, unique_geometry_types, write_ndjson
+from .partition import PARTITIONS
+from .profiling import Profiler, add_listener, remove_listener, timed
+from .retry import RetryPolicy
+from .spill import DEFAULT_SPILL_MEMORY_MB
+from .utils import set_retry_policy, truncate_field_names, has_filegdb_write_support, drop_empty_geometries, unique_geometry_types, write_ndjson
 import os
 
 @click.group()
@@ -11,16 +14,57 @@ def cli():
     """A command-line interface for extracting data from Esri REST endpoints."""
     pass
 
+def retry_options(f):
+    """Adds --retries and --retry-backoff options to a command."""
+    f = click.option('--retry-backoff', type=float, default=None, help="Base delay in seconds for exponential retry backoff (default: 1).")(f)
+    f = click.option('--retries', type=int, default=None, help="Attempts per request, including the first (default: 3).")(f)
+    return f
+
+def apply_retry_options(retries, retry_backoff):
+    """Installs a process-wide RetryPolicy when retry options were given."""
+    if retries is None and retry_backoff is None:
+        return
+    if retries is not None and retries < 1:
+        raise click.UsageError("--retries must be at least 1.")
+    set_retry_policy(RetryPolicy(
+        max_attempts=retries if retries is not None else 3,
+        backoff_base=retry_backoff if retry_backoff is not None else 1.0,
+    ))
+
+def start_profiling(print_report, trace_path):
+    """
+    Records instrumentation for the rest of the command. When the command
+    finishes, prints a per-phase breakdown to stderr and/or writes a JSON trace.
+    """
+    if not (print_report or trace_path):
+        return
+    profiler = Profiler()
+    add_listener(profiler)
+
+    def finish():
+        remove_listener(profiler)
+        profiler.stop()
+        if print_report:
+            click.echo("\nProfile:", err=True)
+            click.echo(profiler.report(), err=True)
+        if trace_path:
+            profiler.write_trace(trace_path)
+            click.echo(f"Profile trace written to {trace_path}", err=True)
+
+    click.get_current_context().call_on_close(finish)
+
 @cli.command()
 @click.argument('url')
 @click.option('--json', 'as_json', is_flag=True, help="Output the raw JSON metadata.")
-def metadata(url, as_json):
+@retry_options
+def metadata(url, as_json, retries, retry_backoff):
     """
     Fetches and prints the metadata for a given Esri layer URL.
 
     By default, it displays a summarized, human-readable output.
     Use the --json flag to get the raw JSON.
     """
+    apply_retry_options(retries, retry_backoff)
     click.echo("Fetching metadata...")
     data = get_metadata(url)
     
@@ -52,11 +96,25 @@ def metadata(url, as_json):
 @click.option('--bbox', help="Bounding box filter in 'xmin,ymin,xmax,ymax' format.")
 @click.option('--geometry', help="Path to a GeoJSON file or a raw GeoJSON string for spatial filtering.")
 @click.option('--spatial-rel', '--srs', default='esriSpatialRelIntersects', type=click.Choice(['esriSpatialRelIntersects', 'esriSpatialRelContains', 'esriSpatialRelWithin']), help="Spatial relationship for filtering.")
-@click.option('--batch-size', type=int, default=None, help="Features per request (default: min of server maxRecordCount and 1000).")
-def fetch(url, out, format, where, bbox, geometry, spatial_rel, batch_size):
+@click.option('--batch-size', type=int, default=None, help="Starting features per request (default: size learned for this host, else min of server maxRecordCount and 1000).")
+@click.option('--target-batch-seconds', type=float, default=None, help="Shrink the batch size when a request takes longer than this many seconds.")
+@click.option('--target-batch-bytes', type=int, default=None, help="Shrink the batch size when a response is larger than this many bytes.")
+@click.option('--workers', type=int, default=1, show_default=True, help="Number of feature batches to request concurrently.")
+@click.option('--hedge', type=click.Choice(['duplicate', 'split']), default=None, help="Send a backup request for batches slower than the p95 latency seen so far.")
+@click.option('--spill', is_flag=True, help="Spill downloaded batches to a temporary Parquet file instead of holding them in memory (requires pyarrow).")
+@click.option('--spill-memory-mb', type=float, default=DEFAULT_SPILL_MEMORY_MB, show_default=True, help="With --spill, MB of downloaded data to buffer before writing to disk.")
+@click.option('--cache', 'use_cache', is_flag=True, help="Reuse the last extraction of this layer and query from the local layer store if the layer has not been edited since (requires pyarrow).")
+@click.option('--partition', type=click.Choice(PARTITIONS), default=None, help="Split the query into time windows of this size and fetch them in parallel.")
+@click.option('--time-field', default=None, help="With --partition, the date field to split on (default: the layer's timeInfo start field).")
+@click.option('--profile', 'profile_report', is_flag=True, help="Print a per-phase timing breakdown (network, JSON decode, frame, write) when done.")
+@click.option('--profile-out', type=click.Path(dir_okay=False), default=None, help="Write a JSON trace of timings and counters to this path.")
+@retry_options
+def fetch(url, out, format, where, bbox, geometry, spatial_rel, batch_size, target_batch_seconds, target_batch_bytes, workers, hedge, spill, spill_memory_mb, use_cache, partition, time_field, profile_report, profile_out, retries, retry_backoff):
     """
     Extracts a layer and saves it to a file or prints it to the console.
     """
+    apply_retry_options(retries, retry_backoff)
+    start_profiling(profile_report, profile_out)
     normalized_url = url.strip().rstrip('/')
     if normalized_url.lower().endswith(('/mapserver', '/featureserver')):
         click.echo(
@@ -72,6 +130,12 @@ def fetch(url, out, format, where, bbox, geometry, spatial_rel, batch_size):
     if bbox and geometry:
         raise click.UsageError("Cannot use both --bbox and --geometry at the same time.")
 
+    if workers < 1:
+        raise click.UsageError("--workers must be at least 1.")
+
+    if time_field and not partition:
+        raise click.UsageError("The --time-field option requires --partition.")
+
     bbox_tuple = None
     if bbox:
         try:
@@ -103,110 +167,160 @@ def fetch(url, out, format, where, bbox, geometry, spatial_rel, batch_size):
             geometry=geometry_filter,
             spatial_rel=spatial_rel,
             batch_size=batch_size,
+            target_batch_seconds=target_batch_seconds,
+            target_batch_bytes=target_batch_bytes,
+            hedge=hedge,
+            spill=spill,
+            spill_memory_mb=spill_memory_mb,
+            cache=use_cache,
+            time_field=time_field,
+            partition=partition,
+            workers=workers,
         )
     except EsriLayerError as e:
         raise click.ClickException(str(e))
+    except ValueError as e:
+        if partition:
+            raise click.UsageError(str(e))
+        raise click.UsageError(f"Invalid geometry filter: {e}")
 
     if gdf.empty:
         click.echo("Could not extract layer or layer is empty.", err=True)
         return
 
+    import geopandas as gpd
+
     is_spatial = isinstance(gdf, gpd.GeoDataFrame)
     if not is_spatial:
         click.echo("Note: This layer is non-spatial and contains no geometry.")
 
     if out or format in ['ndjson']:
         try:
-            if not is_spatial and format in ['geojson', 'shapefile', 'gdb', 'gpkg', 'geoparquet']:
-                raise click.UsageError(f"Cannot save non-spatial layer as {format}. Try '--format csv'.")
-
-            if format == 'geojson':
-                gdf.to_file(out, driver='GeoJSON')
-                click.echo(f"Successfully saved layer to {out}")
-            elif format == 'shapefile':
-                # Use the 'fiona' engine to avoid warnings about truncated field names.
-                gdf.to_file(out, engine='fiona')
-                click.echo(f"Successfully saved shapefile to {out}")
-            elif format == 'csv':
-                # For CSV, we drop the geometry if it exists.
-                df_to_save = gdf.drop(columns='geometry', errors='ignore')
-                df_to_save.to_csv(out, index=False)
-                click.echo(f"Successfully saved CSV to {out} (geometry column was dropped).")
-            elif format == 'parquet':
-                # Write non-spatial parquet (drop geometry if present)
-                df_to_save = gdf.drop(columns='geometry', errors='ignore')
-                try:
-                    df_to_save.to_parquet(out)
-                except Exception as e:
-                    raise click.UsageError(f"Writing Parquet requires pyarrow or fastparquet. Error: {e}")
-                click.echo(f"Successfully saved Parquet to {out}")
-            elif format == 'geoparquet':
-                if not is_spatial:
-                    raise click.UsageError("GeoParquet requires spatial data. Use '--format parquet' for tables.")
-                cleaned_gdf, dropped = drop_empty_geometries(gdf)
-                if dropped:
-                    click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
-                try:
-                    cleaned_gdf.to_parquet(out)
-                except Exception as e:
-                    raise click.UsageError(f"Writing GeoParquet requires geopandas with pyarrow. Error: {e}")
-                click.echo(f"Successfully saved GeoParquet to {out}")
-            elif format == 'ndjson':
-                # Allow stdout when out is not provided or '-'
-                target = out or "-"
-                cleaned_df, dropped = (drop_empty_geometries(gdf) if is_spatial else (gdf, 0))
-                if dropped:
-                    click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
-                write_ndjson(cleaned_df, target)
-                if target != "-":
-                    click.echo(f"Successfully saved NDJSON to {target}")
-            elif format == 'gpkg':
-                if not out.lower().endswith('.gpkg'):
-                    raise click.UsageError("Output for GPKG format must be a path ending in .gpkg")
-                layer_name = os.path.splitext(os.path.basename(out))[0]
-                cleaned_gdf, dropped = drop_empty_geometries(gdf)
-                if dropped:
-                    click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
-                cleaned_gdf.to_file(out, driver='GPKG', layer=layer_name)
-                click.echo(f"Successfully saved layer '{layer_name}' to {out}")
-            elif format == 'gdb':
-                # Assumes the output path 'out' ends with .gdb
-                if not out.lower().endswith('.gdb'):
-                    raise click.UsageError("Output for GDB format must be a path ending in .gdb")
-                supported, msg = has_filegdb_write_support()
-                if not supported:
-                    raise click.UsageError(msg + " Tip: Use '--format gpkg' with a .gpkg output path for a similar container.")
-                # Clean null/empty geometries to avoid common driver errors
-                cleaned_gdf, dropped = drop_empty_geometries(gdf)
-                if dropped:
-                    click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
-                # Enforce consistent geometry types (FileGDB often fails on mixed types)
-                geom_types = unique_geometry_types(cleaned_gdf)
-                if len(geom_types) > 1:
-                    raise click.UsageError(
-                        f"Mixed geometry types detected: {geom_types}. FileGDB writes generally require a single "
-                        "geometry type per layer. Consider filtering or converting geometries, or use GeoPackage/GeoJSON."
-                    )
-                # Layer name is inferred from the output file name, without extension
-                layer_name = os.path.splitext(os.path.basename(out))[0]
-                cleaned_gdf.to_file(out, driver='FileGDB', layer=layer_name)
-                click.echo(f"Successfully saved layer '{layer_name}' to {out}")
+            with timed(f'write:{format}'):
+                if not is_spatial and format in ['geojson', 'shapefile', 'gdb', 'gpkg', 'geoparquet']:
+                    raise click.UsageError(f"Cannot save non-spatial layer as {format}. Try '--format csv'.")
+
+                if format == 'geojson':
+                    gdf.to_file(out, driver='GeoJSON')
+                    click.echo(f"Successfully saved layer to {out}")
+                elif format == 'shapefile':
+                    # Use the 'fiona' engine to avoid warnings about truncated field names.
+                    gdf.to_file(out, engine='fiona')
+                    click.echo(f"Successfully saved shapefile to {out}")
+                elif format == 'csv':
+                    # For CSV, we drop the geometry if it exists.
+                    df_to_save = gdf.drop(columns='geometry', errors='ignore')
+                    df_to_save.to_csv(out, index=False)
+                    click.echo(f"Successfully saved CSV to {out} (geometry column was dropped).")
+                elif format == 'parquet':
+                    # Write non-spatial parquet (drop geometry if present)
+                    df_to_save = gdf.drop(columns='geometry', errors='ignore')
+                    try:
+                        df_to_save.to_parquet(out)
+                    except Exception as e:
+                        raise click.UsageError(f"Writing Parquet requires pyarrow or fastparquet. Error: {e}")
+                    click.echo(f"Successfully saved Parquet to {out}")
+                elif format == 'geoparquet':
+                    if not is_spatial:
+                        raise click.UsageError("GeoParquet requires spatial data. Use '--format parquet' for tables.")
+                    cleaned_gdf, dropped = drop_empty_geometries(gdf)
+                    if dropped:
+                        click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
+                    try:
+                        cleaned_gdf.to_parquet(out)
+                    except Exception as e:
+                        raise click.UsageError(f"Writing GeoParquet requires geopandas with pyarrow. Error: {e}")
+                    click.echo(f"Successfully saved GeoParquet to {out}")
+                elif format == 'ndjson':
+                    # Allow stdout when out is not provided or '-'
+                    target = out or "-"
+                    cleaned_df, dropped = (drop_empty_geometries(gdf) if is_spatial else (gdf, 0))
+                    if dropped:
+                        click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
+                    write_ndjson(cleaned_df, target)
+                    if target != "-":
+                        click.echo(f"Successfully saved NDJSON to {target}")
+                elif format == 'gpkg':
+                    if not out.lower().endswith('.gpkg'):
+                        raise click.UsageError("Output for GPKG format must be a path ending in .gpkg")
+                    layer_name = os.path.splitext(os.path.basename(out))[0]
+                    cleaned_gdf, dropped = drop_empty_geometries(gdf)
+                    if dropped:
+                        click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
+                    cleaned_gdf.to_file(out, driver='GPKG', layer=layer_name)
+                    click.echo(f"Successfully saved layer '{layer_name}' to {out}")
+                elif format == 'gdb':
+                    # Assumes the output path 'out' ends with .gdb
+                    if not out.lower().endswith('.gdb'):
+                        raise click.UsageError("Output for GDB format must be a path ending in .gdb")
+                    supported, msg = has_filegdb_write_support()
+                    if not supported:
+                        raise click.UsageError(msg + " Tip: Use '--format gpkg' with a .gpkg output path for a similar container.")
+                    # Clean null/empty geometries to avoid common driver errors
+                    cleaned_gdf, dropped = drop_empty_geometries(gdf)
+                    if dropped:
+                        click.echo(f"Warning: Dropped {dropped} features with null/empty geometry before writing.")
+                    # Enforce consistent geometry types (FileGDB often fails on mixed types)
+                    geom_types = unique_geometry_types(cleaned_gdf)
+                    if len(geom_types) > 1:
+                        raise click.UsageError(
+                            f"Mixed geometry types detected: {geom_types}. FileGDB writes generally require a single "
+                            "geometry type per layer. Consider filtering or converting geometries, or use GeoPackage/GeoJSON."
+                        )
+                    # Layer name is inferred from the output file name, without extension
+                    layer_name = os.path.splitext(os.path.basename(out))[0]
+                    cleaned_gdf.to_file(out, driver='FileGDB', layer=layer_name)
+                    click.echo(f"Successfully saved layer '{layer_name}' to {out}")
         except Exception as e:
             click.echo(f"Error saving file: {e}", err=True)
     else:
         # Default behavior: print to console
         click.echo(gdf.to_string())
 
+@cli.command('fetch-partitioned')
+@click.argument('url')
+@click.argument('output-dir')
+@click.option('--partition', type=click.Choice(PARTITIONS), default='month', show_default=True, help="Size of the time windows; each becomes one <partition>=<label> directory.")
+@click.option('--time-field', default=None, help="The date field to split on (default: the layer's timeInfo start field).")
+@click.option('--where', '-w', default='1=1', help="SQL WHERE clause applied to every window.")
+@click.option('--workers', type=int, default=4, show_default=True, help="Number of windows to fetch in parallel.")
+@click.option('--incremental', is_flag=True, help="Only refetch the latest existing window and anything newer.")
+@retry_options
+def fetch_partitioned(url, output_dir, partition, time_field, where, workers, incremental, retries, retry_backoff):
+    """
+    Extracts a time-enabled layer into Parquet files partitioned by time window.
+    """
+    apply_retry_options(retries, retry_backoff)
+    if workers < 1:
+        raise click.UsageError("--workers must be at least 1.")
+    try:
+        paths = export_partitioned(
+            url, output_dir, time_field=time_field, partition=partition,
+            where=where, workers=workers, incremental=incremental,
+        )
+    except EsriLayerError as e:
+        raise click.ClickException(str(e))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Wrote {len(paths)} partition files to {output_dir}")
+
 @cli.command('bulk-fetch')
 @click.argument('url')
 @click.argument('output-dir')
 @click.option('--format', '-f', '--fmt', type=click.Choice(['geojson', 'shapefile', 'csv', 'gdb', 'gpkg', 'geoparquet', 'parquet', 'ndjson'], case_sensitive=False), default='geojson', help="Output format for all layers.")
 @click.option('--workers', '-w', type=int, default=1, help="Number of parallel workers to export layers.")
 @click.option('--rate', type=float, default=0.0, help="Global max requests per second (0 to disable).")
-def bulk_fetch(url, output_dir, format, workers, rate):
+@click.option('--metrics-port', type=int, default=None, help="Serve Prometheus metrics on this local port while the export runs.")
+@retry_options
+def bulk_fetch(url, output_dir, format, workers, rate, metrics_port, retries, retry_backoff):
     """
     Fetches all layers from a service and saves them to a directory.
     """
+    apply_retry_options(retries, retry_backoff)
+    if metrics_port is not None:
+        from .metrics import serve_prometheus
+        serve_prometheus(port=metrics_port)
+        click.echo(f"Serving Prometheus metrics at http://127.0.0.1:{metrics_port}/metrics")
     click.echo(f"Starting bulk export from {url} to {output_dir}...")
     if workers > 1:
         click.echo(f"Using {workers} workers...")
@@ -1,17 +1,47 @@
-import geopandas as gpd
-import pandas as pd
 import os
-from typing import Optional, Union
+import time
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Union
+from .batching import BatchSizeController, load_learned_batch_size, save_learned_batch_size
+from .geometry import SpatialFilterPlan, plan_spatial_filter
+from .hedging import Hedger
+from .partition import (
+    NULL_LABEL,
+    from_epoch_ms,
+    null_window,
+    time_extent_statistics_params,
+    time_field_from_metadata,
+    time_windows,
+)
+from .profiling import count, timed
+from .spill import DEFAULT_SPILL_MEMORY_MB, FeatureSpiller
+from .store import LayerStore, default_layer_store, store_key
 from .utils import make_request, has_filegdb_write_support, drop_empty_geometries, unique_geometry_types, write_ndjson, set_rate_limit
 import requests
-from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 
+# geopandas, pandas and tqdm are imported inside the functions that need them
+# so that `import ezesri` (and CLI commands like `metadata`) start quickly.
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+
 # Cap per-request feature batches. Servers often advertise a high
 # maxRecordCount they cannot actually serialize with full geometry.
 DEFAULT_MAX_BATCH_SIZE = 1000
 
+# Concurrent requests used to fetch object ID pages past the first one.
+ID_PAGE_WORKERS = 4
+
+# In-process cache of layer metadata keyed by layer URL. Filled explicitly by
+# cache_service_metadata() and consulted by extract_layer(), so a bulk export
+# fetches every layer definition in one request instead of one per layer.
+_metadata_cache = {}
+_metadata_cache_lock = threading.Lock()
+
 
 class EsriLayerError(Exception):
     """Raised when an Esri layer metadata or query response contains an error."""
@@ -59,6 +89,91 @@ def get_metadata(url: str) -> dict:
         print(f"An error occurred: {e}")
         return {}
 
+def _normalize_url(url: str) -> str:
+    return url.strip().rstrip('/')
+
+
+def cache_service_metadata(service_url: str) -> int:
+    """
+    Fetches every layer and table definition of a service in one request and caches them.
+
+    Uses the service's ``/layers`` endpoint, which returns full definitions
+    (fields, geometry type, maxRecordCount, ...) for all layers and tables.
+    Subsequent extract_layer() calls on those layers reuse the cached metadata
+    until clear_metadata_cache() is called.
+
+    Args:
+        service_url: The base URL of a MapServer or FeatureServer.
+
+    Returns:
+        The number of layer definitions cached. 0 if the service does not
+        support ``/layers`` or the request failed.
+    """
+    service_url = _normalize_url(service_url)
+    try:
+        response = make_request(f"{service_url}/layers", params={'f': 'json'})
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Could not fetch layer definitions from {service_url}/layers: {e}")
+        return 0
+
+    if not isinstance(data, dict) or 'error' in data:
+        return 0
+
+    definitions = (data.get('layers') or []) + (data.get('tables') or [])
+    cached = 0
+    with _metadata_cache_lock:
+        for definition in definitions:
+            if not isinstance(definition, dict) or definition.get('id') is None:
+                continue
+            _metadata_cache[f"{service_url}/{definition['id']}"] = definition
+            cached += 1
+    return cached
+
+
+def clear_metadata_cache(url: Optional[str] = None):
+    """
+    Invalidates cached layer metadata.
+
+    Args:
+        url: A layer URL to drop a single entry, or a service URL to drop all
+            of its layers. If omitted, the whole cache is cleared.
+    """
+    with _metadata_cache_lock:
+        if url is None:
+            _metadata_cache.clear()
+            return
+        url = _normalize_url(url)
+        for key in list(_metadata_cache):
+            if key == url or key.startswith(f"{url}/"):
+                del _metadata_cache[key]
+
+
+def _get_layer_metadata(url: str) -> dict:
+    """Return cached layer metadata when available, otherwise fetch it."""
+    with _metadata_cache_lock:
+        cached = _metadata_cache.get(_normalize_url(url))
+    if cached is not None:
+        return cached
+    return get_metadata(url)
+
+
+@contextmanager
+def _pinned_metadata(url: str, metadata: dict):
+    """Serves ``metadata`` from the cache for ``url`` within the block, unless already cached."""
+    key = _normalize_url(url)
+    with _metadata_cache_lock:
+        pinned = key not in _metadata_cache
+        if pinned:
+            _metadata_cache[key] = metadata
+    try:
+        yield
+    finally:
+        if pinned:
+            with _metadata_cache_lock:
+                _metadata_cache.pop(key, None)
+
+
 def summarize_metadata(metadata: dict) -> str:
     """
     Creates a human-readable summary from a metadata dictionary.
@@ -98,67 +213,143 @@ def summarize_metadata(metadata: dict) -> str:
             
     return "\n".join(summary)
 
-def _fetch_all_object_ids(url: str, query_params: dict, oid_field: str = 'OBJECTID') -> list:
+def _compact_ids(ids: list):
+    """Packs object IDs into an array of 64-bit integers (8 bytes per ID instead of ~36)."""
+    try:
+        return array('q', ids)
+    except (TypeError, OverflowError):
+        return list(ids)
+
+
+def _query(url: str, params: dict):
+    """
+    Sends a ``/query`` request, as a POST when it carries a filter geometry.
+
+    Filter polygons can URL-encode to tens of KB, past the URL limits of many
+    servers and proxies; smaller queries stay GETs.
+    """
+    if 'geometry' in params:
+        return make_request(f"{url}/query", method='post', data=params)
+    return make_request(f"{url}/query", params=params)
+
+
+def _fetch_object_id_page(url: str, query_params: dict, oid_field: str, offset: int) -> dict:
+    params = dict(query_params)
+    params.update({
+        'f': 'json',
+        'returnIdsOnly': 'true',
+        'orderByFields': f'{oid_field} ASC',
+    })
+    if offset:
+        params['resultOffset'] = offset
+
+    try:
+        r = _query(url, params)
+        with timed('json_decode'):
+            return r.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise EsriLayerError(f"Failed to get object IDs from {url}: {e}") from e
+
+
+def _fetch_compact_id_page(url: str, query_params: dict, oid_field: str, offset: int):
+    """Fetches one page of object IDs and returns ``(compact IDs, exceededTransferLimit)``."""
+    page = _fetch_object_id_page(url, query_params, oid_field, offset)
+    _raise_for_esri_error(page, f"Could not get Object IDs for {url}")
+    return _compact_ids(page.get('objectIds') or []), bool(page.get('exceededTransferLimit'))
+
+
+def _fetch_object_id_count(url: str, query_params: dict) -> Optional[int]:
+    """Returns the number of matching features, or None if the server will not say."""
+    params = dict(query_params)
+    params.pop('returnIdsOnly', None)
+    params.update({'f': 'json', 'returnCountOnly': 'true'})
+    try:
+        r = _query(url, params)
+        with timed('json_decode'):
+            data = r.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    total = data.get('count') if isinstance(data, dict) else None
+    return total if isinstance(total, int) and total >= 0 else None
+
+
+def _fetch_all_object_ids(url: str, query_params: dict, oid_field: str = 'OBJECTID'):
     """Fetch all matching object IDs, paging past ArcGIS transfer limits.
 
     Hosted Feature Services often cap a single ``returnIdsOnly`` response at
     1,000,000 IDs and set ``exceededTransferLimit``. Subsequent pages use
     ``resultOffset`` with a stable ``orderByFields`` so IDs are not skipped or
-    duplicated.
-    """
-    all_ids = []
-    offset = 0
+    duplicated. When the first page is truncated, the total is read with
+    ``returnCountOnly`` and the remaining pages are fetched concurrently and
+    merged in offset order.
 
-    while True:
-        params = dict(query_params)
-        params.update({
-            'f': 'json',
-            'returnIdsOnly': 'true',
-            'orderByFields': f'{oid_field} ASC',
-        })
-        if offset:
-            params['resultOffset'] = offset
+    Returns the IDs as a compact ``array('q')`` (a list if the IDs are not
+    integers).
+    """
+    data = _fetch_object_id_page(url, query_params, oid_field, 0)
 
+    if 'error' in data:
+        # Some older services reject orderByFields / resultOffset on
+        # returnIdsOnly. Retry once without them.
         try:
-            r = make_request(f"{url}/query", params=params)
+            r = _query(url, query_params)
             data = r.json()
         except (requests.exceptions.RequestException, ValueError) as e:
             raise EsriLayerError(f"Failed to get object IDs from {url}: {e}") from e
-
         if 'error' in data:
-            # Some older services reject orderByFields / resultOffset on
-            # returnIdsOnly. Retry once without them when still on page one.
-            if offset == 0 and all_ids == []:
-                try:
-                    r = make_request(f"{url}/query", params=query_params)
-                    data = r.json()
-                except (requests.exceptions.RequestException, ValueError) as e:
-                    raise EsriLayerError(f"Failed to get object IDs from {url}: {e}") from e
-                if 'error' in data:
-                    _raise_for_esri_error(data, f"Could not get Object IDs for {url}")
-                ids = data.get('objectIds') or []
-                if data.get('exceededTransferLimit'):
-                    print(
-                        f"Warning: Object ID query for {url} hit the server transfer "
-                        f"limit ({len(ids)} IDs). This service does not support paging "
-                        "ID queries, so some features may be missing."
-                    )
-                return ids
-
             _raise_for_esri_error(data, f"Could not get Object IDs for {url}")
+        ids = data.get('objectIds') or []
+        if data.get('exceededTransferLimit'):
+            print(
+                f"Warning: Object ID query for {url} hit the server transfer "
+                f"limit ({len(ids)} IDs). This service does not support paging "
+                "ID queries, so some features may be missing."
+            )
+        return _compact_ids(ids)
 
+    all_ids = _compact_ids(data.get('objectIds') or [])
+    if not all_ids or not data.get('exceededTransferLimit'):
+        return all_ids
+
+    # 2. The first page was truncated: fetch the remaining pages in parallel.
+    page_size = len(all_ids)
+    total = _fetch_object_id_count(url, query_params)
+    offset = page_size
+    if total is not None and total > offset:
+        offsets = list(range(offset, total, page_size))
+        print(f"Object ID transfer limit reached; fetching {len(offsets)} more pages of {page_size} IDs in parallel...")
+        exceeded = True
+        with ThreadPoolExecutor(max_workers=min(ID_PAGE_WORKERS, len(offsets))) as executor:
+            # Workers compact their page before returning it, so decoded
+            # JSON pages never pile up while earlier pages are pending.
+            pages = executor.map(
+                lambda page_offset: _fetch_compact_id_page(url, query_params, oid_field, page_offset),
+                offsets,
+            )
+            for ids, exceeded in pages:
+                all_ids.extend(ids)
+                offset += len(ids)
+                # A short page in the middle means the server returned fewer IDs
+                # than expected; later pages would leave a gap, so continue
+                # sequentially from here.
+                if len(ids) < page_size:
+                    break
+        if not exceeded and offset >= total:
+            return all_ids
+
+    # 3. Sequential paging: no usable count, or the parallel pass fell short.
+    while True:
+        print(f"Object ID transfer limit reached; fetching next page at offset {offset}...")
+        data = _fetch_object_id_page(url, query_params, oid_field, offset)
+        _raise_for_esri_error(data, f"Could not get Object IDs for {url}")
         ids = data.get('objectIds') or []
         if not ids:
             break
-
         all_ids.extend(ids)
-
+        offset += len(ids)
         if not data.get('exceededTransferLimit'):
             break
 
-        offset += len(ids)
-        print(f"Object ID transfer limit reached; fetching next page at offset {offset}...")
-
     return all_ids
 
 
@@ -168,8 +359,12 @@ def _query_features_batch(
     where: str,
     has_geometry: bool,
     query_format: str,
+    stats: Optional[dict] = None,
 ) -> list:
-    """Fetch one batch of features by object ID. Raises EsriLayerError on failure."""
+    """Fetch one batch of features by object ID. Raises EsriLayerError on failure.
+
+    When ``stats`` is given, the response size in bytes is stored under ``'bytes'``.
+    """
     params = {
         'f': query_format,
         'where': where,
@@ -181,56 +376,326 @@ def _query_features_batch(
         params['outSR'] = '4326'
 
     try:
-        r = make_request(f"{url}/query", method='post', data=params)
-        features_json = r.json()
+        with timed('batch_query', size=len(object_ids)):
+            r = make_request(f"{url}/query", method='post', data=params)
+            with timed('json_decode'):
+                features_json = r.json()
     except (requests.exceptions.RequestException, ValueError) as e:
         raise EsriLayerError(f"Failed to fetch a batch from {url}: {e}") from e
 
+    if stats is not None:
+        stats['bytes'] = len(r.content or b'')
+
     _raise_for_esri_error(features_json, f"Error fetching batch from {url}")
     return features_json.get('features', [])
 
 
-def _fetch_features_adaptive(
+def _id_query_params(where: str, bbox, has_geometry: bool, spatial_query: Optional[dict] = None) -> dict:
+    """Builds the ``returnIdsOnly`` query for a where clause and optional spatial filter."""
+    params = {
+        'f': 'json',
+        'where': where,
+        'returnIdsOnly': 'true'
+    }
+
+    if bbox is not None and has_geometry:
+        params['geometry'] = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
+        params['geometryType'] = 'esriGeometryEnvelope'
+        params['inSR'] = '4326'  # Assume WGS84 for bbox input
+        params['spatialRel'] = 'esriSpatialRelIntersects'
+    elif spatial_query and has_geometry:
+        params.update(spatial_query)
+    return params
+
+
+def _fetch_filtered_object_ids(
     url: str,
-    object_ids: list,
+    where: str,
+    bbox,
+    plan: Optional[SpatialFilterPlan],
+    has_geometry: bool,
+    oid_field: str,
+):
+    """Fetch the object IDs matching ``where`` and a bbox or spatial filter plan.
+
+    A plan split into several tiles is queried tile by tile in parallel and
+    the IDs are merged without duplicates.
+    """
+    if plan is None or not has_geometry or bbox is not None:
+        return _fetch_all_object_ids(url, _id_query_params(where, bbox, has_geometry), oid_field=oid_field)
+    if len(plan.queries) == 1:
+        return _fetch_all_object_ids(
+            url, _id_query_params(where, None, has_geometry, plan.queries[0]), oid_field=oid_field
+        )
+
+    print(f"Querying the spatial filter as {len(plan.queries)} tiles...")
+    with ThreadPoolExecutor(max_workers=min(ID_PAGE_WORKERS, len(plan.queries))) as executor:
+        pages = list(executor.map(
+            lambda query: _fetch_all_object_ids(
+                url, _id_query_params(where, None, has_geometry, query), oid_field=oid_field
+            ),
+            plan.queries,
+        ))
+    merged = set()
+    for ids in pages:
+        merged.update(ids)
+    return _compact_ids(sorted(merged))
+
+
+def _features_to_frame(features: list, has_geometry: bool) -> Union["gpd.GeoDataFrame", "pd.DataFrame"]:
+    """Builds a GeoDataFrame from GeoJSON features, or a DataFrame from Esri JSON attributes."""
+    import geopandas as gpd
+    import pandas as pd
+
+    if has_geometry:
+        return gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    return pd.DataFrame([f['attributes'] for f in features])
+
+
+def _iter_feature_batches(
+    url: str,
+    object_ids,
     where: str,
     has_geometry: bool,
     query_format: str,
-    batch_size: int,
-) -> list:
-    """Download features in batches, halving batch size when a request fails."""
-    all_features = []
-    batch_size = max(1, batch_size)
-    i = 0
+    controller: BatchSizeController,
+    workers: int = 1,
+    hedger: Optional[Hedger] = None,
+) -> Iterator[tuple]:
+    """Yield ``(features, response_bytes)`` for ``object_ids`` in order, in batches sized by ``controller``.
 
-    with tqdm(total=len(object_ids), desc="Downloading features") as pbar:
-        while i < len(object_ids):
-            size = min(batch_size, len(object_ids) - i)
-            batch = object_ids[i:i + size]
+    Up to ``workers`` batches are in flight at once; each new batch is sized
+    from the controller when it is sent. A failed batch is split at the
+    halved batch size and its pieces are retried before anything after it is
+    yielded. With a hedger, batches that run past the observed tail latency
+    get a backup request.
+    """
+    workers = max(1, workers)
+
+    def query(ids):
+        stats = {}
+        started = time.monotonic()
+        features = (hedger.run if hedger is not None else lambda fn, batch: fn(batch))(
+            lambda batch: _query_features_batch(url, batch, where, has_geometry, query_format, stats=stats), ids
+        )
+        return features, stats.get('bytes'), time.monotonic() - started
+
+    in_flight = deque()
+    position = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def fill():
+            nonlocal position
+            while len(in_flight) < workers and position < len(object_ids):
+                size = min(controller.size, len(object_ids) - position)
+                batch = object_ids[position:position + size]
+                in_flight.append((batch, executor.submit(query, batch)))
+                position += size
+
+        fill()
+        while in_flight:
+            batch, future = in_flight.popleft()
+            size = len(batch)
             try:
-                features = _query_features_batch(
-                    url, batch, where, has_geometry, query_format
-                )
+                features, nbytes, elapsed = future.result()
             except EsriLayerError as e:
                 if size <= 1:
+                    for _, pending in in_flight:
+                        pending.cancel()
                     raise EsriLayerError(
                         f"Failed to fetch features from {url} even with batch size 1: {e}"
                     ) from e
-                new_size = max(1, size // 2)
+                previous_size = controller.size
+                new_size = controller.record_failure(size)
+                count('batch_size_halvings')
+                if new_size != previous_size:
+                    count('batch_size_changes')
                 print(
                     f"Batch of {size} failed ({e}); "
                     f"retrying with batch size {new_size}..."
                 )
-                batch_size = new_size
+                piece = max(1, min(new_size, size // 2))
+                pieces = [batch[i:i + piece] for i in range(0, size, piece)]
+                for retry in reversed(pieces):
+                    in_flight.appendleft((retry, executor.submit(query, retry)))
                 continue
 
-            all_features.extend(features)
-            i += size
-            pbar.update(size)
+            previous_size = controller.size
+            if controller.record_success(size, elapsed, nbytes) != previous_size:
+                count('batch_size_changes')
+            count('features', len(features))
+            fill()
+            yield features, nbytes
+
+
+def _fetch_features_adaptive(
+    url: str,
+    object_ids: list,
+    where: str,
+    has_geometry: bool,
+    query_format: str,
+    batch_size: int,
+    controller: Optional[BatchSizeController] = None,
+    hedger: Optional[Hedger] = None,
+    sink: Optional[Callable[[list, Optional[int]], None]] = None,
+    workers: int = 1,
+) -> list:
+    """Download features in batches sized by an AIMD controller.
+
+    A failed request is retried at half the batch size; after a run of
+    successful full batches the size grows again, up to the controller's
+    ceiling. Without a controller the size never grows past ``batch_size``.
+    With a hedger, batches that run past the observed tail latency get a
+    backup request. With a sink, each batch is passed to
+    ``sink(features, response_bytes)`` instead of being accumulated, and an
+    empty list is returned. ``workers`` batches are requested concurrently.
+    """
+    from tqdm import tqdm
+
+    if controller is None:
+        controller = BatchSizeController(batch_size)
+    all_features = []
+
+    with tqdm(total=len(object_ids), desc="Downloading features") as pbar:
+        for features, nbytes in _iter_feature_batches(
+            url, object_ids, where, has_geometry, query_format, controller, workers=workers, hedger=hedger
+        ):
+            if sink is not None:
+                sink(features, nbytes)
+            else:
+                all_features.extend(features)
+            pbar.update(len(features))
 
     return all_features
 
 
+def _time_extent(url: str, time_field: str, where: str):
+    """
+    The first and last timestamp of ``time_field``, from an outStatistics query.
+
+    ``timeInfo.timeExtent`` is not used: it is often stale on growing layers
+    (and cached metadata keeps it stale longer), and rows outside the windows
+    would be dropped.
+    """
+    try:
+        r = make_request(f"{url}/query", params=time_extent_statistics_params(time_field, where))
+        data = r.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise EsriLayerError(f"Failed to get the time extent of {time_field} from {url}: {e}") from e
+    _raise_for_esri_error(data, f"Could not get the time extent of {time_field} for {url}")
+
+    features = data.get('features') or []
+    attributes = {k.lower(): v for k, v in (features[0].get('attributes') or {}).items()} if features else {}
+    start, end = attributes.get('ezesri_min'), attributes.get('ezesri_max')
+    if start is None or end is None:
+        return None
+    return from_epoch_ms(start), from_epoch_ms(end)
+
+
+def _resolve_time_windows(url: str, metadata: dict, time_field: Optional[str], partition: str, where: str):
+    """
+    Returns ``(time_field, windows)`` for a partitioned extraction.
+
+    The calendar windows cover the time extent; a final null window picks
+    up the rows whose time field is NULL, so no row is left out.
+    """
+    time_field = time_field or time_field_from_metadata(metadata)
+    if not time_field:
+        raise ValueError(
+            f"Layer {url} is not time-enabled (no timeInfo); pass time_field to partition it."
+        )
+    with timed('time_extent'):
+        extent = _time_extent(url, time_field, where)
+    windows = time_windows(extent[0], extent[1], partition) if extent is not None else []
+    return time_field, windows + [null_window()]
+
+
+class FeatureStream:
+    """
+    The raw features of a layer query, downloaded batch by batch without geopandas.
+
+    Metadata and object IDs are fetched when the stream is created, so the
+    total is known (and errors surface) before any features are requested.
+    Iterating yields lists of features in object ID order, as each batch
+    arrives: GeoJSON features for layers with geometry, Esri JSON features
+    (``{'attributes': ...}``) for tables. Batches are requested with the same
+    retries, ID paging and adaptive batch sizing as extract_layer().
+
+    Args:
+        url: The URL of the feature layer or table.
+        where: An optional SQL-like where clause to filter features.
+        bbox: An optional (xmin, ymin, xmax, ymax) bounding box in WGS84.
+        geometry: An optional filter geometry, as for extract_layer(). Filters
+            that need a client-side refinement require shapely.
+        spatial_rel: The spatial relationship to use for filtering.
+        batch_size: Optional starting per-request feature count.
+        workers: How many batches are requested concurrently.
+        object_ids: Download exactly these object IDs instead of querying
+            them, for example one slice of an earlier stream's ``object_ids``
+            processed separately. ``where`` is still applied to each batch.
+        metadata: The layer's metadata, if the caller already has it (from
+            its own cache, say), to skip the metadata request.
+
+    Raises:
+        EsriLayerError: If the layer metadata or object ID query fails, or
+            while iterating, if a batch keeps failing after shrinking to size 1.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        where: str = '1=1',
+        bbox: tuple = None,
+        geometry=None,
+        spatial_rel: str = 'esriSpatialRelIntersects',
+        batch_size: Optional[int] = None,
+        workers: int = 1,
+        object_ids: Optional[list] = None,
+        metadata: Optional[dict] = None,
+    ):
+        self.url = url
+        self.where = where or '1=1'
+        self.workers = max(1, workers)
+
+        if metadata is not None:
+            self.metadata = metadata
+        else:
+            with timed('metadata'):
+                self.metadata = _get_layer_metadata(url)
+        if not self.metadata:
+            raise EsriLayerError(f"Could not fetch layer metadata for {url}")
+        _raise_for_esri_error(self.metadata, f"Esri layer metadata request failed for {url}")
+
+        self.has_geometry = self.metadata.get('geometryType') is not None
+        advertised_max = max(1, int(self.metadata.get('maxRecordCount') or DEFAULT_MAX_BATCH_SIZE))
+        size = max(1, batch_size) if batch_size is not None else min(advertised_max, DEFAULT_MAX_BATCH_SIZE)
+        self.controller = BatchSizeController(size, max_size=advertised_max)
+
+        oid_field = self.metadata.get('objectIdField') or 'OBJECTID'
+        use_plan = geometry and self.has_geometry and bbox is None
+        self.plan = plan_spatial_filter(geometry, spatial_rel) if use_plan else None
+        if object_ids is not None:
+            self.object_ids = _compact_ids(object_ids)
+            return
+        with timed('object_ids'):
+            self.object_ids = _fetch_filtered_object_ids(
+                url, self.where, bbox, self.plan, self.has_geometry, oid_field
+            )
+
+    def __len__(self) -> int:
+        """The number of matching object IDs (before any client-side spatial refinement)."""
+        return len(self.object_ids)
+
+    def __iter__(self) -> Iterator[list]:
+        query_format = 'geojson' if self.has_geometry else 'json'
+        for features, _ in _iter_feature_batches(
+            self.url, self.object_ids, self.where, self.has_geometry, query_format,
+            self.controller, workers=self.workers,
+        ):
+            if self.plan is not None:
+                features = self.plan.refine_features(features)
+            yield features
+
+
 def extract_layer(
     url: str,
     where: str = '1=1',
@@ -238,7 +703,18 @@ def extract_layer(
     geometry: str = None,
     spatial_rel: str = 'esriSpatialRelIntersects',
     batch_size: Optional[int] = None,
-) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    target_batch_seconds: Optional[float] = None,
+    target_batch_bytes: Optional[int] = None,
+    hedge: Optional[str] = None,
+    spill: bool = False,
+    spill_memory_mb: float = DEFAULT_SPILL_MEMORY_MB,
+    spill_dir: Optional[str] = None,
+    cache: Union[bool, LayerStore] = False,
+    time_field: Optional[str] = None,
+    partition: Optional[str] = None,
+    partition_workers: int = 4,
+    workers: int = 1,
+) -> Union["gpd.GeoDataFrame", "pd.DataFrame"]:
     """
     Extracts a feature layer or table into a GeoDataFrame or DataFrame.
 
@@ -249,10 +725,49 @@ def extract_layer(
         url: The URL of the feature layer or table.
         where: An optional SQL-like where clause to filter features.
         bbox: An optional tuple defining a bounding box (xmin, ymin, xmax, ymax) to filter by.
-        geometry: An optional GeoJSON string or dictionary representing a geometry to filter by.
+        geometry: An optional geometry to filter by: a GeoJSON geometry, Feature or
+            FeatureCollection (dict or string) of any type, a shapely geometry, or an
+            Esri JSON geometry. GeoJSON is converted to Esri JSON. Filters with more
+            than 1,000 vertices are sent as a simplified outline that covers them (split
+            into tiles when sparse), and the exact filter is applied to the results.
         spatial_rel: The spatial relationship to use for filtering. Defaults to 'esriSpatialRelIntersects'.
-        batch_size: Optional per-request feature count. Defaults to the lesser of the
-            layer's maxRecordCount and 1000. On failure the batch is halved and retried.
+        batch_size: Optional starting per-request feature count. Defaults to the size
+            learned for this host on a previous run, or else the lesser of the layer's
+            maxRecordCount and 1000. On failure the batch is halved and retried; after
+            consecutive successes it grows again, up to maxRecordCount.
+        target_batch_seconds: Optional response time target. Batches slower than this
+            shrink the batch size.
+        target_batch_bytes: Optional response size target. Batches larger than this
+            shrink the batch size.
+        hedge: Optional hedging mode for slow batches. With 'duplicate', a batch still
+            running after the p95 latency observed so far is requested again; with
+            'split', it is requested again as two halves. The first result wins.
+            Hedges are capped at 10% of requests and respect the global rate limit.
+        spill: Write batches to a temporary Parquet file as they arrive instead of
+            holding every feature in memory, then build the result from that file.
+            Use this for layers whose raw features do not fit in memory. Requires pyarrow.
+        spill_memory_mb: With spill, the approximate amount of downloaded data (in MB
+            of response bodies) buffered before it is written to disk.
+        spill_dir: With spill, the directory for the temporary file. Defaults to the
+            system temporary directory.
+        cache: Keep the result in a local layer store (True for the default store in
+            the ezesri cache directory, or a LayerStore). A later call with the same
+            query is answered from the store, memory-mapped, as long as the layer's
+            editingInfo.lastEditDate and fields are unchanged, at the cost of one
+            metadata request. Layers without a lastEditDate are never cached.
+            Requires pyarrow.
+        time_field: With partition, the date field to split on. Defaults to the
+            layer's timeInfo.startTimeField.
+        partition: Split the query into 'year', 'month', 'week' or 'day' windows on
+            ``time_field`` (UTC) and extract the windows in parallel. Use this for large
+            event layers whose single ID query times out. Rows whose ``time_field``
+            is NULL are fetched as one more window.
+        partition_workers: With partition, how many windows are extracted at once.
+        workers: How many feature batches are requested concurrently. Batches are
+            still assembled in object ID order.
+
+    Layer metadata is read from the in-process cache when the layer's service
+    was loaded with cache_service_metadata(); otherwise it is fetched.
 
     Returns:
         A GeoDataFrame or DataFrame containing the features from the layer.
@@ -260,65 +775,319 @@ def extract_layer(
     Raises:
         EsriLayerError: If the layer metadata or a feature query returns an Esri error,
             or if feature batches keep failing after shrinking to size 1.
+        ValueError: If ``geometry`` cannot be parsed as a filter geometry, or if
+            ``partition`` is unknown or the layer has no time field to split on.
     """
-    metadata = get_metadata(url)
+    import geopandas as gpd
+    import pandas as pd
+
+    with timed('metadata'):
+        metadata = _get_layer_metadata(url)
     if not metadata:
         return gpd.GeoDataFrame()
 
     _raise_for_esri_error(metadata, f"Esri layer metadata request failed for {url}")
 
     where = where or '1=1'
+    if partition:
+        time_field, windows = _resolve_time_windows(url, metadata, time_field, partition, where)
+        print(f"Extracting {len(windows)} {partition} windows on {time_field}...")
+
+        def extract_window(window):
+            return extract_layer(
+                url, where=window.where(time_field, where), bbox=bbox, geometry=geometry,
+                spatial_rel=spatial_rel, batch_size=batch_size,
+                target_batch_seconds=target_batch_seconds, target_batch_bytes=target_batch_bytes,
+                hedge=hedge, spill=spill, spill_memory_mb=spill_memory_mb, spill_dir=spill_dir,
+                cache=cache, workers=workers,
+            )
+
+        with _pinned_metadata(url, metadata), ThreadPoolExecutor(max_workers=max(1, partition_workers)) as executor:
+            frames = [df for df in executor.map(extract_window, windows) if not df.empty]
+        if not frames:
+            return gpd.GeoDataFrame() if metadata.get('geometryType') else pd.DataFrame()
+        with timed('frame'):
+            return pd.concat(frames, ignore_index=True)
+
     has_geometry = metadata.get('geometryType') is not None
-    advertised_max = metadata.get('maxRecordCount') or DEFAULT_MAX_BATCH_SIZE
+    advertised_max = max(1, int(metadata.get('maxRecordCount') or DEFAULT_MAX_BATCH_SIZE))
+    learned_size = load_learned_batch_size(url) if batch_size is None else None
     if batch_size is not None:
         max_record_count = max(1, batch_size)
+    elif learned_size is not None:
+        max_record_count = min(learned_size, advertised_max)
     else:
-        max_record_count = max(1, min(int(advertised_max), DEFAULT_MAX_BATCH_SIZE))
+        max_record_count = min(advertised_max, DEFAULT_MAX_BATCH_SIZE)
     oid_field = metadata.get('objectIdField') or 'OBJECTID'
 
-    # 1. Get Object IDs (paged when the server hits its transfer limit)
-    params = {
-        'f': 'json',
-        'where': where,
-        'returnIdsOnly': 'true'
-    }
+    store_entry = None
+    if cache:
+        store = cache if isinstance(cache, LayerStore) else default_layer_store()
+        key = store_key(url, metadata, where=where, bbox=bbox, geometry=geometry, spatial_rel=spatial_rel)
+        if key is not None:
+            with timed('store_read'):
+                cached = store.get(key)
+            if cached is not None:
+                count('store_hits')
+                return cached
+            store_entry = (store, key)
 
-    if bbox is not None and has_geometry:
-        params['geometry'] = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
-        params['geometryType'] = 'esriGeometryEnvelope'
-        params['inSR'] = '4326'  # Assume WGS84 for bbox input
-        params['spatialRel'] = 'esriSpatialRelIntersects'
-    elif geometry and has_geometry:
-        params['geometry'] = geometry
-        params['geometryType'] = 'esriGeometryPolygon'  # Assumes polygon, could be expanded
-        params['inSR'] = '4326'
-        params['spatialRel'] = spatial_rel
+    # 1. Get Object IDs (paged when the server hits its transfer limit)
+    plan = plan_spatial_filter(geometry, spatial_rel) if geometry and has_geometry and bbox is None else None
 
-    object_ids = _fetch_all_object_ids(url, params, oid_field=oid_field)
+    with timed('object_ids'):
+        object_ids = _fetch_filtered_object_ids(url, where, bbox, plan, has_geometry, oid_field)
 
     if not object_ids:
         return gpd.GeoDataFrame() if has_geometry else pd.DataFrame()
 
     # 2. Fetch features in adaptive batches
     query_format = 'geojson' if has_geometry else 'json'
-    all_features = _fetch_features_adaptive(
-        url,
-        object_ids,
-        where=where,
-        has_geometry=has_geometry,
-        query_format=query_format,
-        batch_size=max_record_count,
+    controller = BatchSizeController(
+        max_record_count,
+        max_size=advertised_max,
+        target_seconds=target_batch_seconds,
+        target_bytes=target_batch_bytes,
     )
+    spiller = None
+    if spill:
+        spiller = FeatureSpiller(
+            has_geometry,
+            fields=metadata.get('fields'),
+            memory_limit_bytes=int(spill_memory_mb * 1024 * 1024),
+            directory=spill_dir,
+        )
+    hedger = Hedger(mode=hedge, max_workers=4 * max(1, workers)) if hedge else None
+    try:
+        all_features = _fetch_features_adaptive(
+            url,
+            object_ids,
+            where=where,
+            has_geometry=has_geometry,
+            query_format=query_format,
+            batch_size=max_record_count,
+            controller=controller,
+            hedger=hedger,
+            sink=spiller.add if spiller is not None else None,
+            workers=workers,
+        )
+        if batch_size is None:
+            # An explicit batch_size is a one-off choice, not something learned
+            save_learned_batch_size(url, controller.size)
+        if spiller is not None:
+            with timed('frame'):
+                result = spiller.to_frame()
+    finally:
+        if hedger is not None:
+            hedger.close()
+        if spiller is not None:
+            spiller.close()
 
     # 3. Create DataFrame or GeoDataFrame
-    if not all_features:
-        return gpd.GeoDataFrame() if has_geometry else pd.DataFrame()
-        
-    if has_geometry:
-        return gpd.GeoDataFrame.from_features(all_features, crs="EPSG:4326")
+    if spiller is None:
+        if not all_features:
+            return gpd.GeoDataFrame() if has_geometry else pd.DataFrame()
+
+        with timed('frame'):
+            result = _features_to_frame(all_features, has_geometry)
+
+    if plan is not None and plan.refine_geometry is not None:
+        with timed('refine'):
+            result = plan.refine(result)
+
+    if store_entry is not None and not result.empty:
+        with timed('store_write'):
+            store, key = store_entry
+            store.put(key, result)
+    return result
+
+
+def _query_related_batch(url: str, object_ids, relationship_id: int, related_where: Optional[str]) -> dict:
+    """Fetch the related records of one batch of parent object IDs. Raises EsriLayerError on failure."""
+    params = {
+        'f': 'json',
+        'objectIds': ','.join(map(str, object_ids)),
+        'relationshipId': relationship_id,
+        'outFields': '*',
+        'returnGeometry': 'false',
+    }
+    if related_where and related_where != '1=1':
+        params['definitionExpression'] = related_where
+
+    try:
+        with timed('related_query', size=len(object_ids)):
+            r = make_request(f"{url}/queryRelatedRecords", method='post', data=params)
+            with timed('json_decode'):
+                data = r.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise EsriLayerError(f"Failed to fetch related records from {url}: {e}") from e
+
+    _raise_for_esri_error(data, f"Error fetching related records from {url}")
+    return data
+
+
+def _fetch_related_records(
+    url: str,
+    object_ids,
+    relationship_id: int,
+    related_where: Optional[str],
+    batch_size: int,
+    key_column: str,
+) -> "pd.DataFrame":
+    """Download the records related to ``object_ids``, one row per related record.
+
+    Each row carries its parent's object ID in ``key_column``. Batches that
+    fail or hit the server's transfer limit are halved and retried.
+    """
+    import pandas as pd
+
+    controller = BatchSizeController(batch_size)
+    rows = []
+    i = 0
+    while i < len(object_ids):
+        size = min(controller.size, len(object_ids) - i)
+        batch = object_ids[i:i + size]
+        started = time.monotonic()
+        try:
+            data = _query_related_batch(url, batch, relationship_id, related_where)
+        except EsriLayerError as e:
+            if size <= 1:
+                raise
+            controller.record_failure(size)
+            count('batch_size_halvings')
+            print(f"Related records batch of {size} failed ({e}); retrying with batch size {controller.size}...")
+            continue
+
+        if data.get('exceededTransferLimit'):
+            if size > 1:
+                controller.record_failure(size)
+                count('batch_size_halvings')
+                continue
+            print(
+                f"Warning: feature {batch[0]} has more related records than the server "
+                "returns in one response; some related records are missing."
+            )
+
+        controller.record_success(size, time.monotonic() - started)
+        for group in data.get('relatedRecordGroups') or []:
+            parent_id = group.get('objectId')
+            for record in group.get('relatedRecords') or []:
+                row = dict(record.get('attributes') or {})
+                row[key_column] = parent_id
+                rows.append(row)
+        i += size
+
+    return pd.DataFrame(rows, columns=None if rows else [key_column])
+
+
+def extract_related(
+    url: str,
+    relationship_id: int,
+    where: str = '1=1',
+    bbox: tuple = None,
+    geometry: str = None,
+    spatial_rel: str = 'esriSpatialRelIntersects',
+    related_where: Optional[str] = None,
+    join: bool = True,
+    batch_size: Optional[int] = None,
+):
+    """
+    Extracts a layer together with the records related to it through a relationship class.
+
+    The parent features are filtered with ``where``/``bbox``/``geometry`` and only the
+    records related to those parents are downloaded, through the layer's
+    ``queryRelatedRecords`` endpoint in batches of parent object IDs. Parent
+    features and related records are fetched concurrently.
+
+    Args:
+        url: The URL of the parent feature layer or table.
+        relationship_id: The relationship ID, as listed in the layer's
+            ``relationships`` metadata (see ``ezesri metadata``).
+        where: An optional SQL-like where clause to filter the parent features.
+        bbox: An optional tuple defining a bounding box (xmin, ymin, xmax, ymax) to filter parents by.
+        geometry: An optional GeoJSON string or dictionary representing a geometry to filter parents by.
+        spatial_rel: The spatial relationship to use for filtering. Defaults to 'esriSpatialRelIntersects'.
+        related_where: An optional where clause applied to the related records.
+        join: Return the parents left-joined to their related records (one row per
+            parent/related pair, related columns suffixed ``_related`` on name
+            clashes). With False, return ``(parents, related)`` instead.
+        batch_size: Optional starting number of parents per request. Defaults to the
+            lesser of the layer's maxRecordCount and 1000.
+
+    Related records are returned as attributes only, with the parent's object ID
+    in a ``parent_<objectIdField>`` column.
+
+    Returns:
+        A GeoDataFrame or DataFrame, or a ``(parents, related)`` tuple when ``join`` is False.
+
+    Raises:
+        EsriLayerError: If the layer has no such relationship, or a query returns an Esri error.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    with timed('metadata'):
+        metadata = _get_layer_metadata(url)
+    if not metadata:
+        raise EsriLayerError(f"Could not fetch layer metadata for {url}")
+    _raise_for_esri_error(metadata, f"Esri layer metadata request failed for {url}")
+
+    relationships = metadata.get('relationships')
+    if relationships is not None and not any(r.get('id') == relationship_id for r in relationships):
+        available = ', '.join(f"{r.get('id')} ({r.get('name')})" for r in relationships) or 'none'
+        raise EsriLayerError(f"Layer {url} has no relationship {relationship_id}. Available: {available}")
+
+    where = where or '1=1'
+    has_geometry = metadata.get('geometryType') is not None
+    advertised_max = max(1, int(metadata.get('maxRecordCount') or DEFAULT_MAX_BATCH_SIZE))
+    size = max(1, batch_size) if batch_size is not None else min(advertised_max, DEFAULT_MAX_BATCH_SIZE)
+    oid_field = metadata.get('objectIdField') or 'OBJECTID'
+    key_column = f"parent_{oid_field}"
+
+    plan = plan_spatial_filter(geometry, spatial_rel) if geometry and has_geometry and bbox is None else None
+    with timed('object_ids'):
+        object_ids = _fetch_filtered_object_ids(url, where, bbox, plan, has_geometry, oid_field)
+
+    if object_ids:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            parent_future = executor.submit(
+                _fetch_features_adaptive,
+                url,
+                object_ids,
+                where=where,
+                has_geometry=has_geometry,
+                query_format='geojson' if has_geometry else 'json',
+                batch_size=size,
+                controller=BatchSizeController(size, max_size=advertised_max),
+            )
+            related_future = executor.submit(
+                _fetch_related_records, url, object_ids, relationship_id, related_where, size, key_column
+            )
+            parent_features = parent_future.result()
+            related = related_future.result()
     else:
-        rows = [f['attributes'] for f in all_features]
-        return pd.DataFrame(rows)
+        parent_features, related = [], pd.DataFrame(columns=[key_column])
+
+    with timed('frame'):
+        if parent_features:
+            parents = _features_to_frame(parent_features, has_geometry)
+        else:
+            parents = gpd.GeoDataFrame() if has_geometry else pd.DataFrame()
+
+    if plan is not None and plan.refine_geometry is not None and not parents.empty:
+        with timed('refine'):
+            parents = plan.refine(parents)
+        related = related[related[key_column].isin(parents[oid_field])].reset_index(drop=True)
+
+    if not join:
+        return parents, related
+    if parents.empty or related.empty:
+        return parents
+    with timed('frame'):
+        return parents.merge(
+            related, how='left', left_on=oid_field, right_on=key_column, suffixes=('', '_related')
+        )
+
 
 def bulk_export(service_url: str, output_dir: str, output_format: str = 'geojson', workers: int = 1, rate: float = 0.0):
     """
@@ -331,6 +1100,8 @@ def bulk_export(service_url: str, output_dir: str, output_format: str = 'geojson
         workers: Number of parallel workers to use.
         rate: Global max requests per second across all workers (0 to disable).
     """
+    import geopandas as gpd
+
     if rate and rate > 0:
         set_rate_limit(rate)
 
@@ -371,7 +1142,7 @@ def bulk_export(service_url: str, output_dir: str, output_format: str = 'geojson
 
         layer_id = layer['id']
         layer_name = layer.get('name', f"layer_{layer_id}").replace(" ", "_").replace("/", "-")
-        layer_url = f"{service_url}/{layer_id}"
+        layer_url = f"{_normalize_url(service_url)}/{layer_id}"
 
         print(f"--- Processing layer: {layer_name} (ID: {layer_id}) ---")
         try:
@@ -386,54 +1157,55 @@ def bulk_export(service_url: str, output_dir: str, output_format: str = 'geojson
                 print(f"Cannot save non-spatial layer {layer_name} as {output_format}. Skipping.")
                 return False
 
-            if output_format == 'gdb':
-                print(f"Saving to {gdb_path}...")
-                df_clean, dropped = drop_empty_geometries(df)
-                if dropped:
-                    print(f"Warning: Dropped {dropped} features with null/empty geometry for layer {layer_name}.")
-                geom_types = unique_geometry_types(df_clean)
-                if len(geom_types) > 1:
-                    print(
-                        f"Skipping layer {layer_name}: mixed geometry types detected {geom_types}. "
-                        "GDB writes generally require a single geometry type per layer."
-                    )
-                    return False
-                with container_write_lock:
-                    df_clean.to_file(gdb_path, driver='FileGDB', layer=layer_name)
-            elif output_format == 'gpkg':
-                print(f"Saving to {gpkg_path}...")
-                df_clean, dropped = drop_empty_geometries(df)
-                if dropped:
-                    print(f"Warning: Dropped {dropped} features with null/empty geometry for layer {layer_name}.")
-                with container_write_lock:
-                    df_clean.to_file(gpkg_path, driver='GPKG', layer=layer_name)
-            elif output_format in ['geoparquet', 'parquet', 'ndjson']:
-                ext = '.parquet' if output_format in ['geoparquet', 'parquet'] else '.ndjson'
-                output_path = os.path.join(output_dir, f"{layer_name}{ext}")
-                print(f"Saving to {output_path}...")
-                if output_format == 'parquet':
-                    df_to_save = df.drop(columns='geometry', errors='ignore')
-                    df_to_save.to_parquet(output_path)
-                elif output_format == 'geoparquet':
+            with timed(f'write:{output_format}', layer=layer_name):
+                if output_format == 'gdb':
+                    print(f"Saving to {gdb_path}...")
                     df_clean, dropped = drop_empty_geometries(df)
                     if dropped:
                         print(f"Warning: Dropped {dropped} features with null/empty geometry for layer {layer_name}.")
-                    df_clean.to_parquet(output_path)
-                else:  # ndjson
-                    df_clean, dropped = (drop_empty_geometries(df) if is_spatial else (df, 0))
+                    geom_types = unique_geometry_types(df_clean)
+                    if len(geom_types) > 1:
+                        print(
+                            f"Skipping layer {layer_name}: mixed geometry types detected {geom_types}. "
+                            "GDB writes generally require a single geometry type per layer."
+                        )
+                        return False
+                    with container_write_lock:
+                        df_clean.to_file(gdb_path, driver='FileGDB', layer=layer_name)
+                elif output_format == 'gpkg':
+                    print(f"Saving to {gpkg_path}...")
+                    df_clean, dropped = drop_empty_geometries(df)
                     if dropped:
                         print(f"Warning: Dropped {dropped} features with null/empty geometry for layer {layer_name}.")
-                    write_ndjson(df_clean, output_path)
-            else:
-                file_extension = {
-                    'geojson': '.geojson', 'shapefile': '.shp', 'csv': '.csv'
-                }[output_format]
-                output_path = os.path.join(output_dir, f"{layer_name}{file_extension}")
-                print(f"Saving to {output_path}...")
-                if output_format == 'csv':
-                    df.drop(columns='geometry', errors='ignore').to_csv(output_path, index=False)
+                    with container_write_lock:
+                        df_clean.to_file(gpkg_path, driver='GPKG', layer=layer_name)
+                elif output_format in ['geoparquet', 'parquet', 'ndjson']:
+                    ext = '.parquet' if output_format in ['geoparquet', 'parquet'] else '.ndjson'
+                    output_path = os.path.join(output_dir, f"{layer_name}{ext}")
+                    print(f"Saving to {output_path}...")
+                    if output_format == 'parquet':
+                        df_to_save = df.drop(columns='geometry', errors='ignore')
+                        df_to_save.to_parquet(output_path)
+                    elif output_format == 'geoparquet':
+                        df_clean, dropped = drop_empty_geometries(df)
+                        if dropped:
+                            print(f"Warning: Dropped {dropped} features with null/empty geometry for layer {layer_name}.")
+                        df_clean.to_parquet(output_path)
+                    else:  # ndjson
+                        df_clean, dropped = (drop_empty_geometries(df) if is_spatial else (df, 0))
+                        if dropped:
+                            print(f"Warning: Dropped {dropped} features with null/empty geometry for layer {layer_name}.")
+                        write_ndjson(df_clean, output_path)
                 else:
-                    df.to_file(output_path, driver='GeoJSON' if output_format == 'geojson' else None)
+                    file_extension = {
+                        'geojson': '.geojson', 'shapefile': '.shp', 'csv': '.csv'
+                    }[output_format]
+                    output_path = os.path.join(output_dir, f"{layer_name}{file_extension}")
+                    print(f"Saving to {output_path}...")
+                    if output_format == 'csv':
+                        df.drop(columns='geometry', errors='ignore').to_csv(output_path, index=False)
+                    else:
+                        df.to_file(output_path, driver='GeoJSON' if output_format == 'geojson' else None)
 
             print(f"Successfully saved {layer_name}.")
             return True
@@ -442,11 +1214,96 @@ def bulk_export(service_url: str, output_dir: str, output_format: str = 'geojson
             return False
 
     layers = service_metadata['layers']
-    if workers <= 1:
-        for layer in layers:
-            process_layer(layer)
-    else:
-        with ThreadPoolExecutor(max_workers=workers) as executor:
-            futures = [executor.submit(process_layer, layer) for layer in layers]
-            for _ in as_completed(futures):
-                pass
\ No newline at end of file
+
+    # One /layers request replaces a metadata request per layer.
+    cache_service_metadata(service_url)
+    try:
+        if workers <= 1:
+            for layer in layers:
+                process_layer(layer)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(process_layer, layer) for layer in layers]
+                for _ in as_completed(futures):
+                    pass
+    finally:
+        clear_metadata_cache(service_url)
+
+
+def export_partitioned(
+    url: str,
+    output_dir: str,
+    time_field: Optional[str] = None,
+    partition: str = 'month',
+    where: str = '1=1',
+    workers: int = 4,
+    incremental: bool = False,
+) -> List[str]:
+    """
+    Extracts a layer window by window into partitioned Parquet files.
+
+    Each time window is written to ``<output_dir>/<partition>=<label>/part-0.parquet``
+    (GeoParquet for spatial layers) as soon as it is downloaded, so the directory
+    can be read back with ``pandas.read_parquet(output_dir)`` or
+    ``geopandas.read_parquet``. Rows whose ``time_field`` is NULL go to
+    ``<partition>=__HIVE_DEFAULT_PARTITION__``, which those readers read back
+    as a null partition value.
+
+    Args:
+        url: The URL of the feature layer or table.
+        output_dir: The directory to write partitions to.
+        time_field: The date field to split on. Defaults to the layer's
+            timeInfo.startTimeField.
+        partition: 'year', 'month', 'week' or 'day'.
+        where: An optional SQL-like where clause applied to every window.
+        workers: How many windows are extracted at once.
+        incremental: Skip windows that already have a partition file, except the
+            most recent existing one, which may have gained records since it was
+            written, and the NULL window. Use this to refresh only the latest data.
+
+    Returns:
+        Paths of the partition files written.
+    """
+    with timed('metadata'):
+        metadata = _get_layer_metadata(url)
+    if not metadata:
+        raise EsriLayerError(f"Could not fetch layer metadata for {url}")
+    _raise_for_esri_error(metadata, f"Esri layer metadata request failed for {url}")
+
+    time_field, windows = _resolve_time_windows(url, metadata, time_field, partition, where or '1=1')
+
+    def partition_path(window):
+        return os.path.join(output_dir, f"{partition}={window.label}", "part-0.parquet")
+
+    if incremental:
+        # Rows can gain or lose a NULL date at any time, so the null window
+        # is always fetched again.
+        existing = [w.label for w in windows if w.label != NULL_LABEL and os.path.exists(partition_path(w))]
+        if existing:
+            latest = max(existing)
+            windows = [
+                w for w in windows
+                if w.label == NULL_LABEL or w.label not in existing or w.label >= latest
+            ]
+    print(f"Exporting {len(windows)} {partition} windows on {time_field} to {output_dir}...")
+
+    def export_window(window):
+        df = extract_layer(url, where=window.where(time_field, where))
+        path = partition_path(window)
+        if df.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with timed('write:parquet', partition=window.label):
+            df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    written = []
+    with _pinned_metadata(url, metadata), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for path in executor.map(export_window, windows):
+            if path:
+                written.append(path)
+    return written
@@ -0,0 +1,301 @@
+import json
+import math
+from typing import Optional
+
+# Filters with more vertices than this are replaced by a simplified superset
+# for the server query and refined exactly on the client.
+MAX_FILTER_VERTICES = 1000
+
+# Upper bound on the envelope tiles a sparse filter is split into.
+MAX_FILTER_TILES = 16
+
+# Filters covering less than this fraction of their envelope are split into tiles.
+_SPLIT_FILL_RATIO = 0.5
+
+# Coordinate precision sent to the server (7 decimals of a degree is ~1 cm).
+_COORD_DECIMALS = 7
+
+_ESRI_GEOMETRY_KEYS = (
+    ('rings', 'esriGeometryPolygon'),
+    ('paths', 'esriGeometryPolyline'),
+    ('points', 'esriGeometryMultipoint'),
+    ('xmin', 'esriGeometryEnvelope'),
+    ('x', 'esriGeometryPoint'),
+)
+
+
+def _round(coords) -> list:
+    return [[round(c, _COORD_DECIMALS) for c in xy[:2]] for xy in coords]
+
+
+def esri_geometry_type(esri: dict) -> Optional[str]:
+    """Returns the Esri geometryType for an Esri JSON geometry, or None if it is not one."""
+    for key, geometry_type in _ESRI_GEOMETRY_KEYS:
+        if key in esri:
+            return geometry_type
+    return None
+
+
+def to_shapely(geometry):
+    """
+    Parses a filter geometry into a shapely geometry.
+
+    Accepts a shapely geometry, or a GeoJSON geometry, Feature or
+    FeatureCollection given as a dict or JSON string. Features of a
+    collection are unioned.
+    """
+    import shapely
+    from shapely.geometry import shape
+    from shapely.geometry.base import BaseGeometry
+
+    if isinstance(geometry, BaseGeometry):
+        return geometry
+    if isinstance(geometry, str):
+        geometry = json.loads(geometry)
+    if not isinstance(geometry, dict):
+        raise ValueError(f"Unsupported filter geometry: {geometry!r}")
+
+    kind = geometry.get('type')
+    if kind == 'FeatureCollection':
+        geoms = [to_shapely(f) for f in geometry.get('features') or [] if f.get('geometry')]
+        if not geoms:
+            raise ValueError("The filter FeatureCollection has no geometries.")
+        return shapely.union_all(geoms)
+    if kind == 'Feature':
+        if not geometry.get('geometry'):
+            raise ValueError("The filter Feature has no geometry.")
+        return shape(geometry['geometry'])
+    if kind is None:
+        raise ValueError("Filter geometry is not GeoJSON (missing 'type').")
+    return shape(geometry)
+
+
+def shapely_to_esri(geom) -> tuple:
+    """
+    Converts a shapely geometry to Esri JSON.
+
+    Polygon rings are reoriented the way Esri expects (exterior rings
+    clockwise, holes counter-clockwise); GeoJSON uses the opposite order and
+    the server would otherwise read exteriors as holes.
+
+    Returns:
+        (esri_geometry, geometry_type)
+    """
+    from shapely.geometry import polygon as shapely_polygon
+
+    sr = {'wkid': 4326}
+    kind = geom.geom_type
+    if kind == 'Point':
+        return {'x': round(geom.x, _COORD_DECIMALS), 'y': round(geom.y, _COORD_DECIMALS),
+                'spatialReference': sr}, 'esriGeometryPoint'
+    if kind == 'MultiPoint':
+        return {'points': _round([p.coords[0] for p in geom.geoms]), 'spatialReference': sr}, 'esriGeometryMultipoint'
+    if kind == 'LineString':
+        return {'paths': [_round(geom.coords)], 'spatialReference': sr}, 'esriGeometryPolyline'
+    if kind == 'MultiLineString':
+        return {'paths': [_round(line.coords) for line in geom.geoms], 'spatialReference': sr}, 'esriGeometryPolyline'
+    if kind in ('Polygon', 'MultiPolygon'):
+        rings = []
+        for poly in (geom.geoms if kind == 'MultiPolygon' else [geom]):
+            poly = shapely_polygon.orient(poly, sign=-1.0)
+            rings.append(_round(poly.exterior.coords))
+            rings.extend(_round(ring.coords) for ring in poly.interiors)
+        return {'rings': rings, 'spatialReference': sr}, 'esriGeometryPolygon'
+    if kind == 'GeometryCollection':
+        polygons = [g for g in geom.geoms if g.geom_type in ('Polygon', 'MultiPolygon')]
+        if polygons and len(polygons) == len(geom.geoms):
+            import shapely
+            return shapely_to_esri(shapely.union_all(polygons))
+        raise ValueError("GeometryCollection filters must contain only polygons.")
+    raise ValueError(f"Unsupported geometry type for a spatial filter: {kind}")
+
+
+def geojson_to_esri(geometry) -> tuple:
+    """
+    Converts a GeoJSON geometry, Feature or FeatureCollection to Esri JSON.
+
+    Returns:
+        (esri_geometry, geometry_type)
+    """
+    return shapely_to_esri(to_shapely(geometry))
+
+
+def _simplified_superset(geom, max_vertices: int):
+    """
+    Returns a polygon with at most ``max_vertices`` vertices that covers ``geom``.
+
+    The geometry is buffered outward by twice the simplification tolerance
+    before simplifying, so the simplified outline never cuts into the
+    original. The tolerance doubles until the vertex budget is met.
+    """
+    import shapely
+
+    minx, miny, maxx, maxy = geom.bounds
+    tolerance = max(maxx - minx, maxy - miny) / 2000 or 1e-6
+    candidate = geom
+    for _ in range(30):
+        candidate = geom.buffer(2 * tolerance, join_style='mitre').simplify(tolerance, preserve_topology=True)
+        if shapely.get_num_coordinates(candidate) <= max_vertices and candidate.covers(geom):
+            return candidate
+        tolerance *= 2
+    return geom.envelope
+
+
+def _split_into_tiles(geom, max_tiles: int) -> list:
+    """
+    Splits a sparse filter into grid tiles that together cover it.
+
+    Returns ``(geometry, is_envelope)`` pairs. Tiles the filter fills are
+    sent as plain envelopes, the cheapest spatial query for the server; the
+    rest are sent clipped to the tile.
+    """
+    from shapely.geometry import box
+
+    n = max(1, int(math.sqrt(max_tiles)))
+    minx, miny, maxx, maxy = geom.bounds
+    width, height = (maxx - minx) / n, (maxy - miny) / n
+    tiles = []
+    for i in range(n):
+        for j in range(n):
+            cell = box(minx + i * width, miny + j * height, minx + (i + 1) * width, miny + (j + 1) * height)
+            piece = geom.intersection(cell)
+            if piece.is_empty:
+                continue
+            if piece.area >= 0.95 * cell.area or piece.geom_type not in ('Polygon', 'MultiPolygon'):
+                tiles.append((cell, True))  # slivers are covered by the envelope too
+            else:
+                tiles.append((piece, False))
+    return tiles
+
+
+class SpatialFilterPlan:
+    """
+    The server queries for a spatial filter, plus an optional client-side refinement.
+
+    Attributes:
+        queries: Query parameters (``geometry``, ``geometryType``, ``inSR``,
+            ``spatialRel``) for each server request. Their results are unioned.
+        refine_geometry: The exact filter geometry when the server queries
+            were approximate, else None.
+        spatial_rel: The requested spatial relationship.
+    """
+
+    def __init__(self, queries: list, refine_geometry=None, spatial_rel: str = 'esriSpatialRelIntersects'):
+        self.queries = queries
+        self.refine_geometry = refine_geometry
+        self.spatial_rel = spatial_rel
+
+    def refine(self, gdf):
+        """Keeps only the rows of ``gdf`` that satisfy the exact filter."""
+        if self.refine_geometry is None or gdf.empty:
+            return gdf
+        import shapely
+        shapely.prepare(self.refine_geometry)
+        if self.spatial_rel == 'esriSpatialRelContains':
+            mask = gdf.within(self.refine_geometry)  # the filter contains the feature
+        elif self.spatial_rel == 'esriSpatialRelWithin':
+            mask = gdf.contains(self.refine_geometry)  # the filter is within the feature
+        else:
+            mask = gdf.intersects(self.refine_geometry)
+        return gdf[mask.values].reset_index(drop=True)
+
+    def refine_features(self, features: list) -> list:
+        """Keeps only the GeoJSON features that satisfy the exact filter, without geopandas."""
+        if self.refine_geometry is None or not features:
+            return features
+        import shapely
+        from shapely.geometry import shape
+
+        shapely.prepare(self.refine_geometry)
+        kept = []
+        for feature in features:
+            if not feature.get('geometry'):
+                continue
+            geom = shape(feature['geometry'])
+            if self.spatial_rel == 'esriSpatialRelContains':
+                match = self.refine_geometry.contains(geom)
+            elif self.spatial_rel == 'esriSpatialRelWithin':
+                match = self.refine_geometry.within(geom)
+            else:
+                match = self.refine_geometry.intersects(geom)
+            if match:
+                kept.append(feature)
+        return kept
+
+
+def _query_params(esri: dict, geometry_type: str, spatial_rel: str) -> dict:
+    return {
+        'geometry': json.dumps(esri, separators=(',', ':')),
+        'geometryType': geometry_type,
+        'inSR': '4326',
+        'spatialRel': spatial_rel,
+    }
+
+
+def plan_spatial_filter(
+    geometry,
+    spatial_rel: str = 'esriSpatialRelIntersects',
+    max_vertices: int = MAX_FILTER_VERTICES,
+    max_tiles: int = MAX_FILTER_TILES,
+) -> SpatialFilterPlan:
+    """
+    Plans the server queries for a filter geometry.
+
+    Simple filters are converted to Esri JSON and sent as-is. Filters with
+    more than ``max_vertices`` vertices are replaced by a simplified polygon
+    that covers them, queried with esriSpatialRelIntersects; sparse ones
+    (multipart, or filling little of their envelope) are also split into up
+    to ``max_tiles`` tiles. The exact geometry and ``spatial_rel`` are then
+    applied on the client with SpatialFilterPlan.refine().
+
+    Esri JSON geometries, and strings that are not JSON (such as
+    ``"xmin,ymin,xmax,ymax"``), are passed through unchanged.
+    """
+    import shapely
+
+    parsed = geometry
+    if isinstance(geometry, str):
+        try:
+            parsed = json.loads(geometry)
+        except ValueError:
+            # Esri's simple syntax: "x,y" for a point, "xmin,ymin,xmax,ymax" for an envelope.
+            geometry_type = 'esriGeometryPoint' if geometry.count(',') == 1 else 'esriGeometryEnvelope'
+            return SpatialFilterPlan([{
+                'geometry': geometry, 'geometryType': geometry_type,
+                'inSR': '4326', 'spatialRel': spatial_rel,
+            }], spatial_rel=spatial_rel)
+    if isinstance(parsed, dict) and 'type' not in parsed:
+        geometry_type = esri_geometry_type(parsed)
+        if geometry_type is None:
+            raise ValueError(f"Unsupported filter geometry: {geometry!r}")
+        params = _query_params(parsed, geometry_type, spatial_rel)
+        if 'spatialReference' in parsed:
+            params.pop('inSR')
+        return SpatialFilterPlan([params], spatial_rel=spatial_rel)
+
+    geom = to_shapely(parsed)
+    if shapely.get_num_coordinates(geom) <= max_vertices:
+        return SpatialFilterPlan([_query_params(*shapely_to_esri(geom), spatial_rel)], spatial_rel=spatial_rel)
+
+    simplified = _simplified_superset(geom, max_vertices)
+    pieces = [(simplified, False)]
+    is_sparse = (
+        simplified.geom_type == 'MultiPolygon'
+        or simplified.area < _SPLIT_FILL_RATIO * simplified.envelope.area
+    )
+    # Tiles only preserve "intersects": a feature can lie within the whole
+    # filter without lying within any single tile.
+    if spatial_rel == 'esriSpatialRelIntersects' and is_sparse and max_tiles > 1:
+        pieces = _split_into_tiles(simplified, max_tiles)
+
+    queries = []
+    for piece, is_envelope in pieces:
+        if is_envelope:
+            minx, miny, maxx, maxy = piece.bounds
+            esri, geometry_type = {
+                'xmin': minx, 'ymin': miny, 'xmax': maxx, 'ymax': maxy, 'spatialReference': {'wkid': 4326},
+            }, 'esriGeometryEnvelope'
+        else:
+            esri, geometry_type = shapely_to_esri(piece)
+        queries.append(_query_params(esri, geometry_type, 'esriSpatialRelIntersects'))
+    return SpatialFilterPlan(queries, refine_geometry=geom, spatial_rel=spatial_rel)
@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from .utils import rate_limit_has_capacity
+
+HEDGE_MODES = ('duplicate', 'split')
+
+
+class LatencyTracker:
+    """Keeps a sliding window of recent request latencies and reports percentiles."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(pct / 100.0 * len(samples)) - 1))
+        return samples[index]
+
+
+class Hedger:
+    """
+    Issues a backup request when a batch runs past the observed latency percentile.
+
+    In ``'duplicate'`` mode the same batch is requested again; in ``'split'``
+    mode the batch is requested as two halves in parallel. Whichever finishes
+    first wins. A loser that has not started is cancelled; one already in
+    flight cannot be interrupted and its result is discarded.
+
+    Hedges are limited to ``budget`` (a fraction of primary requests) and are
+    skipped while the global rate limiter has no spare capacity, so hedging
+    never pushes the request rate above the configured limit.
+
+    Args:
+        mode: 'duplicate' or 'split'.
+        percentile: Latency percentile after which a hedge is sent.
+        min_samples: Latencies to observe before hedging starts.
+        budget: Maximum ratio of hedged to primary requests.
+        max_workers: Threads available for primary and hedge requests.
+    """
+
+    def __init__(
+        self,
+        mode: str = 'duplicate',
+        percentile: float = 95.0,
+        min_samples: int = 10,
+        budget: float = 0.1,
+        max_workers: int = 4,
+    ):
+        if mode not in HEDGE_MODES:
+            raise ValueError(f"Unknown hedge mode {mode!r}. Expected one of {HEDGE_MODES}.")
+        self.mode = mode
+        self.percentile = percentile
+        self.min_samples = max(1, min_samples)
+        self.budget = budget
+        self.latencies = LatencyTracker()
+        self.primary_count = 0
+        self.hedge_count = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(3, max_workers))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait on the primary request before hedging, or None if hedging is not possible yet."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def _reserve_hedge(self) -> bool:
+        """Counts a hedge if the budget and the rate limiter allow one."""
+        with self._lock:
+            if self.hedge_count >= self.budget * self.primary_count or not rate_limit_has_capacity():
+                return False
+            self.hedge_count += 1
+            return True
+
+    def _run_split(self, fn: Callable[[list], list], batch: list) -> list:
+        half = len(batch) // 2
+        first = self._executor.submit(fn, batch[:half])
+        second = fn(batch[half:])
+        return first.result() + second
+
+    def run(self, fn: Callable[[list], list], batch: list) -> list:
+        """Calls ``fn(batch)``, hedging it if it runs long. Returns the winning result."""
+        with self._lock:
+            self.primary_count += 1
+        started = time.monotonic()
+        primary = self._executor.submit(fn, batch)
+
+        delay = self.hedge_delay()
+        if delay is None:
+            result = primary.result()
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        done, _ = wait([primary], timeout=delay)
+        if done or (self.mode == 'split' and len(batch) < 2) or not self._reserve_hedge():
+            result = primary.result()
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        if self.mode == 'split':
+            hedge = self._executor.submit(self._run_split, fn, batch)
+        else:
+            hedge = self._executor.submit(fn, batch)
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                self.latencies.record(time.monotonic() - started)
+                return future.result()
+        raise first_error
+
+    def close(self):
+        """Releases worker threads without waiting for abandoned requests."""
+        self._executor.shutdown(wait=False)
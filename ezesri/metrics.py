@@ -0,0 +1,268 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .profiling import add_listener, remove_listener
+
+# Latency buckets in seconds, from fast metadata calls to straggling batches.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Counter events from ezesri.profiling.count() -> (metric name, help, per-host)
+_COUNTERS = {
+    'requests': ('ezesri_requests_total', 'HTTP requests that received a response.', True),
+    'bytes': ('ezesri_response_bytes_total', 'Response body bytes received, after decompression.', True),
+    'wire_bytes': ('ezesri_wire_bytes_total', 'Response body bytes transferred, before decompression.', True),
+    'retries': ('ezesri_retries_total', 'Requests retried after a failure.', True),
+    'features': ('ezesri_features_total', 'Features downloaded.', False),
+    'batch_size_halvings': ('ezesri_batch_size_halvings_total', 'Feature batches halved after a failure.', False),
+    'batch_size_changes': ('ezesri_batch_size_changes_total', 'Changes to the feature batch size.', False),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class MetricsCollector:
+    """
+    Aggregates instrumentation events into counters and histograms.
+
+    Metrics:
+        ezesri_requests_total{host}            counter
+        ezesri_response_bytes_total{host}      counter
+        ezesri_wire_bytes_total{host}          counter
+        ezesri_retries_total{host}             counter
+        ezesri_features_total                  counter
+        ezesri_batch_size_halvings_total       counter
+        ezesri_batch_size_changes_total        counter
+        ezesri_request_duration_seconds{host}  histogram
+        ezesri_rate_limit_wait_seconds         histogram
+        ezesri_phase_duration_seconds{phase}   histogram
+        ezesri_features_per_second             gauge (over ``rate_window`` seconds)
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, rate_window: float = 60.0):
+        self.buckets = tuple(sorted(buckets))
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._feature_events = deque()
+
+    def on_count(self, name: str, value: float, tags: dict):
+        spec = _COUNTERS.get(name)
+        if spec is None:
+            return
+        metric, _, per_host = spec
+        labels = (('host', tags.get('host', '')),) if per_host else ()
+        with self._lock:
+            key = (metric, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+            if name == 'features':
+                self._feature_events.append((time.monotonic(), value))
+
+    def on_timing(self, phase: str, seconds: float, tags: dict):
+        with self._lock:
+            if phase == 'http':
+                self._observe('ezesri_request_duration_seconds', (('host', tags.get('host', '')),), seconds)
+            elif phase == 'rate_limit_wait':
+                self._observe('ezesri_rate_limit_wait_seconds', (), seconds)
+            self._observe('ezesri_phase_duration_seconds', (('phase', phase),), seconds)
+
+    def _observe(self, metric: str, labels: tuple, value: float):
+        key = (metric, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(self.buckets)
+        histogram.observe(value)
+
+    def features_per_second(self) -> float:
+        """Features downloaded per second over the last ``rate_window`` seconds."""
+        cutoff = time.monotonic() - self.rate_window
+        with self._lock:
+            while self._feature_events and self._feature_events[0][0] < cutoff:
+                self._feature_events.popleft()
+            total = sum(n for _, n in self._feature_events)
+        return total / self.rate_window
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        helps = {metric: help_text for metric, help_text, _ in _COUNTERS.values()}
+        helps.update({
+            'ezesri_request_duration_seconds': 'Duration of individual HTTP attempts.',
+            'ezesri_rate_limit_wait_seconds': 'Time spent waiting on the global rate limiter.',
+            'ezesri_phase_duration_seconds': 'Duration of instrumented extraction phases.',
+        })
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda kv: kv[0])
+            snapshots = [(key, list(h.counts), h.total, h.sum) for key, h in histograms]
+
+        seen = set()
+        for (metric, labels), value in counters:
+            if metric not in seen:
+                lines.append(f"# HELP {metric} {helps[metric]}")
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value:g}")
+
+        for (metric, labels), counts, total, total_sum in snapshots:
+            if metric not in seen:
+                lines.append(f"# HELP {metric} {helps[metric]}")
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(metric)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {total}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total_sum:g}")
+            lines.append(f"{metric}_count{_labels(labels)} {total}")
+
+        lines.append("# HELP ezesri_features_per_second Features downloaded per second over the recent window.")
+        lines.append("# TYPE ezesri_features_per_second gauge")
+        lines.append(f"ezesri_features_per_second {self.features_per_second():g}")
+        return "\n".join(lines) + "\n"
+
+
+_collector: Optional[MetricsCollector] = None
+_collector_lock = threading.Lock()
+
+
+def enable_metrics() -> MetricsCollector:
+    """Starts collecting metrics process-wide and returns the shared collector."""
+    global _collector
+    with _collector_lock:
+        if _collector is None:
+            _collector = MetricsCollector()
+            add_listener(_collector)
+        return _collector
+
+
+def disable_metrics():
+    """Stops collecting metrics and discards the shared collector."""
+    global _collector
+    with _collector_lock:
+        if _collector is not None:
+            remove_listener(_collector)
+            _collector = None
+
+
+def serve_prometheus(port: int = 9464, addr: str = '127.0.0.1'):
+    """
+    Serves the shared collector's metrics at ``http://addr:port/metrics``.
+
+    The server runs in a daemon thread. Returns the server; call
+    ``server.shutdown()`` to stop it.
+
+    Example:
+        from ezesri.metrics import serve_prometheus
+        serve_prometheus(port=9464)
+        ezesri.bulk_export(service_url, "out", workers=4)
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    collector = enable_metrics()
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = collector.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='ezesri-metrics', daemon=True)
+    thread.start()
+    return server
+
+
+class _OtelListener:
+    """Forwards instrumentation events to OpenTelemetry instruments."""
+
+    def __init__(self, meter):
+        self._counters = {
+            name: meter.create_counter(metric, description=help_text)
+            for name, (metric, help_text, _) in _COUNTERS.items()
+        }
+        self._request_duration = meter.create_histogram(
+            'ezesri_request_duration_seconds', unit='s', description='Duration of individual HTTP attempts.'
+        )
+        self._rate_limit_wait = meter.create_histogram(
+            'ezesri_rate_limit_wait_seconds', unit='s', description='Time spent waiting on the global rate limiter.'
+        )
+        self._phase_duration = meter.create_histogram(
+            'ezesri_phase_duration_seconds', unit='s', description='Duration of instrumented extraction phases.'
+        )
+
+    def on_count(self, name: str, value: float, tags: dict):
+        counter = self._counters.get(name)
+        if counter is not None:
+            attributes = {'host': tags['host']} if 'host' in tags else {}
+            counter.add(value, attributes)
+
+    def on_timing(self, phase: str, seconds: float, tags: dict):
+        if phase == 'http':
+            self._request_duration.record(seconds, {'host': tags.get('host', '')})
+        elif phase == 'rate_limit_wait':
+            self._rate_limit_wait.record(seconds)
+        self._phase_duration.record(seconds, {'phase': phase})
+
+
+def start_otlp_exporter(endpoint: Optional[str] = None, interval_seconds: float = 15.0):
+    """
+    Exports metrics to an OpenTelemetry collector over OTLP/gRPC.
+
+    Requires ``pip install ezesri[metrics]``. The endpoint defaults to the
+    standard ``OTEL_EXPORTER_OTLP_ENDPOINT`` environment variable.
+
+    Returns:
+        The MeterProvider; call ``provider.shutdown()`` to flush and stop.
+    """
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    except ImportError as e:
+        raise RuntimeError(
+            "OTLP export requires opentelemetry-sdk and opentelemetry-exporter-otlp. "
+            "Install them with: pip install ezesri[metrics]"
+        ) from e
+
+    exporter = OTLPMetricExporter(endpoint=endpoint) if endpoint else OTLPMetricExporter()
+    reader = PeriodicExportingMetricReader(exporter, export_interval_millis=int(interval_seconds * 1000))
+    provider = MeterProvider(metric_readers=[reader])
+    add_listener(_OtelListener(provider.get_meter('ezesri')))
+    return provider
@@ -0,0 +1,119 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+PARTITIONS = ('year', 'month', 'week', 'day')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# Label of the window holding rows whose time field is NULL. It is the
+# directory name Hive-style readers (pyarrow, Spark) read back as null.
+NULL_LABEL = '__HIVE_DEFAULT_PARTITION__'
+
+
+class TimeWindow:
+    """
+    A half-open time range ``[start, end)`` in UTC, labelled for partitioned output.
+
+    A window without ``start`` and ``end`` (see ``null_window()``) selects the
+    rows whose time field is NULL, which no time range matches.
+    """
+
+    def __init__(self, start: Optional[datetime], end: Optional[datetime], label: str):
+        self.start = start
+        self.end = end
+        self.label = label
+
+    def __repr__(self):
+        if self.start is None:
+            return f"TimeWindow({self.label}: NULL)"
+        return f"TimeWindow({self.label}: {self.start.isoformat()} - {self.end.isoformat()})"
+
+    def where(self, time_field: str, where: str = '1=1') -> str:
+        """Returns ``where`` restricted to this window on ``time_field``."""
+        if self.start is None:
+            clause = f"{time_field} IS NULL"
+        else:
+            clause = (
+                f"{time_field} >= TIMESTAMP '{self.start:%Y-%m-%d %H:%M:%S}' "
+                f"AND {time_field} < TIMESTAMP '{self.end:%Y-%m-%d %H:%M:%S}'"
+            )
+        if not where or where.strip() == '1=1':
+            return clause
+        return f"({where}) AND {clause}"
+
+
+def null_window() -> TimeWindow:
+    """The window of rows with a NULL time field, labelled NULL_LABEL."""
+    return TimeWindow(None, None, NULL_LABEL)
+
+
+def from_epoch_ms(value) -> datetime:
+    return _EPOCH + timedelta(milliseconds=int(value))
+
+
+def _period_start(moment: datetime, partition: str) -> datetime:
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if partition == 'year':
+        return day.replace(month=1, day=1)
+    if partition == 'month':
+        return day.replace(day=1)
+    if partition == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _next_period(start: datetime, partition: str) -> datetime:
+    if partition == 'year':
+        return start.replace(year=start.year + 1)
+    if partition == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    if partition == 'week':
+        return start + timedelta(days=7)
+    return start + timedelta(days=1)
+
+
+def _label(start: datetime, partition: str) -> str:
+    if partition == 'year':
+        return f"{start:%Y}"
+    if partition == 'month':
+        return f"{start:%Y-%m}"
+    return f"{start:%Y-%m-%d}"
+
+
+def time_windows(start: datetime, end: datetime, partition: str = 'month') -> List[TimeWindow]:
+    """
+    Splits ``[start, end]`` into calendar-aligned windows.
+
+    Args:
+        start: Earliest timestamp (UTC).
+        end: Latest timestamp (UTC); the window containing it is included.
+        partition: 'year', 'month', 'week' (starting Monday) or 'day'.
+    """
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown partition {partition!r}. Expected one of {PARTITIONS}.")
+    windows = []
+    current = _period_start(start, partition)
+    while current <= end:
+        following = _next_period(current, partition)
+        windows.append(TimeWindow(current, following, _label(current, partition)))
+        current = following
+    return windows
+
+
+def time_field_from_metadata(metadata: dict) -> Optional[str]:
+    """Returns the layer's ``timeInfo.startTimeField``, if it is time-enabled."""
+    return (metadata.get('timeInfo') or {}).get('startTimeField') or None
+
+
+def time_extent_statistics_params(time_field: str, where: str = '1=1') -> dict:
+    """Query parameters asking the server for the min and max of ``time_field``."""
+    return {
+        'f': 'json',
+        'where': where or '1=1',
+        'outStatistics': json.dumps([
+            {'statisticType': 'min', 'onStatisticField': time_field, 'outStatisticFieldName': 'ezesri_min'},
+            {'statisticType': 'max', 'onStatisticField': time_field, 'outStatisticFieldName': 'ezesri_max'},
+        ]),
+    }
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Listeners receive every timing and counter event. With no listeners the hooks
+# below cost one list check, so instrumented code paths stay cheap by default.
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def add_listener(listener):
+    """
+    Registers an object with ``on_timing(phase, seconds, tags)`` and
+    ``on_count(name, value, tags)`` methods to receive instrumentation events.
+    """
+    with _listeners_lock:
+        if listener not in _listeners:
+            _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Unregisters a listener added with add_listener()."""
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+@contextmanager
+def timed(phase: str, **tags):
+    """
+    Times the enclosed block and reports it to all listeners under ``phase``.
+
+    Yields the tags dict, so the block can add tags it only learns while
+    running (response sizes, content encoding).
+    """
+    if not _listeners:
+        yield tags
+        return
+    started = time.perf_counter()
+    try:
+        yield tags
+    finally:
+        elapsed = time.perf_counter() - started
+        for listener in list(_listeners):
+            listener.on_timing(phase, elapsed, tags)
+
+
+def count(name: str, value: float = 1, **tags):
+    """Reports a counter increment (requests, bytes, retries, ...) to all listeners."""
+    if not _listeners:
+        return
+    for listener in list(_listeners):
+        listener.on_count(name, value, tags)
+
+
+class Profiler:
+    """
+    Collects per-phase timings and counters for one extraction.
+
+    Phases recorded by ezesri:
+        http               One HTTP attempt in make_request.
+        rate_limit_wait    Time spent waiting on the global rate limiter.
+        metadata           Layer metadata lookup.
+        object_ids         The object ID phase (_fetch_all_object_ids).
+        batch_query        One feature batch (_query_features_batch).
+        related_query      One queryRelatedRecords batch (extract_related).
+        json_decode        Decoding a JSON response body.
+        frame              Building the GeoDataFrame or DataFrame.
+        refine             Applying a simplified spatial filter exactly on the client.
+        store_read         Looking up a layer in the local layer store.
+        store_write        Saving a layer to the local layer store.
+        write:<format>     Writing output in the given format.
+
+    Counters: requests, bytes (decoded response bodies), wire_bytes (as
+    transferred, before decompression), retries, features,
+    batch_size_changes, batch_size_halvings, store_hits. ``http`` events are
+    tagged with the content encoding, both sizes and the compression ratio.
+
+    Args:
+        max_events: Maximum number of individual timing events kept for the
+            JSON trace. Aggregates are always complete.
+    """
+
+    def __init__(self, max_events: int = 100000):
+        self.max_events = max_events
+        self.phases = {}
+        self.counters = {}
+        self.events = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.wall_seconds = None
+
+    def on_timing(self, phase: str, seconds: float, tags: dict):
+        with self._lock:
+            stats = self.phases.setdefault(phase, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['calls'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if len(self.events) < self.max_events:
+                self.events.append({
+                    'phase': phase,
+                    'end': round(time.perf_counter() - self._started, 6),
+                    'seconds': round(seconds, 6),
+                    'thread': threading.current_thread().name,
+                    'tags': tags,
+                })
+
+    def on_count(self, name: str, value: float, tags: dict):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stop(self):
+        self.wall_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'wall_seconds': self.wall_seconds,
+                'phases': {k: dict(v) for k, v in self.phases.items()},
+                'counters': dict(self.counters),
+                'events': list(self.events),
+            }
+
+    def report(self) -> str:
+        """Returns a human-readable per-phase breakdown."""
+        lines = []
+        if self.wall_seconds is not None:
+            lines.append(f"Total wall time: {self.wall_seconds:.2f} s")
+        lines.append(f"{'Phase':<20} {'Calls':>7} {'Total (s)':>10} {'Mean (ms)':>10} {'Max (ms)':>10}")
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda kv: kv[1]['total_seconds'], reverse=True)
+            counters = dict(self.counters)
+        for phase, stats in phases:
+            mean_ms = stats['total_seconds'] / stats['calls'] * 1000 if stats['calls'] else 0.0
+            lines.append(
+                f"{phase:<20} {stats['calls']:>7} {stats['total_seconds']:>10.3f} "
+                f"{mean_ms:>10.1f} {stats['max_seconds'] * 1000:>10.1f}"
+            )
+        if counters:
+            lines.append("")
+            for name in sorted(counters):
+                value = counters[name]
+                if name.endswith('bytes'):
+                    lines.append(f"{name}: {value:,.0f} ({value / 1e6:.2f} MB)")
+                else:
+                    lines.append(f"{name}: {value:,.0f}")
+            if counters.get('wire_bytes') and counters.get('bytes'):
+                lines.append(f"compression ratio: {counters['bytes'] / counters['wire_bytes']:.1f}x")
+        return "\n".join(lines)
+
+    def write_trace(self, path: str):
+        """Writes the aggregates and individual events as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+@contextmanager
+def profile(profiler: Optional[Profiler] = None):
+    """
+    Records instrumentation events for the enclosed block.
+
+    Example:
+        with ezesri.profile() as profiler:
+            ezesri.extract_layer(url)
+        print(profiler.report())
+    """
+    profiler = profiler or Profiler()
+    add_listener(profiler)
+    try:
+        yield profiler
+    finally:
+        remove_listener(profiler)
+        profiler.stop()
@@ -0,0 +1,197 @@
+import json
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+# HTTP statuses worth retrying. Other 4xx responses (bad parameters, missing
+# layers, auth failures) will fail the same way every time.
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Esri error codes (returned in a JSON body, often with HTTP 200) that signal
+# an overloaded or restarting server. Code 500 ("Unable to complete operation")
+# is left out: for feature queries it usually means the batch is too large,
+# which the batch size controller handles by shrinking the batch.
+RETRYABLE_ESRI_CODES = frozenset({429, 502, 503, 504})
+
+_ESRI_ERROR_PREFIX = re.compile(rb'^\s*\{\s*"error"\s*:')
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without sending a request when a host's circuit breaker is open."""
+
+
+class RetryPolicy:
+    """
+    Controls how make_request retries failed requests.
+
+    Delays grow exponentially from ``backoff_base`` up to ``backoff_max`` with
+    full jitter, so parallel workers do not retry in lockstep. A server's
+    ``Retry-After`` header, when present, sets the minimum delay.
+
+    Args:
+        max_attempts: Total attempts per request, including the first.
+        backoff_base: Delay in seconds before the first retry (before jitter).
+        backoff_max: Upper bound on any single delay, in seconds.
+        jitter: Randomize delays between 0 and the exponential backoff.
+        retry_statuses: HTTP status codes that are retried.
+        retry_esri_codes: Esri JSON ``error.code`` values that are retried.
+        breaker_threshold: Consecutive failures that open a host's circuit
+            breaker. 0 disables circuit breaking.
+        breaker_reset: Seconds an open circuit waits before letting a trial
+            request through.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        jitter: bool = True,
+        retry_statuses: Iterable[int] = RETRYABLE_STATUS_CODES,
+        retry_esri_codes: Iterable[int] = RETRYABLE_ESRI_CODES,
+        breaker_threshold: int = 10,
+        breaker_reset: float = 30.0,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be >= 1")
+        self.max_attempts = int(max_attempts)
+        self.backoff_base = max(0.0, float(backoff_base))
+        self.backoff_max = max(self.backoff_base, float(backoff_max))
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_esri_codes = frozenset(retry_esri_codes)
+        self.breaker_threshold = max(0, int(breaker_threshold))
+        self.breaker_reset = float(breaker_reset)
+
+    def is_retryable_exception(self, exc: requests.exceptions.RequestException) -> bool:
+        """Connection errors and timeouts are retried; HTTP errors only for retryable statuses."""
+        if isinstance(exc, CircuitOpenError):
+            return False
+        response = getattr(exc, 'response', None)
+        if response is not None and isinstance(exc, requests.exceptions.HTTPError):
+            return response.status_code in self.retry_statuses
+        return True
+
+    def is_retryable_esri_code(self, code) -> bool:
+        try:
+            return int(code) in self.retry_esri_codes
+        except (TypeError, ValueError):
+            return False
+
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Returns the delay in seconds before retry number ``attempt + 1``."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+def parse_retry_after(response) -> Optional[float]:
+    """Parses a Retry-After header given as seconds or an HTTP date."""
+    if response is None:
+        return None
+    value = (getattr(response, 'headers', None) or {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def esri_error_code(response):
+    """
+    Returns the Esri ``error.code`` of a JSON error body, or None.
+
+    Only the first bytes are inspected before parsing, so large feature
+    payloads are not decoded twice.
+    """
+    content = response.content or b''
+    if not _ESRI_ERROR_PREFIX.match(content[:64]):
+        return None
+    try:
+        err = json.loads(content).get('error') or {}
+    except (ValueError, AttributeError):
+        return None
+    return err.get('code') if isinstance(err, dict) else None
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures for one host.
+
+    After ``threshold`` consecutive failures the circuit opens and requests
+    fail immediately with CircuitOpenError. Once ``reset_timeout`` has passed a
+    single trial request is allowed; success closes the circuit, failure
+    re-opens it.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def before_request(self, host: str):
+        if not self.threshold:
+            return
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError(
+                    f"Circuit breaker open for {host} after {self._failures} consecutive failures"
+                )
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self.threshold and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker_for(url: str, policy: RetryPolicy) -> CircuitBreaker:
+    """Returns the shared circuit breaker for the URL's host."""
+    host = urlparse(url).netloc.lower()
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(policy.breaker_threshold, policy.breaker_reset)
+            _breakers[host] = breaker
+        else:
+            breaker.threshold = policy.breaker_threshold
+            breaker.reset_timeout = policy.breaker_reset
+        return breaker
+
+
+def reset_circuit_breakers():
+    """Closes and forgets all per-host circuit breakers."""
+    with _breakers_lock:
+        _breakers.clear()
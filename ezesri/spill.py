@@ -0,0 +1,212 @@
+import os
+import tempfile
+from typing import TYPE_CHECKING, Optional, Union
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+
+DEFAULT_SPILL_MEMORY_MB = 256.0
+
+# Assumed size of a feature when the response size is unknown.
+_FALLBACK_FEATURE_BYTES = 1024
+
+_INTEGER_TYPES = {
+    'esriFieldTypeOID', 'esriFieldTypeInteger', 'esriFieldTypeSmallInteger',
+    'esriFieldTypeBigInteger', 'esriFieldTypeDate',
+}
+_FLOAT_TYPES = {'esriFieldTypeDouble', 'esriFieldTypeSingle'}
+_SKIPPED_TYPES = {'esriFieldTypeGeometry', 'esriFieldTypeBlob', 'esriFieldTypeRaster'}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError(
+            "Spilling features to disk requires pyarrow. Install it with: pip install ezesri[arrow]"
+        ) from e
+    return pa, pq
+
+
+def arrow_schema_for_fields(fields: list, has_geometry: bool):
+    """
+    Builds an Arrow schema from an Esri layer's ``fields`` list.
+
+    Dates are kept as epoch milliseconds, as the query endpoint returns them.
+    Geometry is stored as WKB in a ``geometry`` column.
+    """
+    pa, _ = _import_pyarrow()
+    columns = [('geometry', pa.binary())] if has_geometry else []
+    for field in fields:
+        name, field_type = field.get('name'), field.get('type')
+        if not name or field_type in _SKIPPED_TYPES:
+            continue
+        if field_type in _INTEGER_TYPES:
+            columns.append((name, pa.int64()))
+        elif field_type in _FLOAT_TYPES:
+            columns.append((name, pa.float64()))
+        else:
+            columns.append((name, pa.string()))
+    return pa.schema(columns)
+
+
+def arrow_table_to_frame(
+    table, has_geometry: bool, crs: Optional[str] = "EPSG:4326"
+) -> Union["gpd.GeoDataFrame", "pd.DataFrame"]:
+    """
+    Converts an Arrow table with a WKB ``geometry`` column into a GeoDataFrame or DataFrame.
+
+    The WKB column goes to shapely as a NumPy array, without an intermediate
+    Python list. Two copies remain: NumPy cannot view Arrow binary data, so
+    each WKB value becomes one ``bytes`` object for shapely to parse (the
+    same path as ``GeoDataFrame.from_arrow``), and ``to_pandas()`` copies the
+    attribute columns, which keeps the frame writable and independent of a
+    memory-mapped source file.
+    """
+    import geopandas as gpd
+
+    if not has_geometry:
+        return table.to_pandas()
+    geometry = gpd.array.from_wkb(table.column('geometry').to_numpy(zero_copy_only=False), crs=crs)
+    df = table.drop(['geometry']).to_pandas()
+    df.insert(0, 'geometry', geometry)
+    return gpd.GeoDataFrame(df, geometry='geometry', crs=crs)
+
+
+class FeatureSpiller:
+    """
+    Accumulates downloaded features on disk instead of in memory.
+
+    Features are buffered until the responses they came from exceed
+    ``memory_limit_bytes``, then written as one row group of a temporary
+    Parquet file. ``to_frame()`` reads the file back into a GeoDataFrame or
+    DataFrame, so peak memory is roughly the final frame plus one buffer
+    rather than the raw features plus the frame.
+
+    Args:
+        has_geometry: Whether features are GeoJSON features with geometry
+            (otherwise Esri JSON features with ``attributes``).
+        fields: The layer's ``fields`` metadata, used for the column types.
+            Without it the types are inferred from the first buffer.
+        memory_limit_bytes: Response bytes to buffer before spilling.
+        directory: Directory for the temporary file. Defaults to the system
+            temporary directory.
+    """
+
+    def __init__(
+        self,
+        has_geometry: bool,
+        fields: Optional[list] = None,
+        memory_limit_bytes: int = int(DEFAULT_SPILL_MEMORY_MB * 1024 * 1024),
+        directory: Optional[str] = None,
+    ):
+        self._pa, self._pq = _import_pyarrow()
+        self.has_geometry = has_geometry
+        self.memory_limit_bytes = max(1, int(memory_limit_bytes))
+        self.schema = arrow_schema_for_fields(fields, has_geometry) if fields else None
+        fd, self.path = tempfile.mkstemp(prefix='ezesri-spill-', suffix='.parquet', dir=directory)
+        os.close(fd)
+        self._writer = None
+        self._buffer = []
+        self._buffered_bytes = 0
+        self.rows = 0
+        self.spills = 0
+
+    def add(self, features: list, nbytes: Optional[int] = None):
+        """Buffers a batch of features, spilling to disk once over the memory limit."""
+        if not features:
+            return
+        self._buffer.extend(features)
+        self._buffered_bytes += nbytes if nbytes else len(features) * _FALLBACK_FEATURE_BYTES
+        if self._buffered_bytes >= self.memory_limit_bytes:
+            self.flush()
+
+    def flush(self):
+        """Writes buffered features to the spill file."""
+        if not self._buffer:
+            return
+        table = self._to_table(self._buffer)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, self.schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+        self.spills += 1
+        self._buffer = []
+        self._buffered_bytes = 0
+
+    def _to_table(self, features: list):
+        pa = self._pa
+        if self.has_geometry:
+            records = [f.get('properties') or {} for f in features]
+        else:
+            records = [f.get('attributes') or {} for f in features]
+
+        if self.schema is None:
+            inferred = pa.Table.from_pylist(records).schema if records else pa.schema([])
+            columns = [('geometry', pa.binary())] if self.has_geometry else []
+            for field in inferred:
+                columns.append((field.name, pa.string() if pa.types.is_null(field.type) else field.type))
+            self.schema = pa.schema(columns)
+
+        arrays = []
+        for field in self.schema:
+            if self.has_geometry and field.name == 'geometry':
+                arrays.append(self._geometry_array(features))
+                continue
+            values = [r.get(field.name) for r in records]
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrays.append(pa.array(values, from_pandas=True).cast(field.type, safe=False))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def _geometry_array(self, features: list):
+        import numpy as np
+        import shapely
+        from shapely.geometry import shape
+
+        geoms = np.array(
+            [shape(f['geometry']) if f.get('geometry') else None for f in features],
+            dtype=object,
+        )
+        return self._pa.array(shapely.to_wkb(geoms), type=self._pa.binary())
+
+    def to_frame(self, memory_map: bool = True) -> Union["gpd.GeoDataFrame", "pd.DataFrame"]:
+        """
+        Flushes remaining features and reads the spill file into a frame.
+
+        Args:
+            memory_map: Read the Parquet file through a memory map instead of
+                buffered reads.
+        """
+        import geopandas as gpd
+        import pandas as pd
+
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if not self.rows:
+            return gpd.GeoDataFrame() if self.has_geometry else pd.DataFrame()
+
+        table = self._pq.read_table(self.path, memory_map=memory_map)
+        return arrow_table_to_frame(table, self.has_geometry)
+
+    def close(self):
+        """Closes and deletes the spill file."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._buffer = []
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+from typing import TYPE_CHECKING, Optional, Union
+
+from .spill import arrow_table_to_frame
+from .utils import get_cache_dir
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pandas as pd
+
+DEFAULT_STORE_MAX_MB = 2048.0
+
+_STORE_SUFFIX = '.arrow'
+_META_KEY = b'ezesri'
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            "The local layer store requires pyarrow. Install it with: pip install ezesri[arrow]"
+        ) from e
+    return pa
+
+
+def last_edit_date(metadata: dict) -> Optional[int]:
+    """Returns the layer's ``editingInfo.lastEditDate`` (epoch ms), or None if the server does not report it."""
+    value = (metadata.get('editingInfo') or {}).get('lastEditDate')
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def store_key(url: str, metadata: dict, **query) -> Optional[str]:
+    """
+    Builds the store key for one extraction of a layer.
+
+    The key covers the layer URL, the query parameters, the layer's field
+    definitions and its last edit date, so any edit or schema change on the
+    server produces a new key. Returns None when the layer does not report a
+    last edit date, since a cached copy could then never be validated.
+    """
+    edited = last_edit_date(metadata)
+    if edited is None:
+        return None
+    fields = [(f.get('name'), f.get('type')) for f in metadata.get('fields') or []]
+    payload = {
+        'url': url.strip().rstrip('/'),
+        'query': {k: v for k, v in sorted(query.items())},
+        'fields': fields,
+        'lastEditDate': edited,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(blob).hexdigest()
+
+
+class LayerStore:
+    """
+    A size-bounded local store of extracted layers as Arrow IPC files.
+
+    Entries are read through a memory map, so reading an entry does not copy
+    its Arrow buffers; ``get()`` then copies them once into the returned frame
+    (see ``arrow_table_to_frame``). When the total size exceeds ``max_bytes`` the least
+    recently used entries are deleted.
+
+    Args:
+        directory: Where entries are kept. Defaults to ``layers/`` in the
+            ezesri cache directory.
+        max_bytes: Upper bound on the total size of all entries.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = int(DEFAULT_STORE_MAX_MB * 1024 * 1024)):
+        self.directory = directory or os.path.join(get_cache_dir(), 'layers')
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _STORE_SUFFIX)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get_table(self, key: str):
+        """Returns the memory-mapped Arrow table for ``key``, or None if it is not stored."""
+        pa = _import_pyarrow()
+        path = self._path(key)
+        try:
+            source = pa.memory_map(path, 'r')
+        except (FileNotFoundError, OSError):
+            return None
+        try:
+            table = pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            self.delete(key)
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except OSError:
+            pass
+        return table
+
+    def get(self, key: str) -> Optional[Union["gpd.GeoDataFrame", "pd.DataFrame"]]:
+        """Returns the stored GeoDataFrame or DataFrame for ``key``, or None."""
+        table = self.get_table(key)
+        if table is None:
+            return None
+        info = json.loads((table.schema.metadata or {}).get(_META_KEY, b'{}'))
+        return arrow_table_to_frame(table, bool(info.get('geometry')), crs=info.get('crs'))
+
+    def put(self, key: str, df: Union["gpd.GeoDataFrame", "pd.DataFrame"]) -> bool:
+        """
+        Stores a frame under ``key``, then evicts old entries over the size limit.
+
+        Returns False if the frame could not be converted to Arrow (for
+        example, a column of mixed types); nothing is stored in that case.
+        """
+        pa = _import_pyarrow()
+        has_geometry = hasattr(df, 'geometry') and 'geometry' in df.columns
+        try:
+            if has_geometry:
+                crs = df.crs.to_string() if df.crs is not None else None
+                table = pa.Table.from_pandas(df.drop(columns='geometry'), preserve_index=False)
+                wkb = pa.array(df.geometry.to_wkb().tolist(), type=pa.binary())
+                table = table.add_column(0, 'geometry', wkb)
+            else:
+                crs = None
+                table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return False
+
+        info = {'geometry': has_geometry, 'crs': crs}
+        metadata = dict(table.schema.metadata or {})
+        metadata[_META_KEY] = json.dumps(info).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        self.evict()
+        return True
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def entries(self) -> list:
+        """Returns ``(path, size, mtime)`` for every entry, least recently used first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_STORE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Deletes least recently used entries until the store fits in ``max_bytes``."""
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self):
+        """Deletes every entry."""
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_default_store = None
+
+
+def default_layer_store() -> LayerStore:
+    """Returns the shared LayerStore in the ezesri cache directory."""
+    global _default_store
+    directory = os.path.join(get_cache_dir(), 'layers')
+    if _default_store is None or _default_store.directory != directory:
+        _default_store = LayerStore(directory)
+    return _default_store
@@ -0,0 +1,522 @@
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+GEOMETRY_TYPES = {
+    'point': ('esriGeometryPoint', 'Point'),
+    'polyline': ('esriGeometryPolyline', 'LineString'),
+    'polygon': ('esriGeometryPolygon', 'Polygon'),
+}
+
+
+class SyntheticLayer:
+    """
+    A deterministic synthetic feature layer served by MockArcGISServer.
+
+    Args:
+        name: Layer name.
+        count: Number of features. Object IDs run from 1 to ``count``.
+        geometry: 'point', 'polyline', 'polygon', or None for a table.
+        vertices: Vertices per line or polygon ring.
+        extra_fields: Additional string attributes per feature, to bulk up rows.
+        max_record_count: Advertised maxRecordCount; queries return at most this many features.
+        max_ids_per_page: returnIdsOnly transfer limit; larger results are paged
+            with ``exceededTransferLimit`` and ``resultOffset``.
+        latency: Base seconds added to every query response.
+        latency_per_feature: Additional seconds per feature returned.
+        slow_fraction: Fraction of feature queries that are stragglers.
+        slow_latency: Extra seconds added to straggler responses.
+        failure_rate: Fraction of feature queries answered with HTTP 500.
+        max_batch_features: Feature queries for more object IDs than this return
+            an Esri "Unable to complete operation" error with HTTP 200.
+        seed: Seed for the latency and failure random draws.
+        last_edit_date: Reported as ``editingInfo.lastEditDate`` (epoch ms).
+            None leaves editingInfo out of the layer metadata.
+        time_extent: ``(start, end)`` in epoch ms. Adds an ``EVENT_DATE`` date
+            field spread evenly over the range and advertises it in
+            ``timeInfo``. Queries honour ``EVENT_DATE >= TIMESTAMP '...'`` style
+            conditions in ``where`` and min/max ``outStatistics`` on it.
+        advertised_time_extent: ``(start, end)`` reported as ``timeInfo.timeExtent``
+            instead of ``time_extent``, like the stale extent of a growing layer.
+        null_dates: With ``time_extent``, how many features (the highest object
+            IDs) have a NULL ``EVENT_DATE``. Queries honour ``EVENT_DATE IS NULL``.
+    """
+
+    def __init__(
+        self,
+        name: str = 'Synthetic',
+        count: int = 1000,
+        geometry: Optional[str] = 'point',
+        vertices: int = 5,
+        extra_fields: int = 0,
+        max_record_count: int = 2000,
+        max_ids_per_page: int = 1000000,
+        latency: float = 0.0,
+        latency_per_feature: float = 0.0,
+        slow_fraction: float = 0.0,
+        slow_latency: float = 0.0,
+        failure_rate: float = 0.0,
+        max_batch_features: Optional[int] = None,
+        seed: int = 0,
+        last_edit_date: Optional[int] = 1767225600000,
+        time_extent: Optional[Tuple[int, int]] = None,
+        advertised_time_extent: Optional[Tuple[int, int]] = None,
+        null_dates: int = 0,
+    ):
+        if geometry is not None and geometry not in GEOMETRY_TYPES:
+            raise ValueError(f"Unknown geometry type {geometry!r}. Expected one of {sorted(GEOMETRY_TYPES)} or None.")
+        self.name = name
+        self.count = count
+        self.geometry = geometry
+        self.vertices = max(2, vertices)
+        self.extra_fields = extra_fields
+        self.max_record_count = max_record_count
+        self.max_ids_per_page = max_ids_per_page
+        self.latency = latency
+        self.latency_per_feature = latency_per_feature
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.max_batch_features = max_batch_features
+        self.last_edit_date = last_edit_date
+        self.time_extent = time_extent
+        self.advertised_time_extent = advertised_time_extent
+        self.null_dates = null_dates
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def draw(self) -> float:
+        with self._random_lock:
+            return self._random.random()
+
+    @property
+    def fields(self) -> list:
+        fields = [
+            {'name': 'OBJECTID', 'type': 'esriFieldTypeOID', 'alias': 'OBJECTID'},
+            {'name': 'NAME', 'type': 'esriFieldTypeString', 'alias': 'Name', 'length': 64},
+            {'name': 'VALUE', 'type': 'esriFieldTypeDouble', 'alias': 'Value'},
+            {'name': 'CATEGORY', 'type': 'esriFieldTypeInteger', 'alias': 'Category'},
+        ]
+        for i in range(self.extra_fields):
+            fields.append({'name': f'EXTRA_{i}', 'type': 'esriFieldTypeString', 'alias': f'Extra {i}', 'length': 32})
+        if self.time_extent:
+            fields.append({'name': 'EVENT_DATE', 'type': 'esriFieldTypeDate', 'alias': 'Event date', 'length': 8})
+        return fields
+
+    def metadata(self, layer_id: int) -> dict:
+        meta = {
+            'currentVersion': 11.1,
+            'id': layer_id,
+            'name': self.name,
+            'type': 'Feature Layer' if self.geometry else 'Table',
+            'objectIdField': 'OBJECTID',
+            'maxRecordCount': self.max_record_count,
+            'supportedQueryFormats': 'JSON, geoJSON',
+            'advancedQueryCapabilities': {'supportsPagination': True},
+            'fields': self.fields,
+        }
+        if self.last_edit_date is not None:
+            meta['editingInfo'] = {'lastEditDate': self.last_edit_date}
+        if self.time_extent:
+            extent = self.advertised_time_extent or self.time_extent
+            meta['timeInfo'] = {'startTimeField': 'EVENT_DATE', 'timeExtent': list(extent)}
+        if self.geometry:
+            meta['geometryType'] = GEOMETRY_TYPES[self.geometry][0]
+            meta['spatialReference'] = {'wkid': 4326, 'latestWkid': 4326}
+            meta['extent'] = {'xmin': -120.0, 'ymin': 30.0, 'xmax': -110.0, 'ymax': 40.0,
+                              'spatialReference': {'wkid': 4326}}
+        return meta
+
+    def attributes(self, oid: int) -> dict:
+        attrs = {
+            'OBJECTID': oid,
+            'NAME': f'Feature {oid}',
+            'VALUE': oid * 1.5,
+            'CATEGORY': oid % 10,
+        }
+        for i in range(self.extra_fields):
+            attrs[f'EXTRA_{i}'] = f'value-{oid}-{i}'
+        if self.time_extent:
+            attrs['EVENT_DATE'] = self.event_date(oid)
+        return attrs
+
+    def event_date(self, oid: int) -> Optional[int]:
+        """The EVENT_DATE (epoch ms, or None) of a feature when ``time_extent`` is set."""
+        if oid > self.count - self.null_dates:
+            return None
+        start, end = self.time_extent
+        if self.count <= 1:
+            return start
+        return start + (end - start) * (oid - 1) // (self.count - 1)
+
+    def coordinates(self, oid: int):
+        """Returns GeoJSON-style coordinates for the feature's geometry."""
+        # Spread features over a 10x10 degree grid inside the advertised extent.
+        x = -120.0 + (oid % 1000) * 0.01
+        y = 30.0 + (oid // 1000 % 1000) * 0.01
+        if self.geometry == 'point':
+            return [x, y]
+        step = 0.001
+        if self.geometry == 'polyline':
+            return [[x + i * step, y + (i % 2) * step] for i in range(self.vertices)]
+        ring = [[x + i * step, y] for i in range(self.vertices - 1)]
+        ring += [[x + (self.vertices - 2) * step, y + step], [x, y + step], [x, y]]
+        return [ring]
+
+    def esri_feature(self, oid: int, with_geometry: bool) -> dict:
+        feature = {'attributes': self.attributes(oid)}
+        if self.geometry and with_geometry:
+            coords = self.coordinates(oid)
+            if self.geometry == 'point':
+                feature['geometry'] = {'x': coords[0], 'y': coords[1]}
+            elif self.geometry == 'polyline':
+                feature['geometry'] = {'paths': [coords]}
+            else:
+                feature['geometry'] = {'rings': coords}
+        return feature
+
+    def geojson_feature(self, oid: int, with_geometry: bool) -> dict:
+        geometry = None
+        if self.geometry and with_geometry:
+            geometry = {'type': GEOMETRY_TYPES[self.geometry][1], 'coordinates': self.coordinates(oid)}
+        return {'type': 'Feature', 'id': oid, 'geometry': geometry, 'properties': self.attributes(oid)}
+
+
+def _esri_filter_geometry(params: dict):
+    """Parses the geometry parameter of a query into shapely (envelopes, points and polygons)."""
+    import shapely
+    from shapely.geometry import Point, Polygon, box
+    from shapely.geometry.polygon import LinearRing
+
+    raw = params['geometry']
+    try:
+        geometry = json.loads(raw)
+    except ValueError:
+        coords = [float(c) for c in raw.split(',')]
+        return Point(coords) if len(coords) == 2 else box(*coords)
+    if 'xmin' in geometry:
+        return box(geometry['xmin'], geometry['ymin'], geometry['xmax'], geometry['ymax'])
+    if 'x' in geometry:
+        return Point(geometry['x'], geometry['y'])
+    if 'rings' in geometry:
+        # Esri rings: clockwise exteriors, counter-clockwise holes.
+        exteriors, holes = [], []
+        for ring in geometry['rings']:
+            (holes if LinearRing(ring).is_ccw else exteriors).append(Polygon(ring))
+        result = shapely.union_all(exteriors)
+        if holes:
+            result = result.difference(shapely.union_all(holes))
+        return result
+    raise ValueError(f"Unsupported filter geometry: {raw[:100]}")
+
+
+_TIME_CONDITION = re.compile(r"(\w+)\s*(>=|<=|>|<|=)\s*TIMESTAMP\s*'([^']+)'", re.IGNORECASE)
+_NULL_CONDITION = re.compile(r"(\w+)\s+IS\s+NULL", re.IGNORECASE)
+_COMPARE = {
+    '>=': lambda a, b: a >= b, '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b, '<': lambda a, b: a < b, '=': lambda a, b: a == b,
+}
+
+
+def _time_conditions(where: str) -> list:
+    """
+    Parses ``FIELD >= TIMESTAMP 'YYYY-MM-DD HH:MM:SS'`` and ``FIELD IS NULL``
+    conditions into predicates on epoch ms (None for NULL).
+    """
+    conditions = []
+    for _, op, value in _TIME_CONDITION.findall(where):
+        moment = datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        bound = int(moment.timestamp() * 1000)
+        conditions.append(lambda ms, op=op, bound=bound: ms is not None and _COMPARE[op](ms, bound))
+    if _NULL_CONDITION.search(where):
+        conditions.append(lambda ms: ms is None)
+    return conditions
+
+
+def _statistics(layer: 'SyntheticLayer', ids, statistics: list) -> dict:
+    """Answers min/max/count outStatistics over EVENT_DATE or OBJECTID."""
+    attributes = {}
+    for stat in statistics:
+        field = stat.get('onStatisticField')
+        values = [layer.event_date(oid) if (field or '').upper() == 'EVENT_DATE' else oid for oid in ids]
+        values = [v for v in values if v is not None]  # like SQL, statistics skip NULLs
+        kind = stat.get('statisticType')
+        if kind == 'count':
+            result = len(values)
+        elif not values:
+            result = None
+        else:
+            result = min(values) if kind == 'min' else max(values)
+        attributes[stat.get('outStatisticFieldName') or f'{kind}_{field}'] = result
+    return {'features': [{'attributes': attributes}]}
+
+
+def _spatial_matches(layer: SyntheticLayer, params: dict) -> list:
+    """Object IDs of ``layer`` intersecting the query's geometry filter."""
+    from shapely.geometry import shape
+
+    filter_geometry = _esri_filter_geometry(params)
+    return [
+        oid for oid in range(1, layer.count + 1)
+        if shape(layer.geojson_feature(oid, True)['geometry']).intersects(filter_geometry)
+    ]
+
+
+class MockArcGISServer:
+    """
+    A local stand-in for an ArcGIS REST FeatureServer, for offline tests and benchmarks.
+
+    Serves ``<url>?f=json`` (service), ``<url>/layers``, ``<url>/<id>`` and
+    ``<url>/<id>/query`` with ``returnIdsOnly``, ``returnCountOnly``,
+    ``objectIds``, ``resultOffset``/``resultRecordCount``, ``outStatistics``
+    (min, max, count) and ``f=json`` or ``f=geojson``. Other formats (including ``pbf``) get the Esri error a
+    server without that output format returns. Responses are gzipped for
+    clients that send ``Accept-Encoding: gzip`` unless ``compress=False``.
+
+    ``relationships`` maps a relationship ID to ``(origin layer ID,
+    destination layer ID)`` and enables ``<url>/<id>/queryRelatedRecords``.
+    Destination record ``r`` is related to origin feature
+    ``(r - 1) % origin.count + 1``, so each origin feature has about
+    ``destination.count / origin.count`` related records.
+
+    Example:
+        with MockArcGISServer({0: SyntheticLayer(count=5000)}) as server:
+            gdf = ezesri.extract_layer(server.layer_url(0))
+    """
+
+    def __init__(
+        self,
+        layers: Dict[int, SyntheticLayer],
+        service_name: str = 'Synthetic',
+        compress: bool = True,
+        relationships: Optional[Dict[int, Tuple[int, int]]] = None,
+    ):
+        self.layers = layers
+        self.compress = compress
+        self.relationships = relationships or {}
+        self.service_path = f'/arcgis/rest/services/{service_name}/FeatureServer'
+        self.request_log = []
+        self._log_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}{self.service_path}'
+
+    def layer_url(self, layer_id: int) -> str:
+        return f'{self.url}/{layer_id}'
+
+    def start(self) -> 'MockArcGISServer':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-arcgis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _log(self, method: str, path: str, params: dict):
+        with self._log_lock:
+            self.request_log.append({'method': method, 'path': path, 'params': params})
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                self._dispatch(parsed.path, parse_qs(parsed.query))
+
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf-8')
+                params = parse_qs(parsed.query)
+                params.update(parse_qs(body))
+                self._dispatch(parsed.path, params)
+
+            def _dispatch(self, path, raw_params):
+                params = {k: v[-1] for k, v in raw_params.items()}
+                server._log(self.command, path, params)
+                status, payload, content_type = server._route(path.rstrip('/'), params)
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                if server.compress and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                    body = gzip.compress(body, compresslevel=6)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return _Handler
+
+    def _route(self, path: str, params: dict):
+        json_type = 'application/json; charset=utf-8'
+        if not path.startswith(self.service_path):
+            return 404, {'error': {'code': 404, 'message': 'Not found'}}, json_type
+        rest = path[len(self.service_path):].strip('/').split('/') if path != self.service_path else []
+
+        if not rest:
+            return 200, self._service_json(), json_type
+        if rest == ['layers']:
+            return 200, {
+                'layers': [l.metadata(i) for i, l in sorted(self.layers.items()) if l.geometry],
+                'tables': [l.metadata(i) for i, l in sorted(self.layers.items()) if not l.geometry],
+            }, json_type
+
+        try:
+            layer_id = int(rest[0])
+            layer = self.layers[layer_id]
+        except (ValueError, KeyError):
+            return 200, {'error': {'code': 400, 'message': 'Invalid or missing input parameters.'}}, json_type
+
+        if len(rest) == 1:
+            meta = layer.metadata(layer_id)
+            meta['relationships'] = [
+                {'id': rel_id, 'name': self.layers[dest].name, 'relatedTableId': dest,
+                 'role': 'esriRelRoleOrigin', 'cardinality': 'esriRelCardinalityOneToMany'}
+                for rel_id, (origin, dest) in sorted(self.relationships.items()) if origin == layer_id
+            ]
+            return 200, meta, json_type
+        if rest[1:] == ['queryRelatedRecords']:
+            return self._query_related(layer_id, layer, params)
+        if rest[1:] == ['query']:
+            return self._query(layer, params)
+        return 404, {'error': {'code': 404, 'message': 'Not found'}}, json_type
+
+    def _service_json(self) -> dict:
+        return {
+            'currentVersion': 11.1,
+            'serviceDescription': 'Synthetic service for ezesri tests and benchmarks',
+            'maxRecordCount': max((l.max_record_count for l in self.layers.values()), default=1000),
+            'layers': [
+                {'id': i, 'name': l.name, 'type': 'Feature Layer',
+                 'geometryType': GEOMETRY_TYPES[l.geometry][0]}
+                for i, l in sorted(self.layers.items()) if l.geometry
+            ],
+            'tables': [{'id': i, 'name': l.name} for i, l in sorted(self.layers.items()) if not l.geometry],
+        }
+
+    def _query_related(self, layer_id: int, layer: SyntheticLayer, params: dict):
+        json_type = 'application/json; charset=utf-8'
+        try:
+            origin, dest = self.relationships[int(params.get('relationshipId'))]
+        except (TypeError, ValueError, KeyError):
+            return 200, {'error': {'code': 400, 'message': 'Invalid relationship id.'}}, json_type
+        if origin != layer_id:
+            return 200, {'error': {'code': 400, 'message': 'Invalid relationship id.'}}, json_type
+
+        related = self.layers[dest]
+        with_geometry = params.get('returnGeometry', 'true') != 'false'
+        ids = [int(x) for x in (params.get('objectIds') or '').split(',') if x]
+        groups, returned, exceeded = [], 0, False
+        for oid in ids:
+            if not 1 <= oid <= layer.count:
+                continue
+            records = []
+            for related_oid in range(oid, related.count + 1, layer.count):
+                if returned >= related.max_record_count:
+                    exceeded = True
+                    break
+                records.append(related.esri_feature(related_oid, with_geometry))
+                returned += 1
+            if records:
+                groups.append({'objectId': oid, 'relatedRecords': records})
+        payload = {'fields': related.fields, 'relatedRecordGroups': groups}
+        if exceeded:
+            payload['exceededTransferLimit'] = True
+        return 200, payload, json_type
+
+    def _query(self, layer: SyntheticLayer, params: dict):
+        json_type = 'application/json; charset=utf-8'
+        fmt = params.get('f', 'html')
+        if fmt not in ('json', 'pjson', 'geojson'):
+            return 200, {'error': {'code': 400, 'message': f"Output format '{fmt}' is not supported."}}, json_type
+
+        all_ids = range(1, layer.count + 1)
+        if params.get('geometry') and layer.geometry:
+            all_ids = _spatial_matches(layer, params)
+        conditions = _time_conditions(params.get('where') or '') if layer.time_extent else []
+        if conditions:
+            all_ids = [oid for oid in all_ids if all(test(layer.event_date(oid)) for test in conditions)]
+        if params.get('outStatistics'):
+            return 200, _statistics(layer, all_ids, json.loads(params['outStatistics'])), json_type
+        if params.get('returnCountOnly') == 'true':
+            return 200, {'count': len(all_ids)}, json_type
+
+        if params.get('returnIdsOnly') == 'true':
+            offset = int(params.get('resultOffset') or 0)
+            page = list(all_ids[offset:offset + layer.max_ids_per_page])
+            payload = {'objectIdFieldName': 'OBJECTID', 'objectIds': page}
+            if offset + len(page) < len(all_ids):
+                payload['exceededTransferLimit'] = True
+            return 200, payload, json_type
+
+        if params.get('objectIds'):
+            ids = [int(x) for x in params['objectIds'].split(',') if x]
+            ids = [oid for oid in ids if 1 <= oid <= layer.count]
+        else:
+            offset = int(params.get('resultOffset') or 0)
+            limit = int(params.get('resultRecordCount') or layer.max_record_count)
+            ids = list(all_ids[offset:offset + min(limit, layer.max_record_count)])
+
+        if layer.max_batch_features is not None and len(ids) > layer.max_batch_features:
+            return 200, {'error': {'code': 500, 'message': 'Unable to complete operation.', 'details': []}}, json_type
+        if layer.failure_rate and layer.draw() < layer.failure_rate:
+            return 500, {'error': {'code': 500, 'message': 'Internal server error'}}, json_type
+
+        delay = layer.latency + layer.latency_per_feature * len(ids)
+        if layer.slow_fraction and layer.draw() < layer.slow_fraction:
+            delay += layer.slow_latency
+        if delay:
+            time.sleep(delay)
+
+        exceeded = len(ids) > layer.max_record_count
+        ids = ids[:layer.max_record_count]
+        with_geometry = params.get('returnGeometry', 'true') != 'false'
+
+        if fmt == 'geojson':
+            payload = {
+                'type': 'FeatureCollection',
+                'features': [layer.geojson_feature(oid, with_geometry) for oid in ids],
+            }
+            if exceeded:
+                payload['properties'] = {'exceededTransferLimit': True}
+            return 200, payload, 'application/geo+json; charset=utf-8'
+
+        payload = {
+            'objectIdFieldName': 'OBJECTID',
+            'fields': layer.fields,
+            'features': [layer.esri_feature(oid, with_geometry) for oid in ids],
+        }
+        if layer.geometry:
+            payload['geometryType'] = GEOMETRY_TYPES[layer.geometry][0]
+            payload['spatialReference'] = {'wkid': 4326, 'latestWkid': 4326}
+        if exceeded:
+            payload['exceededTransferLimit'] = True
+        return 200, payload, json_type
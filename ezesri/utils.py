@@ -1,64 +1,200 @@
+import importlib
+import os
 import time
 import requests
+from requests.structures import CaseInsensitiveDict
 from typing import Tuple, List, Optional
 import json
 import threading
+from urllib.parse import urlencode, urlparse
 
-try:
-    import fiona
-except Exception:
-    fiona = None
+from .profiling import count, timed
+from .retry import RetryPolicy, circuit_breaker_for, esri_error_code, parse_retry_after
 
-try:
-    from shapely.geometry import mapping as shapely_mapping
-except Exception:
-    shapely_mapping = None
 
-def make_request(url: str, method: str = 'get', **kwargs):
+def _optional_import(name: str):
     """
-    Makes an HTTP request with retries and a delay.
+    Imports an optional dependency on first use, returning None if it is unavailable.
+
+    fiona and shapely pull in GDAL/GEOS and take a noticeable fraction of a
+    second to load, so they are only imported on the code paths that write files.
+    """
+    try:
+        return importlib.import_module(name)
+    except Exception:
+        return None
+
+# Ask for compressed responses explicitly rather than relying on the HTTP
+# library's default. ArcGIS Server gzips JSON when asked, and feature JSON
+# typically compresses 5-10x.
+ACCEPT_ENCODING = 'gzip, deflate'
+
+def get_cache_dir() -> str:
+    """
+    Returns the directory ezesri uses for persistent local state.
+
+    Defaults to ``$XDG_CACHE_HOME/ezesri`` (``~/.cache/ezesri``). Set the
+    ``EZESRI_CACHE_DIR`` environment variable to override it.
+    """
+    override = os.environ.get("EZESRI_CACHE_DIR")
+    if override:
+        return override
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ezesri")
+
+def make_request(url: str, method: str = 'get', retry_policy: Optional[RetryPolicy] = None, **kwargs):
+    """
+    Makes an HTTP request, retrying transient failures with exponential backoff.
+
+    Connection errors, timeouts, retryable HTTP statuses (429, 5xx) and Esri
+    JSON error bodies with a retryable ``error.code`` are retried; other
+    client errors fail immediately. Each host has a circuit breaker that
+    fails requests fast after repeated consecutive failures.
 
     Args:
         url: The URL to make the request to.
         method: The HTTP method to use ('get' or 'post').
+        retry_policy: Optional RetryPolicy. Defaults to the process-wide policy
+            set with set_retry_policy().
         **kwargs: Additional keyword arguments to pass to the requests method.
 
     Returns:
-        The response object.
+        The response object. A response carrying a retryable Esri error is
+        returned after the last attempt so callers can report the Esri code.
+
+    Raises:
+        requests.exceptions.RequestException: On a non-retryable HTTP error, an
+            open circuit breaker, or when all attempts fail.
     """
     if not isinstance(url, str):
         raise TypeError("URL must be a string.")
-        
-    retries = 3
-    delay = 1  # in seconds
-    
+
+    method = method.lower()
+    if method not in ('get', 'post'):
+        raise ValueError("Unsupported HTTP method.")
+
+    policy = retry_policy or _retry_policy
+    breaker = circuit_breaker_for(url, policy)
+
     if 'timeout' not in kwargs:
         kwargs['timeout'] = 30  # Default timeout of 30 seconds
 
+    headers = CaseInsensitiveDict(kwargs.get('headers') or {})
+    headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+    if method == 'post' and isinstance(kwargs.get('data'), dict):
+        kwargs['data'] = _encode_form(kwargs['data'])
+        headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+    kwargs['headers'] = headers
+
     last_exception = None
+    esri_error_response = None
+    host = urlparse(url).netloc
+
+    for attempt in range(policy.max_attempts):
+        breaker.before_request(url)
+        # Optional global rate limiter
+        if _rate_limiter is not None:
+            _rate_limiter.acquire()
 
-    for i in range(retries):
+        retry_after = None
         try:
-            # Optional global rate limiter
-            if _rate_limiter is not None:
-                _rate_limiter.acquire()
-            if method.lower() == 'get':
-                response = requests.get(url, **kwargs)
-            elif method.lower() == 'post':
-                response = requests.post(url, **kwargs)
-            else:
-                raise ValueError("Unsupported HTTP method.")
-            
+            with timed('http', host=host, method=method) as tags:
+                if method == 'get':
+                    response = requests.get(url, **kwargs)
+                else:
+                    response = requests.post(url, **kwargs)
+                count('requests', host=host)
+                if not kwargs.get('stream'):
+                    _record_transfer(response, host, tags)
             response.raise_for_status()
-            return response
         except requests.exceptions.RequestException as e:
+            if not policy.is_retryable_exception(e):
+                # The server answered; a client error says nothing about its health.
+                breaker.record_success()
+                raise
+            breaker.record_failure()
             last_exception = e
-            print(f"Request to {url} failed: {e}. Retrying in {delay} seconds... ({i + 1}/{retries})")
+            esri_error_response = None
+            retry_after = parse_retry_after(getattr(e, 'response', None))
+        else:
+            code = None if kwargs.get('stream') else esri_error_code(response)
+            if code is None or not policy.is_retryable_esri_code(code):
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            esri_error_response = response
+            last_exception = f"Esri error code {code}"
+            retry_after = parse_retry_after(response)
+
+        if attempt + 1 < policy.max_attempts:
+            count('retries', host=host)
+            delay = policy.compute_delay(attempt, retry_after)
+            print(f"Request to {url} failed: {last_exception}. Retrying in {delay:.1f} seconds... ({attempt + 1}/{policy.max_attempts})")
             time.sleep(delay)
-    
+
+    if esri_error_response is not None:
+        return esri_error_response
+
     # If all retries fail, raise the last exception
     raise requests.exceptions.RequestException(f"All retries failed for {url}: {last_exception}")
 
+def _encode_form(data: dict) -> str:
+    """
+    Form-encodes a POST body, leaving commas unescaped.
+
+    Query parameters such as ``objectIds`` are long comma-separated lists;
+    escaping each comma as ``%2C`` would make those bodies up to 40% larger.
+    ArcGIS Server only accepts query parameters form-encoded (not as JSON),
+    so this keeps the format and trims the size.
+    """
+    return urlencode(data, doseq=True, safe=',')
+
+def _record_transfer(response, host: str, tags: dict):
+    """
+    Counts a response's decoded and on-the-wire sizes.
+
+    requests decompresses gzip/deflate bodies incrementally while reading
+    them, so the compressed body is never held in memory; the wire size comes
+    from the underlying urllib3 response, or Content-Length when unavailable.
+    """
+    content = response.content or b''
+    decoded = len(content)
+    wire = None
+    raw = getattr(response, 'raw', None)
+    tell = getattr(raw, 'tell', None)
+    if callable(tell):
+        try:
+            wire = tell()
+        except Exception:
+            wire = None
+    if not isinstance(wire, int) or wire <= 0:
+        length = (getattr(response, 'headers', None) or {}).get('Content-Length')
+        wire = int(length) if isinstance(length, str) and length.isdigit() else decoded
+
+    encoding = (getattr(response, 'headers', None) or {}).get('Content-Encoding') or 'identity'
+    count('bytes', decoded, host=host)
+    count('wire_bytes', wire, host=host)
+    tags.update(
+        encoding=encoding,
+        bytes=decoded,
+        wire_bytes=wire,
+        compression_ratio=round(decoded / wire, 2) if wire else None,
+    )
+    request = getattr(response, 'request', None)
+    body = getattr(request, 'body', None)
+    if isinstance(body, (bytes, str)):
+        tags['request_bytes'] = len(body)
+
+_retry_policy = RetryPolicy()
+
+def set_retry_policy(policy: Optional[RetryPolicy]):
+    """
+    Set the process-wide retry policy used by make_request.
+    Pass None to restore the default policy.
+    """
+    global _retry_policy
+    _retry_policy = policy or RetryPolicy()
+
 def truncate_field_names(gdf):
     """Truncates field names in a GeoDataFrame to 10 characters for shapefiles."""
     original_columns = list(gdf.columns)
@@ -94,6 +230,7 @@ def has_filegdb_write_support() -> Tuple[bool, str]:
         (supported, message): A tuple where 'supported' indicates if FileGDB write
         is available, and 'message' contains guidance when not supported.
     """
+    fiona = _optional_import("fiona")
     if fiona is None:
         return False, "Fiona is not available. Install geopandas with fiona/GDAL support."
 
@@ -131,7 +268,7 @@ class _SimpleRateLimiter:
         self._next_allowed = time.monotonic()
 
     def acquire(self):
-        with self._lock:
+        with timed('rate_limit_wait'), self._lock:
             now = time.monotonic()
             if now < self._next_allowed:
                 sleep_for = self._next_allowed - now
@@ -139,6 +276,11 @@ class _SimpleRateLimiter:
                 now = time.monotonic()
             self._next_allowed = now + self.interval
 
+    def has_capacity(self) -> bool:
+        """True when a request could be sent now without waiting."""
+        with self._lock:
+            return time.monotonic() >= self._next_allowed
+
 _rate_limiter: Optional[_SimpleRateLimiter] = None
 
 def set_rate_limit(max_per_second: Optional[float]):
@@ -152,6 +294,14 @@ def set_rate_limit(max_per_second: Optional[float]):
     else:
         _rate_limiter = _SimpleRateLimiter(max_per_second)
 
+def rate_limit_has_capacity() -> bool:
+    """
+    Returns True when the global rate limiter (if any) would let a request through now.
+    Used to keep optional extra requests, such as hedges, within the rate limit.
+    """
+    limiter = _rate_limiter
+    return limiter is None or limiter.has_capacity()
+
 def drop_empty_geometries(gdf):
     """
     Drops rows with null or empty geometries. Returns (clean_gdf, dropped_count).
@@ -195,6 +345,8 @@ def write_ndjson(df, output_path: str):
     is_spatial = hasattr(df, "geometry")
     use_stdout = (not output_path) or (output_path == "-")
 
+    shapely_geometry = _optional_import("shapely.geometry") if is_spatial else None
+    shapely_mapping = shapely_geometry.mapping if shapely_geometry is not None else None
     if is_spatial and shapely_mapping is None:
         raise RuntimeError("shapely is required for NDJSON export of spatial layers.")
 
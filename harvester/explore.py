@@ -5,9 +5,11 @@ Explore the ArcGIS Online portal search API to discover public Feature/Map servi
 and evaluate what kind of data is available for a potential directory.
 
 Usage:
-    python harvester/explore.py
+    python harvester/explore.py          # incremental: only changed items are re-enriched
+    python harvester/explore.py --full   # re-enrich every item
 """
 
+import argparse
 import json
 import requests
 from datetime import datetime
@@ -15,12 +17,17 @@ from pathlib import Path
 from typing import Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from service_store import DEFAULT_STORE_PATH, ServiceStore, normalize_url
+
 # ArcGIS Online portal search endpoint
 PORTAL_SEARCH_URL = "https://www.arcgis.com/sharing/rest/search"
 
 # Output directory for sample results
 OUTPUT_DIR = Path(__file__).parent / "sample_output"
 
+# Portal search pages per query requested concurrently
+SEARCH_PAGE_WORKERS = 4
+
 
 def search_portal(
     query: str,
@@ -56,79 +63,148 @@ def search_portal(
     return response.json()
 
 
-def search_all(query: str, max_results: int = 500) -> list[dict]:
+def search_all(query: str, max_results: int = 500, max_workers: int = SEARCH_PAGE_WORKERS) -> list[dict]:
     """
     Search portal with automatic pagination to get more results.
     
+    The first page reports the total, so the remaining pages are requested
+    concurrently and reassembled in order. A page that fails raises, so a
+    truncated result is never mistaken for a complete one.
+    
     Args:
         query: Portal search query string
         max_results: Maximum total results to fetch
+        max_workers: Number of pages fetched in parallel
     
     Returns:
         List of all result items
+    
+    Raises:
+        requests.exceptions.RequestException: If any page fails
     """
-    all_results = []
-    start = 1
+    first = search_portal(query, num=100, start=1)
+    all_results = list(first.get("results", []))
     
-    while len(all_results) < max_results:
-        data = search_portal(query, num=100, start=start)
-        results = data.get("results", [])
-        
-        if not results:
-            break
-            
-        all_results.extend(results)
-        
-        # Check if there are more results
-        next_start = data.get("nextStart", -1)
-        if next_start == -1 or next_start <= start:
-            break
-        start = next_start
+    total = min(first.get("total", 0), max_results)
+    if first.get("nextStart", -1) == -1 or len(all_results) >= total:
+        return all_results[:max_results]
+    
+    starts = list(range(len(all_results) + 1, total + 1, 100))
+    pages = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(search_portal, query, 100, start): start for start in starts}
+        for future in as_completed(futures):
+            pages[futures[future]] = future.result().get("results", [])
+    
+    for start in starts:
+        all_results.extend(pages[start])
     
     return all_results[:max_results]
 
 
-def get_service_metadata(service_url: str, timeout: int = 15) -> Optional[dict]:
+def fetch_service_metadata(service_url: str, timeout: int = 15) -> tuple[Optional[int], Optional[dict], Optional[str]]:
     """
-    Fetch metadata from an Esri REST service endpoint.
+    Fetch metadata from an Esri REST service endpoint, reporting why it failed.
     
     Args:
         service_url: URL to the FeatureServer or MapServer
         timeout: Request timeout in seconds
     
     Returns:
-        Service metadata dict or None if failed
+        (HTTP status or None if no response, metadata dict or None, error message or None)
     """
+    # Clean URL and add JSON format
+    url = service_url.rstrip("/")
+    if not url.endswith("?f=pjson"):
+        url = f"{url}?f=pjson"
+    
     try:
-        # Clean URL and add JSON format
-        url = service_url.rstrip("/")
-        if not url.endswith("?f=pjson"):
-            url = f"{url}?f=pjson"
-        
         response = requests.get(url, timeout=timeout)
-        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        return None, None, str(e)
+    
+    if not response.ok:
+        return response.status_code, None, f"HTTP {response.status_code}"
+    
+    try:
         data = response.json()
-        
-        # Check for error response
-        if "error" in data:
-            return None
-            
-        return data
-    except Exception:
-        return None
+    except ValueError:
+        return response.status_code, None, "Response is not JSON"
+    
+    # Check for error response
+    if not isinstance(data, dict):
+        return response.status_code, None, "Unexpected response"
+    if "error" in data:
+        error = data["error"] if isinstance(data["error"], dict) else {"message": data["error"]}
+        return response.status_code, None, f"Esri error {error.get('code')}: {error.get('message')}"
+    
+    return response.status_code, data, None
 
 
-def enrich_result(item: dict) -> dict:
+def get_service_metadata(service_url: str, timeout: int = 15) -> Optional[dict]:
     """
-    Enrich a portal search result with service-level metadata.
+    Fetch metadata from an Esri REST service endpoint.
+    
+    Args:
+        service_url: URL to the FeatureServer or MapServer
+        timeout: Request timeout in seconds
+    
+    Returns:
+        Service metadata dict or None if failed
+    """
+    _, data, _ = fetch_service_metadata(service_url, timeout=timeout)
+    return data
+
+
+def summarize_service(service_meta: dict) -> dict:
+    """
+    Keep the parts of a service's metadata used by the directory.
+    
+    Args:
+        service_meta: Service metadata from get_service_metadata()
+    
+    Returns:
+        Service summary dict
+    """
+    return {
+        "serviceDescription": service_meta.get("serviceDescription"),
+        "description": service_meta.get("description"),
+        "capabilities": service_meta.get("capabilities"),
+        "maxRecordCount": service_meta.get("maxRecordCount"),
+        "supportedQueryFormats": service_meta.get("supportedQueryFormats"),
+        "supportsQuery": service_meta.get("supportsQuery"),
+        "layers": [
+            {
+                "id": layer.get("id"),
+                "name": layer.get("name"),
+                "type": layer.get("type"),
+                "geometryType": layer.get("geometryType"),
+            }
+            for layer in service_meta.get("layers", [])
+        ],
+        "tables": [
+            {
+                "id": table.get("id"),
+                "name": table.get("name"),
+            }
+            for table in service_meta.get("tables", [])
+        ],
+        "fullExtent": service_meta.get("fullExtent"),
+        "spatialReference": service_meta.get("spatialReference"),
+    }
+
+
+def item_fields(item: dict) -> dict:
+    """
+    Keep the portal search fields of a result item used by the directory.
     
     Args:
         item: Portal search result item
     
     Returns:
-        Enriched item with service metadata
+        Item dict without service metadata
     """
-    enriched = {
+    return {
         "id": item.get("id"),
         "title": item.get("title"),
         "snippet": item.get("snippet"),
@@ -149,38 +225,26 @@ def enrich_result(item: dict) -> dict:
         "accessInformation": item.get("accessInformation"),
         "licenseInfo": item.get("licenseInfo"),
     }
+
+
+def enrich_result(item: dict) -> dict:
+    """
+    Enrich a portal search result with service-level metadata.
+    
+    Args:
+        item: Portal search result item
+    
+    Returns:
+        Enriched item with service metadata
+    """
+    enriched = item_fields(item)
     
     # Fetch service metadata if URL exists
     service_url = item.get("url")
     if service_url:
         service_meta = get_service_metadata(service_url)
         if service_meta:
-            enriched["service"] = {
-                "serviceDescription": service_meta.get("serviceDescription"),
-                "description": service_meta.get("description"),
-                "capabilities": service_meta.get("capabilities"),
-                "maxRecordCount": service_meta.get("maxRecordCount"),
-                "supportedQueryFormats": service_meta.get("supportedQueryFormats"),
-                "supportsQuery": service_meta.get("supportsQuery"),
-                "layers": [
-                    {
-                        "id": layer.get("id"),
-                        "name": layer.get("name"),
-                        "type": layer.get("type"),
-                        "geometryType": layer.get("geometryType"),
-                    }
-                    for layer in service_meta.get("layers", [])
-                ],
-                "tables": [
-                    {
-                        "id": table.get("id"),
-                        "name": table.get("name"),
-                    }
-                    for table in service_meta.get("tables", [])
-                ],
-                "fullExtent": service_meta.get("fullExtent"),
-                "spatialReference": service_meta.get("spatialReference"),
-            }
+            enriched["service"] = summarize_service(service_meta)
     
     return enriched
 
@@ -482,13 +546,92 @@ def run_exploration(
     }
 
 
-def harvest_all_categories(max_results: int = 500, enrich: bool = True) -> dict:
+def fetch_services(store: ServiceStore, candidates: dict[str, Optional[int]], max_workers: int = 10) -> int:
+    """
+    Fetch service metadata for many URLs in parallel and record it in the store.
+    
+    Args:
+        store: ServiceStore receiving each success or failure
+        candidates: Dict mapping service URL to its portal item's ``modified``
+        max_workers: Number of parallel threads
+    
+    Returns:
+        Number of services fetched successfully
+    """
+    succeeded = 0
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_service_metadata, url): url for url in candidates}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                status, service_meta, error = future.result()
+            except Exception as e:
+                status, service_meta, error = None, None, str(e)
+            if service_meta:
+                store.record_success(url, candidates[url], status, summarize_service(service_meta))
+                succeeded += 1
+            else:
+                store.record_failure(url, candidates[url], status, error or "Unknown error")
+    
+    store.commit()
+    return succeeded
+
+
+def search_categories(max_results: int, max_workers: int = 8) -> dict[str, list[dict]]:
+    """
+    Run every SAMPLE_QUERIES search concurrently.
+    
+    Args:
+        max_results: Maximum results to fetch per category
+        max_workers: Number of categories searched in parallel
+    
+    Returns:
+        Dict mapping category key to its raw search results (None if the search failed)
+    """
+    found = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(search_all, config["query"], max_results): key
+            for key, config in SAMPLE_QUERIES.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                found[key] = future.result()
+                print(f"  {key}: {len(found[key])} results")
+            except Exception as e:
+                print(f"  {key}: search failed ({e})")
+                found[key] = None
+    
+    return found
+
+
+def harvest_all_categories(
+    max_results: int = 500,
+    enrich: bool = True,
+    incremental: bool = True,
+    max_workers: int = 10,
+    store_path: Optional[Path] = None
+) -> dict:
     """
     Harvest all categories defined in SAMPLE_QUERIES.
     
+    Category searches run concurrently, and results are written to the
+    ServiceStore as well as the per-category JSON files. Service URLs are
+    deduped across categories, so a service found by several queries is
+    fetched once. With ``incremental``, only services that are new, whose
+    portal item changed, whose metadata is old, or whose failure backoff has
+    passed are fetched (see ServiceStore.due_services()); the rest reuse
+    their stored metadata.
+    
     Args:
         max_results: Maximum results to fetch per category (default: 500)
         enrich: Whether to fetch service-level metadata (default: True)
+        incremental: Whether to skip services that are up to date or backing off (default: True)
+        max_workers: Number of parallel threads for service metadata
+        store_path: ServiceStore database (default: sample_output/state/services.sqlite)
     
     Returns:
         Dictionary with all category results
@@ -498,16 +641,56 @@ def harvest_all_categories(max_results: int = 500, enrich: bool = True) -> dict:
     print(f"Harvesting {len(SAMPLE_QUERIES)} categories with max {max_results} results each")
     print("=" * 60)
     
-    all_results = {}
-    
-    for query_key in SAMPLE_QUERIES.keys():
-        results = run_exploration(query_key, max_results=max_results, enrich=enrich)
-        all_results[query_key] = results
+    print("\nSearching ArcGIS Online portal...")
+    found = search_categories(max_results)
+    
+    # One entry per service URL across all categories
+    unique = {}
+    for items in found.values():
+        for item in items or []:
+            if item.get("url"):
+                unique.setdefault(normalize_url(item["url"]), item)
+    total_items = sum(len(items or []) for items in found.values())
+    print(f"\n{total_items} results, {len(unique)} unique service URLs")
+    
+    with ServiceStore(store_path or DEFAULT_STORE_PATH) as store:
+        if enrich:
+            candidates = {item["url"]: item.get("modified") for item in unique.values()}
+            due = store.due_services(candidates, full=not incremental)
+            print(f"Fetching {len(due)} new, changed or retryable services ({len(candidates) - len(due)} up to date or backing off)...")
+            succeeded = fetch_services(store, {url: candidates[url] for url in due}, max_workers=max_workers)
+            print(f"Done enriching: {succeeded} fetched, {len(due) - succeeded} failed")
+        
+        summaries = store.summaries(list(unique))
+        timestamp = datetime.now().isoformat()
+        all_results = {}
         
-        # Save individual results
-        filename = f"{query_key}.json"
-        path = save_results(results, filename)
-        print(f"Saved to: {path}")
+        for query_key, config in SAMPLE_QUERIES.items():
+            items = [item_fields(item) for item in found.get(query_key) or []]
+            if found.get(query_key) is not None:
+                store.save_category(query_key, items)
+            
+            enriched_items = []
+            for item in items:
+                service = summaries.get(normalize_url(item["url"])) if item.get("url") else None
+                enriched_items.append({**item, "service": service} if service else item)
+            
+            results = {
+                "query": config["query"],
+                "description": config["description"],
+                "timestamp": timestamp,
+                "summary": summarize_results(enriched_items),
+                "items": enriched_items,
+            }
+            all_results[query_key] = results
+            
+            # Save individual results
+            filename = f"{query_key}.json"
+            path = save_results(results, filename)
+            print(f"Saved to: {path}")
+        
+        store.commit()
+        stats = store.stats()
     
     # Save combined results
     combined_path = save_results(
@@ -516,6 +699,7 @@ def harvest_all_categories(max_results: int = 500, enrich: bool = True) -> dict:
     )
     print(f"\n{'='*60}")
     print(f"Combined results saved to: {combined_path}")
+    print(f"Service store: {stats['ok']} working, {stats['failing']} failing ({stats['backing_off']} backing off)")
     print(f"{'='*60}")
     
     return all_results
@@ -530,7 +714,11 @@ def main():
     # CHANGE THIS NUMBER to control how many services are fetched per category
     MAX_RESULTS_PER_CATEGORY = 1000
     
-    harvest_all_categories(max_results=MAX_RESULTS_PER_CATEGORY, enrich=True)
+    parser = argparse.ArgumentParser(description="Harvest public Esri services from ArcGIS Online")
+    parser.add_argument("--full", action="store_true", help="fetch every service again, ignoring stored metadata and failure backoff")
+    args = parser.parse_args()
+    
+    harvest_all_categories(max_results=MAX_RESULTS_PER_CATEGORY, enrich=True, incremental=not args.full)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,48 @@
 """
 Generate a markdown directory from harvested ArcGIS services.
 
-Reads JSON files from sample_output/ and produces a clean markdown catalog.
+Reads the harvest from the service store written by explore.py (or, for
+older harvests, the JSON files in sample_output/) and produces a clean
+markdown catalog.
 
 Usage:
     python harvester/generate_directory.py
 """
 
+import hashlib
 import json
 import re
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable, Iterator
+
+from service_store import DEFAULT_STORE_PATH, ServiceStore
 
 OUTPUT_DIR = Path(__file__).parent / "sample_output"
 DIRECTORY_FILE = Path(__file__).parent / "directory.md"
-# Web app catalog location
-CATALOG_JSON_FILE = Path(__file__).parent.parent / "web" / "app" / "public" / "catalog.json"
+# Web app catalog location: summary.json, top.json, top-<sort>.json,
+# categories/<key>.json and index/<shard>.json (see write_sharded_catalog())
+CATALOG_DIR = Path(__file__).parent.parent / "web" / "app" / "public" / "catalog"
+
+# Services shipped in top.json (most viewed) for the directory's first paint,
+# and in top-<sort>.json for the other sorts of the unfiltered directory
+TOP_SERVICES = 100
+
+# Same rule as the directory's A-Z sort: ignore leading special characters
+TITLE_SORT_PREFIX = re.compile(r"^[^a-zA-Z0-9]+")
+
+# Orderings of the unfiltered directory, as sort keys over services that are
+# already sorted by views (None keeps that order; sorted() is stable)
+TOP_SORTS = {
+    "views": None,
+    "title": lambda service: TITLE_SORT_PREFIX.sub("", service["title"]).lower(),
+    "layers": lambda service: -service["layerCount"],
+}
+
+# Search tokens: runs of letters and digits. The web directory splits
+# queries with the same rule (/[\p{L}\p{N}]+/gu).
+SEARCH_TOKEN = re.compile(r"[^\W_]+")
 
 
 US_STATES = {
@@ -125,6 +152,44 @@ TITLE_TRANSLATIONS = {
 }
 
 
+STATE_TO_ABBREV = {name.lower(): abbrev for abbrev, name in ABBREV_TO_STATE.items()}
+
+# Tags that never name a place
+GENERIC_TAGS = frozenset({
+    "open data", "opendata", "arcgis", "gis", "data", "boundaries",
+    "parcels", "parcel", "zoning", "government", "police", "crime",
+    "military", "environment", "updated", "",
+})
+
+# Patterns are compiled once; the catalog build runs them for every item
+CITY_OF_TAG = re.compile(r"city of (.+)")
+
+# "© City of X" or "© X County" patterns, with whether the match is a county name
+ATTRIBUTION_PATTERNS = [
+    (re.compile(r"©\s*(?:The\s+)?City\s+(?:of\s+)?([A-Za-z\s]+?)(?:\s+\d{4}|\s*$|,)", re.IGNORECASE), False),
+    (re.compile(r"©\s*(?:The\s+)?County\s+of\s+([A-Za-z\s]+?)(?:\s+\d{4}|\s*$|,)", re.IGNORECASE), True),
+    (re.compile(r"©\s*([A-Za-z\s]+?)\s+County(?:\s+\d{4}|\s*$|,)", re.IGNORECASE), False),
+    (re.compile(r"©\s*([A-Za-z\s]+?)\s+(?:City|Government|Council)(?:\s+\d{4}|\s*$|,)", re.IGNORECASE), False),
+]
+
+OWNER_PATTERNS = [
+    # "CityOfBoston" or "City_of_Boston" -> "Boston"
+    (re.compile(r"(?:CityOf|City_of_|CityOf_)([A-Za-z]+)", re.IGNORECASE), None),
+    # "BostonGIS" or "Boston_GIS" -> "Boston"
+    (re.compile(r"^([A-Za-z]+?)(?:_)?(?:GIS|OpenData|Data|Maps|Open)(?:_Admin)?$", re.IGNORECASE), None),
+    # "CountyOfRiverside" -> "Riverside County"
+    (re.compile(r"(?:CountyOf|County_of_)([A-Za-z]+)", re.IGNORECASE), "County"),
+    # "RiversideCounty" -> "Riverside County"
+    (re.compile(r"^([A-Za-z]+)County$", re.IGNORECASE), "County"),
+    # State DOT patterns "TXDOT" -> "Texas"
+    (re.compile(r"^([A-Z]{2})(?:DOT|DEQ|DNR|DEM|DEP|DEC)$", re.IGNORECASE), "state"),
+]
+
+OWNER_SUFFIX = re.compile(r"(?:GIS|OpenData|_admin|Admin|Data|_)$", re.IGNORECASE)
+OWNER_SEPARATORS = re.compile(r"[_.]")
+TITLE_SUFFIX = re.compile(r"(?:_view|_public|_open_data)$", re.IGNORECASE)
+
+
 def extract_place(item: dict) -> str:
     """
     Extract a place/organization name from the item.
@@ -135,6 +200,9 @@ def extract_place(item: dict) -> str:
     3. accessInformation © attribution
     4. Owner name patterns
     5. Cleaned owner name fallback
+    
+    Each step is memoized on its own input (owner, tag list, attribution),
+    since the same publishers and attributions recur across thousands of items.
     """
     owner = item.get("owner", "")
     tags = item.get("tags", [])
@@ -145,7 +213,7 @@ def extract_place(item: dict) -> str:
         return KNOWN_OWNERS[owner]
     
     # 2. Scan tags for location info (best signal)
-    location_from_tags = _extract_location_from_tags(tags)
+    location_from_tags = _extract_location_from_tags(tuple(tags)) if tags else None
     if location_from_tags:
         return location_from_tags
     
@@ -154,22 +222,28 @@ def extract_place(item: dict) -> str:
     if location_from_access:
         return location_from_access
     
-    # 4. Parse owner name patterns
+    # 4-5. Parse owner name patterns, then fall back to the cleaned owner name
+    return _place_from_owner(owner)
+
+
+@lru_cache(maxsize=None)
+def _place_from_owner(owner: str) -> str:
+    """Owner-only part of extract_place() (steps 4 and 5), memoized per owner."""
     location_from_owner = _extract_location_from_owner(owner)
     if location_from_owner:
         return location_from_owner
     
-    # 5. Fall back to cleaned owner name
     if owner:
-        cleaned = re.sub(r"(?:GIS|OpenData|_admin|Admin|Data|_)$", "", owner, flags=re.IGNORECASE)
-        cleaned = re.sub(r"[_.]", " ", cleaned).strip()
+        cleaned = OWNER_SUFFIX.sub("", owner)
+        cleaned = OWNER_SEPARATORS.sub(" ", cleaned).strip()
         if cleaned:
             return cleaned
     
     return "Unknown"
 
 
-def _extract_location_from_tags(tags: list) -> str | None:
+@lru_cache(maxsize=65536)
+def _extract_location_from_tags(tags: tuple) -> str | None:
     """Extract location from tags, prioritizing specific locations over states."""
     if not tags:
         return None
@@ -185,9 +259,7 @@ def _extract_location_from_tags(tags: list) -> str | None:
         tag_lower = tag_clean.lower()
         
         # Skip generic/unhelpful tags
-        if tag_lower in ["open data", "opendata", "arcgis", "gis", "data", "boundaries", 
-                         "parcels", "parcel", "zoning", "government", "police", "crime",
-                         "military", "environment", "updated", ""]:
+        if tag_lower in GENERIC_TAGS:
             continue
         
         # Check for county pattern
@@ -196,8 +268,7 @@ def _extract_location_from_tags(tags: list) -> str | None:
             continue
         
         # Check for "City of X" pattern
-        city_match = re.match(r"city of (.+)", tag_lower)
-        if city_match:
+        if CITY_OF_TAG.match(tag_lower):
             cities.append(tag_clean.title())
             continue
         
@@ -232,32 +303,21 @@ def _extract_location_from_tags(tags: list) -> str | None:
 
 def _abbreviate_state(state_name: str) -> str:
     """Convert full state name to abbreviation."""
-    for abbrev, name in ABBREV_TO_STATE.items():
-        if name.lower() == state_name.lower():
-            return abbrev
-    return state_name
+    return STATE_TO_ABBREV.get(state_name.lower(), state_name)
 
 
+@lru_cache(maxsize=65536)
 def _extract_location_from_attribution(access_info: str) -> str | None:
     """Extract location from © attribution text."""
     if not access_info:
         return None
     
-    # Look for "© City of X" or "© X County" patterns
-    patterns = [
-        r"©\s*(?:The\s+)?City\s+(?:of\s+)?([A-Za-z\s]+?)(?:\s+\d{4}|\s*$|,)",
-        r"©\s*(?:The\s+)?County\s+of\s+([A-Za-z\s]+?)(?:\s+\d{4}|\s*$|,)",
-        r"©\s*([A-Za-z\s]+?)\s+County(?:\s+\d{4}|\s*$|,)",
-        r"©\s*([A-Za-z\s]+?)\s+(?:City|Government|Council)(?:\s+\d{4}|\s*$|,)",
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, access_info, re.IGNORECASE)
+    for pattern, is_county_of in ATTRIBUTION_PATTERNS:
+        match = pattern.search(access_info)
         if match:
             place = match.group(1).strip()
             if place and len(place) > 2:
-                # Check if it's a county pattern
-                if "county of" in pattern.lower():
+                if is_county_of:
                     return f"{place} County"
                 return place.title()
     
@@ -269,21 +329,8 @@ def _extract_location_from_owner(owner: str) -> str | None:
     if not owner:
         return None
     
-    patterns = [
-        # "CityOfBoston" or "City_of_Boston" -> "Boston"
-        (r"(?:CityOf|City_of_|CityOf_)([A-Za-z]+)", None),
-        # "BostonGIS" or "Boston_GIS" -> "Boston"
-        (r"^([A-Za-z]+?)(?:_)?(?:GIS|OpenData|Data|Maps|Open)(?:_Admin)?$", None),
-        # "CountyOfRiverside" -> "Riverside County"
-        (r"(?:CountyOf|County_of_)([A-Za-z]+)", "County"),
-        # "RiversideCounty" -> "Riverside County"
-        (r"^([A-Za-z]+)County$", "County"),
-        # State DOT patterns "TXDOT" -> "Texas"
-        (r"^([A-Z]{2})(?:DOT|DEQ|DNR|DEM|DEP|DEC)$", "state"),
-    ]
-    
-    for pattern, suffix in patterns:
-        match = re.search(pattern, owner, re.IGNORECASE)
+    for pattern, suffix in OWNER_PATTERNS:
+        match = pattern.search(owner)
         if match:
             place = match.group(1)
             if suffix == "County":
@@ -316,7 +363,7 @@ def extract_subject(item: dict) -> str:
     # Use title, truncated if needed
     if title:
         # Remove common prefixes/suffixes
-        subject = re.sub(r"(?:_view|_public|_open_data)$", "", title, flags=re.IGNORECASE)
+        subject = TITLE_SUFFIX.sub("", title)
         subject = subject.replace("_", " ")
         # Truncate long titles
         if len(subject) > 60:
@@ -335,10 +382,21 @@ def extract_subject(item: dict) -> str:
 
 def load_results() -> dict[str, list[dict]]:
     """
-    Load all JSON result files from sample_output.
+    Load the harvested results.
+    
+    Reads the service store when explore.py has written one, so service
+    metadata is not re-read from the per-category JSON dumps. Falls back to
+    all JSON result files in sample_output.
     
     Returns dict mapping category name to list of items.
     """
+    if DEFAULT_STORE_PATH.exists():
+        return load_results_from_store()
+    return load_json_results()
+
+
+def load_json_results() -> dict[str, list[dict]]:
+    """Load all JSON result files from sample_output (harvests made before the service store)."""
     results = {}
     
     for json_file in OUTPUT_DIR.glob("*.json"):
@@ -361,103 +419,221 @@ def load_results() -> dict[str, list[dict]]:
     return results
 
 
-def dedupe_by_url(items: list[dict]) -> list[dict]:
-    """Remove duplicate items based on URL."""
-    seen_urls = set()
-    unique = []
-    for item in items:
-        url = item.get("url", "")
-        if url and url not in seen_urls:
-            seen_urls.add(url)
-            unique.append(item)
-    return unique
+def load_results_from_store(path: Path = DEFAULT_STORE_PATH) -> dict[str, list[dict]]:
+    """Load category results, with their service metadata, from the service store."""
+    results = {}
+    for category, item in iter_results_from_store(path):
+        results.setdefault(category, []).append(item)
+    return results
 
 
-def generate_markdown(results: dict[str, list[dict]]) -> str:
+def iter_results_from_store(path: Path = DEFAULT_STORE_PATH) -> Iterator[tuple[str, dict]]:
+    """Stream ``(category, item)`` pairs from the service store, one row at a time."""
+    with ServiceStore(path) as store:
+        yield from store.category_items()
+
+
+def iter_results() -> Iterator[tuple[str, dict]]:
     """
-    Generate markdown content from categorized results.
+    Stream ``(category, item)`` pairs of the harvest.
+    
+    From the service store, items are decoded one row at a time. The JSON
+    fallback still loads its files, since a category's largest file wins.
     """
-    lines = []
-    
-    # Header
-    lines.append("# Esri Public Services Directory")
-    lines.append("")
-    lines.append(f"*Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}*")
-    lines.append("")
-    
-    # Summary stats
-    total_services = sum(len(items) for items in results.values())
-    total_layers = sum(
-        len(item.get("service", {}).get("layers", []))
-        for items in results.values()
-        for item in items
-    )
-    total_views = sum(
-        item.get("numViews", 0)
-        for items in results.values()
-        for item in items
-    )
-    
-    lines.append("## Summary")
-    lines.append("")
-    lines.append(f"| Metric | Count |")
-    lines.append("|--------|-------|")
-    lines.append(f"| Categories | {len(results)} |")
-    lines.append(f"| Services | {total_services:,} |")
-    lines.append(f"| Total layers | {total_layers:,} |")
-    lines.append(f"| Combined views | {total_views:,} |")
-    lines.append("")
-    
-    # Category breakdown
-    lines.append("### By category")
-    lines.append("")
-    lines.append("| Category | Services | Layers |")
-    lines.append("|----------|----------|--------|")
-    
-    for category, items in sorted(results.items()):
-        layer_count = sum(
-            len(item.get("service", {}).get("layers", []))
-            for item in items
-        )
-        display_name = category.replace("_", " ").title()
-        lines.append(f"| {display_name} | {len(items)} | {layer_count} |")
-    
-    lines.append("")
-    lines.append("---")
-    lines.append("")
-    
-    # Services by category
-    for category, items in sorted(results.items()):
-        display_name = category.replace("_", " ").title()
-        lines.append(f"## {display_name}")
-        lines.append("")
+    if DEFAULT_STORE_PATH.exists():
+        yield from iter_results_from_store()
+        return
+    for category, items in load_json_results().items():
+        for item in items:
+            yield category, item
+
+
+class CatalogBuilder:
+    """
+    Builds the markdown directory and the JSON catalog in one pass over the harvest.
+    
+    add() takes one ``(category, item)`` at a time and keeps only what the
+    outputs need: the most viewed row per URL for each markdown table, one
+    catalog entry per service URL (the first category that found it wins),
+    and running totals per category. Place and subject are only extracted
+    for items that end up in an output.
+    """
+    
+    def __init__(self):
+        self.services = []
+        self._seen_urls = set()
+        # Per category, over unique services (catalog)
+        self.category_totals = {}
+        # Per category, over all items (markdown): item and layer counts, and
+        # the most viewed row per URL as {url: (views, sequence, place, subject)}
+        self.category_items = {}
+        self.category_layers = {}
+        self.category_rows = {}
+        self.item_count = 0
+        self.layer_count = 0
+        self.view_count = 0
+    
+    def add(self, category: str, item: dict):
+        service_meta = item.get("service", {})
+        layers = service_meta.get("layers", [])
+        url = item.get("url", "")
+        views = item.get("numViews", 0)
         
-        # Sort by views (most popular first)
-        sorted_items = sorted(items, key=lambda x: x.get("numViews", 0), reverse=True)
+        self.item_count += 1
+        self.layer_count += len(layers)
+        self.view_count += views
+        self.category_items[category] = self.category_items.get(category, 0) + 1
+        self.category_layers[category] = self.category_layers.get(category, 0) + len(layers)
+        rows = self.category_rows.setdefault(category, {})
         
-        # Dedupe
-        sorted_items = dedupe_by_url(sorted_items)
+        if not url:
+            return
         
-        lines.append("| Place | Subject | Link |")
-        lines.append("|-------|---------|------|")
+        # The markdown lists each URL once per category, from its most viewed item
+        place = subject = None
+        row = rows.get(url)
+        if row is None or views > row[0]:
+            place = extract_place(item)
+            subject = extract_subject(item)
+            rows[url] = (views, self.item_count, place, subject)
         
-        for item in sorted_items:
+        if url in self._seen_urls:
+            return
+        self._seen_urls.add(url)
+        if place is None:
             place = extract_place(item)
             subject = extract_subject(item)
-            url = item.get("url", "")
+        
+        self.services.append({
+            "id": item.get("id", ""),
+            "title": subject,
+            "place": place,
+            "category": category.replace("_", " ").title(),
+            "categoryKey": category,
+            "url": url,
+            "description": item.get("snippet") or item.get("description") or "",
+            "owner": item.get("owner", ""),
+            "numViews": item.get("numViews", 0),
+            "tags": [t for t in item.get("tags", []) if t],
+            "layers": [
+                {"id": l.get("id"), "name": l.get("name"), "type": l.get("geometryType")}
+                for l in layers
+            ],
+            "layerCount": len(layers),
+            "capabilities": service_meta.get("capabilities", ""),
+            "maxRecordCount": service_meta.get("maxRecordCount"),
+        })
+        totals = self.category_totals.setdefault(category, {"count": 0, "layers": 0})
+        totals["count"] += 1
+        totals["layers"] += len(layers)
+    
+    def markdown(self) -> str:
+        """Generate markdown content from the categorized results."""
+        lines = []
+        
+        # Header
+        lines.append("# Esri Public Services Directory")
+        lines.append("")
+        lines.append(f"*Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}*")
+        lines.append("")
+        
+        lines.append("## Summary")
+        lines.append("")
+        lines.append(f"| Metric | Count |")
+        lines.append("|--------|-------|")
+        lines.append(f"| Categories | {len(self.category_items)} |")
+        lines.append(f"| Services | {self.item_count:,} |")
+        lines.append(f"| Total layers | {self.layer_count:,} |")
+        lines.append(f"| Combined views | {self.view_count:,} |")
+        lines.append("")
+        
+        # Category breakdown
+        lines.append("### By category")
+        lines.append("")
+        lines.append("| Category | Services | Layers |")
+        lines.append("|----------|----------|--------|")
+        
+        for category in sorted(self.category_items):
+            display_name = category.replace("_", " ").title()
+            lines.append(f"| {display_name} | {self.category_items[category]} | {self.category_layers[category]} |")
+        
+        lines.append("")
+        lines.append("---")
+        lines.append("")
+        
+        # Services by category
+        for category in sorted(self.category_items):
+            display_name = category.replace("_", " ").title()
+            lines.append(f"## {display_name}")
+            lines.append("")
+            
+            # Sort by views (most popular first), ties in harvest order
+            rows = sorted(self.category_rows[category].items(), key=lambda row: (-row[1][0], row[1][1]))
             
-            # Escape pipes in text
-            place = place.replace("|", "\\|")
-            subject = subject.replace("|", "\\|")
+            lines.append("| Place | Subject | Link |")
+            lines.append("|-------|---------|------|")
             
-            if url:
+            for url, (_, _, place, subject) in rows:
+                # Escape pipes in text
+                place = place.replace("|", "\\|")
+                subject = subject.replace("|", "\\|")
                 lines.append(f"| {place} | {subject} | [Service]({url}) |")
-            else:
-                lines.append(f"| {place} | {subject} | N/A |")
+            
+            lines.append("")
         
-        lines.append("")
+        return "\n".join(lines)
     
-    return "\n".join(lines)
+    def catalog(self) -> dict:
+        """
+        Generate a JSON catalog structure for the web app.
+        
+        Returns a dict with summary stats and flattened services list.
+        """
+        # Sort by views
+        services = sorted(self.services, key=lambda x: x.get("numViews", 0), reverse=True)
+        
+        category_stats = [
+            {
+                "key": cat,
+                "name": cat.replace("_", " ").title(),
+                "count": totals["count"],
+                "layers": totals["layers"],
+            }
+            for cat, totals in sorted(self.category_totals.items())
+        ]
+        
+        return {
+            "generated": datetime.now().isoformat(),
+            "summary": {
+                "totalServices": len(services),
+                "totalLayers": sum(t["layers"] for t in self.category_totals.values()),
+                "totalViews": sum(s["numViews"] for s in services),
+                "categoryCount": len(category_stats),
+            },
+            "categories": category_stats,
+            "services": services,
+        }
+
+
+def build_catalog(rows: Iterable[tuple[str, dict]]) -> CatalogBuilder:
+    """Feed ``(category, item)`` pairs through a CatalogBuilder."""
+    builder = CatalogBuilder()
+    for category, item in rows:
+        builder.add(category, item)
+    return builder
+
+
+def _category_rows(results: dict[str, list[dict]]) -> Iterator[tuple[str, dict]]:
+    for category, items in results.items():
+        for item in items:
+            yield category, item
+
+
+def generate_markdown(results: dict[str, list[dict]]) -> str:
+    """
+    Generate markdown content from categorized results.
+    """
+    return build_catalog(_category_rows(results)).markdown()
 
 
 def generate_catalog_json(results: dict[str, list[dict]]) -> dict:
@@ -466,90 +642,121 @@ def generate_catalog_json(results: dict[str, list[dict]]) -> dict:
     
     Returns a dict with summary stats and flattened services list.
     """
-    # Build flattened services list with enriched metadata
-    services = []
-    seen_urls = set()
-    
-    for category, items in results.items():
-        category_display = category.replace("_", " ").title()
-        
-        for item in items:
-            url = item.get("url", "")
-            if not url or url in seen_urls:
-                continue
-            seen_urls.add(url)
-            
-            # Get service metadata
-            service_meta = item.get("service", {})
-            layers = service_meta.get("layers", [])
-            
-            services.append({
-                "id": item.get("id", ""),
-                "title": extract_subject(item),
-                "place": extract_place(item),
-                "category": category_display,
-                "categoryKey": category,
-                "url": url,
-                "description": item.get("snippet") or item.get("description") or "",
-                "owner": item.get("owner", ""),
-                "numViews": item.get("numViews", 0),
-                "tags": [t for t in item.get("tags", []) if t],
-                "layers": [
-                    {"id": l.get("id"), "name": l.get("name"), "type": l.get("geometryType")}
-                    for l in layers
-                ],
-                "layerCount": len(layers),
-                "capabilities": service_meta.get("capabilities", ""),
-                "maxRecordCount": service_meta.get("maxRecordCount"),
-            })
-    
-    # Sort by views
-    services.sort(key=lambda x: x.get("numViews", 0), reverse=True)
-    
-    # Compute summary stats
-    total_layers = sum(s["layerCount"] for s in services)
-    total_views = sum(s["numViews"] for s in services)
-    categories = sorted(set(s["categoryKey"] for s in services))
-    
-    category_stats = []
-    for cat in categories:
-        cat_services = [s for s in services if s["categoryKey"] == cat]
-        category_stats.append({
-            "key": cat,
-            "name": cat.replace("_", " ").title(),
-            "count": len(cat_services),
-            "layers": sum(s["layerCount"] for s in cat_services),
-        })
-    
-    return {
-        "generated": datetime.now().isoformat(),
-        "summary": {
-            "totalServices": len(services),
-            "totalLayers": total_layers,
-            "totalViews": total_views,
-            "categoryCount": len(categories),
-        },
-        "categories": category_stats,
-        "services": services,
-    }
+    return build_catalog(_category_rows(results)).catalog()
+
+
+def search_tokens(service: dict) -> set[str]:
+    """Lowercased tokens of a service's title, place, category and tags."""
+    text = " ".join([service["title"], service["place"], service["category"], *service["tags"]])
+    return set(SEARCH_TOKEN.findall(text.lower()))
+
+
+def index_shard(token: str) -> str:
+    """Index shard of a token: its first character if a-z or 0-9, else '_'."""
+    first = token[0]
+    return first if first.isascii() and first.isalnum() else "_"
+
+
+def _write_json(path: Path, data) -> int:
+    text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    path.write_text(text, encoding="utf-8")
+    return len(text.encode("utf-8"))
+
+
+def write_sharded_catalog(catalog: dict, directory: Path = CATALOG_DIR) -> dict:
+    """
+    Write the catalog as compact JSON shards for the web directory.
+    
+    - ``summary.json``: totals and categories, each with its shard and the
+      ordinal of its first service
+    - ``top.json``: the TOP_SERVICES most viewed services, and
+      ``top-<sort>.json`` the first TOP_SERVICES in the other TOP_SORTS
+      orders, so sorting the unfiltered directory loads one small shard
+    - ``categories/<key>.json``: a category's services, most viewed first
+    - ``index/<c>.json``: inverted search index for tokens starting with
+      ``c``, as ``{"tokens": [...], "postings": [[...], ...]}``
+    
+    Services are numbered (ordinals) in category-key order, then shard
+    order, so a posting maps to a shard through the category offsets.
+    Postings are sorted ordinals, delta-encoded. The page loads the summary
+    and top services first, and only the shards a filter or search needs.
+    
+    Returns:
+        Dict of file counts and total bytes written
+    """
+    categories_dir = directory / "categories"
+    index_dir = directory / "index"
+    for shard_dir in (categories_dir, index_dir):
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        for stale in shard_dir.glob("*.json"):
+            stale.unlink()
+    
+    # Services are already sorted by views; grouping keeps that order per category
+    by_category = {}
+    for service in catalog["services"]:
+        by_category.setdefault(service["categoryKey"], []).append(service)
+    
+    size = 0
+    postings = {}
+    categories = []
+    ordinal = 0
+    for stat in catalog["categories"]:
+        services = by_category.get(stat["key"], [])
+        shard = f"categories/{stat['key']}.json"
+        size += _write_json(directory / shard, services)
+        categories.append({**stat, "shard": shard, "offset": ordinal})
+        for service in services:
+            for token in search_tokens(service):
+                postings.setdefault(token, []).append(ordinal)
+            ordinal += 1
+    
+    shards = {}
+    for token in sorted(postings):
+        shards.setdefault(index_shard(token), []).append(token)
+    for shard, tokens in shards.items():
+        encoded = []
+        for token in tokens:
+            previous = 0
+            deltas = []
+            for value in postings[token]:
+                deltas.append(value - previous)
+                previous = value
+            encoded.append(deltas)
+        size += _write_json(index_dir / f"{shard}.json", {"tokens": tokens, "postings": encoded})
+    
+    top = {}
+    for sort, key in TOP_SORTS.items():
+        services = catalog["services"] if key is None else sorted(catalog["services"], key=key)
+        top[sort] = "top.json" if key is None else f"top-{sort}.json"
+        size += _write_json(directory / top[sort], services[:TOP_SERVICES])
+    size += _write_json(directory / "summary.json", {
+        "generated": catalog["generated"],
+        "version": hashlib.sha1(catalog["generated"].encode("utf-8")).hexdigest()[:12],
+        "summary": catalog["summary"],
+        "categories": categories,
+        "top": top,
+        "indexShards": sorted(shards),
+    })
+    
+    return {"categoryShards": len(categories), "indexShards": len(shards), "tokens": len(postings), "bytes": size}
 
 
 def main():
     """Generate the directory markdown and JSON catalog files."""
     print("Loading harvested results...")
-    results = load_results()
+    builder = build_catalog(iter_results())
     
-    if not results:
+    if not builder.category_items:
         print("No results found in sample_output/")
         return
     
-    print(f"Found {len(results)} categories:")
-    for cat, items in results.items():
-        print(f"  - {cat}: {len(items)} services")
+    print(f"Found {len(builder.category_items)} categories:")
+    for cat, count in builder.category_items.items():
+        print(f"  - {cat}: {count} services")
     
     # Generate markdown
     print("\nGenerating markdown...")
-    markdown = generate_markdown(results)
+    markdown = builder.markdown()
     
     with open(DIRECTORY_FILE, "w") as f:
         f.write(markdown)
@@ -558,12 +765,12 @@ def main():
     
     # Generate JSON catalog
     print("\nGenerating JSON catalog...")
-    catalog = generate_catalog_json(results)
-    
-    with open(CATALOG_JSON_FILE, "w") as f:
-        json.dump(catalog, f, indent=2)
+    catalog = builder.catalog()
+    written = write_sharded_catalog(catalog)
     
-    print(f"JSON catalog saved to: {CATALOG_JSON_FILE}")
+    print(f"JSON catalog saved to: {CATALOG_DIR}")
+    print(f"  - {written['categoryShards']} category shards, {written['indexShards']} index shards "
+          f"({written['tokens']:,} tokens, {written['bytes'] / 1e6:.1f} MB)")
     print(f"  - {catalog['summary']['totalServices']} services")
     print(f"  - {catalog['summary']['totalLayers']} layers")
     print(f"  - {catalog['summary']['categoryCount']} categories")
@@ -0,0 +1,208 @@
+"""
+SQLite store of harvested portal items and service metadata.
+
+explore.py writes every category's search results and each service's
+metadata fetch here; generate_directory.py reads the catalog back from it
+instead of the per-category JSON dumps.
+
+Services are keyed by normalized URL and record when they were fetched,
+the HTTP status and, for failures, an exponential backoff so dead services
+are not retried on every harvest.
+"""
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+DEFAULT_STORE_PATH = Path(__file__).parent / "sample_output" / "state" / "services.sqlite"
+
+# A failed service is retried after 6 hours, then 12, 24, ... up to 30 days
+FAILURE_BACKOFF_SECONDS = 6 * 3600
+MAX_BACKOFF_SECONDS = 30 * 24 * 3600
+
+# Working services are fetched again when their portal item changes, or at
+# the latest after this long
+SERVICE_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS services (
+    url TEXT PRIMARY KEY,
+    item_modified INTEGER,
+    fetched_at REAL NOT NULL,
+    status INTEGER,
+    error TEXT,
+    failures INTEGER NOT NULL DEFAULT 0,
+    retry_after REAL,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    service_url TEXT,
+    modified INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_service_url ON items (service_url);
+CREATE TABLE IF NOT EXISTS category_items (
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item_id TEXT NOT NULL,
+    PRIMARY KEY (category, position)
+);
+"""
+
+
+def normalize_url(url: str) -> str:
+    """Key used to dedupe service URLs across categories."""
+    return url.strip().rstrip("/").lower()
+
+
+class ServiceStore:
+    """
+    Harvested items and service metadata in a SQLite database.
+
+    Not thread-safe: fetch in worker threads, record results from one thread.
+    """
+
+    def __init__(self, path: Path = DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def due_services(self, candidates: dict[str, Optional[int]], full: bool = False) -> list[str]:
+        """
+        Select the service URLs whose metadata should be fetched.
+
+        A URL is due if it was never fetched, if its last fetch failed and the
+        backoff has passed, or if it worked but its portal item's ``modified``
+        timestamp changed or the metadata is older than SERVICE_MAX_AGE_SECONDS.
+
+        Args:
+            candidates: Dict mapping service URL to its portal item's ``modified``
+            full: Whether every candidate is due (ignores history and backoff)
+
+        Returns:
+            The due URLs, in the order given
+        """
+        if full:
+            return list(candidates)
+
+        now = time.time()
+        rows = self._service_rows(candidates)
+        due = []
+        for url, modified in candidates.items():
+            row = rows.get(normalize_url(url))
+            if row is None:
+                due.append(url)
+            elif row["failures"]:
+                if now >= (row["retry_after"] or 0):
+                    due.append(url)
+            elif row["item_modified"] != modified or now - row["fetched_at"] > SERVICE_MAX_AGE_SECONDS:
+                due.append(url)
+        return due
+
+    def record_success(self, url: str, item_modified: Optional[int], status: int, summary: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO services "
+            "(url, item_modified, fetched_at, status, error, failures, retry_after, summary) "
+            "VALUES (?, ?, ?, ?, NULL, 0, NULL, ?)",
+            (normalize_url(url), item_modified, time.time(), status, json.dumps(summary, default=str))
+        )
+
+    def record_failure(self, url: str, item_modified: Optional[int], status: Optional[int], error: str):
+        """Record a failed fetch. The last good summary is kept, and the retry is backed off."""
+        key = normalize_url(url)
+        row = self.conn.execute("SELECT failures, summary FROM services WHERE url = ?", (key,)).fetchone()
+        failures = (row["failures"] if row else 0) + 1
+        now = time.time()
+        retry_after = now + min(FAILURE_BACKOFF_SECONDS * 2 ** (failures - 1), MAX_BACKOFF_SECONDS)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO services "
+            "(url, item_modified, fetched_at, status, error, failures, retry_after, summary) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, item_modified, now, status, error, failures, retry_after, row["summary"] if row else None)
+        )
+
+    def summaries(self, urls: list[str]) -> dict[str, Optional[dict]]:
+        """Map each URL to its stored service summary (None if it was never fetched successfully)."""
+        rows = self._service_rows(urls)
+        result = {}
+        for url in urls:
+            row = rows.get(normalize_url(url))
+            result[url] = json.loads(row["summary"]) if row is not None and row["summary"] else None
+        return result
+
+    def save_category(self, category: str, items: list[dict]):
+        """Store a category's search results (portal item fields, without service metadata) in order."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO items (id, service_url, modified, data) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    item["id"],
+                    normalize_url(item["url"]) if item.get("url") else None,
+                    item.get("modified"),
+                    json.dumps(item, default=str),
+                )
+                for item in items if item.get("id")
+            ]
+        )
+        self.conn.execute("DELETE FROM category_items WHERE category = ?", (category,))
+        self.conn.executemany(
+            "INSERT INTO category_items (category, position, item_id) VALUES (?, ?, ?)",
+            [(category, position, item["id"]) for position, item in enumerate(items) if item.get("id")]
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def category_items(self) -> Iterator[tuple[str, dict]]:
+        """
+        Yield ``(category, item)`` for every stored category result, in category
+        and search order. Items carry their service summary under ``service``
+        when one was fetched.
+        """
+        cursor = self.conn.execute(
+            "SELECT c.category, i.data, s.summary FROM category_items c "
+            "JOIN items i ON i.id = c.item_id "
+            "LEFT JOIN services s ON s.url = i.service_url "
+            "ORDER BY c.category, c.position"
+        )
+        for category, data, summary in cursor:
+            item = json.loads(data)
+            if summary:
+                item["service"] = json.loads(summary)
+            yield category, item
+
+    def stats(self) -> dict:
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS services, "
+            "SUM(failures = 0) AS ok, "
+            "SUM(failures > 0) AS failing, "
+            "SUM(failures > 0 AND retry_after > ?) AS backing_off "
+            "FROM services",
+            (time.time(),)
+        ).fetchone()
+        return {key: row[key] or 0 for key in row.keys()}
+
+    def _service_rows(self, urls) -> dict[str, sqlite3.Row]:
+        keys = list({normalize_url(url) for url in urls})
+        rows = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(f"SELECT * FROM services WHERE url IN ({placeholders})", chunk):
+                rows[row["url"]] = row
+        return rows
@@ -23,7 +23,18 @@ setup(
         'docs': [
             'mkdocs',
             'mkdocs-material',
-        ]
+        ],
+        'arrow': [
+            'pyarrow',
+        ],
+        'metrics': [
+            'opentelemetry-sdk',
+            'opentelemetry-exporter-otlp',
+        ],
+        'bench': [
+            'pytest',
+            'pytest-benchmark',
+        ],
     },
     classifiers=[
         'Programming Language :: Python :: 3',
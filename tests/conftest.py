@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Keep learned batch sizes and other persistent state out of the user's cache."""
+    cache_dir = tmp_path / "ezesri-cache"
+    monkeypatch.setenv("EZESRI_CACHE_DIR", str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture(autouse=True)
+def reset_retry_state():
+    """Circuit breakers and the retry policy are process-wide; reset them per test."""
+    from ezesri.retry import reset_circuit_breakers
+    from ezesri.utils import set_retry_policy
+
+    reset_circuit_breakers()
+    set_retry_policy(None)
+    yield
+    reset_circuit_breakers()
+    set_retry_policy(None)
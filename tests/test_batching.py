@@ -0,0 +1,82 @@
+from ezesri import extract_layer
+from ezesri.batching import BatchSizeController, load_learned_batch_size, save_learned_batch_size
+
+URL = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+
+
+def test_controller_grows_after_consecutive_successes():
+    controller = BatchSizeController(100, max_size=200, increase_after=2, increase_step=50)
+    controller.record_success(100, 0.1)
+    assert controller.size == 100
+    controller.record_success(100, 0.1)
+    assert controller.size == 150
+    for _ in range(10):
+        controller.record_success(controller.size, 0.1)
+    assert controller.size == 200
+
+
+def test_controller_halves_on_failure_and_recovers():
+    controller = BatchSizeController(100, max_size=100, increase_after=1, increase_step=25)
+    assert controller.record_failure(100) == 50
+    assert controller.record_success(50, 0.1) == 75
+    assert controller.record_success(75, 0.1) == 100
+
+
+def test_controller_ignores_partial_batches_for_growth():
+    controller = BatchSizeController(100, max_size=200, increase_after=1)
+    assert controller.record_success(10, 0.1) == 100
+
+
+def test_controller_backs_off_on_slow_or_large_responses():
+    controller = BatchSizeController(100, target_seconds=2.0, target_bytes=1000)
+    assert controller.record_success(100, 5.0) == 50
+    assert controller.record_success(50, 0.1, nbytes=5000) == 25
+
+
+def test_learned_sizes_persist_per_host():
+    assert load_learned_batch_size(URL) is None
+    save_learned_batch_size(URL, 250)
+    assert load_learned_batch_size("https://EXAMPLE.com/other/FeatureServer/3") == 250
+    assert load_learned_batch_size("https://another.example.com/0") is None
+
+
+def test_extract_layer_starts_at_learned_size(mocker):
+    save_learned_batch_size(URL, 2)
+    mocker.patch(
+        'ezesri.extract.get_metadata',
+        return_value={'geometryType': 'esriGeometryPoint', 'maxRecordCount': 1000},
+    )
+    point = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}, 'properties': {}}
+    mock_make_request = mocker.patch('ezesri.extract.make_request')
+    mock_make_request.return_value.json.side_effect = [
+        {'objectIds': [1, 2, 3]},
+        {'features': [point, point]},
+        {'features': [point]},
+    ]
+
+    gdf = extract_layer(URL)
+
+    assert len(gdf) == 3
+    feature_calls = [c for c in mock_make_request.call_args_list if c.kwargs.get('method') == 'post']
+    assert len(feature_calls[0].kwargs['data']['objectIds'].split(',')) == 2
+
+
+def test_explicit_batch_size_is_not_learned(mocker):
+    save_learned_batch_size(URL, 500)
+    mocker.patch(
+        'ezesri.extract.get_metadata',
+        return_value={'geometryType': 'esriGeometryPoint', 'maxRecordCount': 1000},
+    )
+    point = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}, 'properties': {}}
+    mock_make_request = mocker.patch('ezesri.extract.make_request')
+    mock_make_request.return_value.json.side_effect = [
+        {'objectIds': [1, 2, 3]},
+        {'features': [point]},
+        {'features': [point]},
+        {'features': [point]},
+    ]
+
+    gdf = extract_layer(URL, batch_size=1)
+
+    assert len(gdf) == 3
+    assert load_learned_batch_size(URL) == 500
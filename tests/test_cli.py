@@ -62,4 +62,17 @@ def test_bulk_fetch_command(mocker):
         
         assert result.exit_code == 0
         assert "Starting bulk export" in result.output
-        mock_bulk_export.assert_called_once_with('fake_service_url', 'output_dir', output_format='geojson') 
\ No newline at end of file
+        mock_bulk_export.assert_called_once_with('fake_service_url', 'output_dir', output_format='geojson')
+
+def test_fetch_partitioned_command(mocker):
+    """Tests the fetch-partitioned command."""
+    mock_export = mocker.patch('ezesri.cli.export_partitioned', return_value=['out/month=2025-01/part-0.parquet'])
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['fetch-partitioned', 'fake_url', 'out', '--partition', 'month', '--incremental'])
+
+    assert result.exit_code == 0
+    assert "Wrote 1 partition files" in result.output
+    mock_export.assert_called_once_with(
+        'fake_url', 'out', time_field=None, partition='month', where='1=1', workers=4, incremental=True,
+    )
@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'harvester'))
+
+import explore  # noqa: E402
+from service_store import ServiceStore  # noqa: E402
+
+
+def _item(n, url=None, modified=1):
+    return {'id': f'item{n}', 'title': f'Item {n}', 'url': url, 'modified': modified, 'numViews': 1000 - n}
+
+
+class FakePortal:
+    """Portal search results per query, served in pages of 100 with later pages answering first."""
+
+    def __init__(self, results, failing_starts=()):
+        self.results = results
+        self.failing_starts = set(failing_starts)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, query, num=100, start=1, **kwargs):
+        with self.lock:
+            self.calls.append((query, start))
+        items = self.results[query]
+        # Earlier pages are slower, so pages complete out of order
+        time.sleep(max(0, 5 - start // 100) * 0.005)
+        if start in self.failing_starts:
+            raise requests.exceptions.HTTPError(f'500 for start {start}')
+        page = items[start - 1:start - 1 + num]
+        next_start = start + num if start - 1 + num < len(items) else -1
+        return {'total': len(items), 'results': page, 'nextStart': next_start}
+
+
+def test_search_all_reassembles_pages_in_order(monkeypatch):
+    items = [_item(n) for n in range(450)]
+    portal = FakePortal({'q': items})
+    monkeypatch.setattr(explore, 'search_portal', portal)
+
+    assert explore.search_all('q', max_results=1000) == items
+    assert sorted(start for _, start in portal.calls) == [1, 101, 201, 301, 401]
+
+
+def test_search_all_stops_at_max_results(monkeypatch):
+    items = [_item(n) for n in range(450)]
+    portal = FakePortal({'q': items})
+    monkeypatch.setattr(explore, 'search_portal', portal)
+
+    assert explore.search_all('q', max_results=250) == items[:250]
+    assert sorted(start for _, start in portal.calls) == [1, 101, 201]
+
+
+def test_search_all_raises_when_a_page_fails(monkeypatch):
+    monkeypatch.setattr(explore, 'search_portal', FakePortal({'q': [_item(n) for n in range(450)]}, failing_starts=[201]))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        explore.search_all('q')
+
+
+@pytest.fixture
+def harvest(tmp_path, monkeypatch):
+    """Runs harvest_all_categories against two fake categories, fetching metadata from a fake."""
+    monkeypatch.setattr(explore, 'OUTPUT_DIR', tmp_path / 'out')
+    monkeypatch.setattr(explore, 'SAMPLE_QUERIES', {
+        'parcels': {'query': 'parcels', 'description': 'Parcels'},
+        'zoning': {'query': 'zoning', 'description': 'Zoning'},
+    })
+    shared = 'https://example.com/arcgis/rest/services/Land/FeatureServer'
+    results = {
+        'parcels': [_item(n, f'https://example.com/Parcels{n}/FeatureServer') for n in range(150)] + [_item(900, shared)],
+        'zoning': [_item(901, shared + '/'), _item(902, 'https://example.com/Zoning/FeatureServer'), _item(903)],
+    }
+    fetched = []
+    lock = threading.Lock()
+
+    def fetch_service_metadata(url, timeout=15):
+        with lock:
+            fetched.append(url)
+        return 200, {'capabilities': 'Query', 'layers': [{'id': 0, 'name': url}]}, None
+
+    monkeypatch.setattr(explore, 'fetch_service_metadata', fetch_service_metadata)
+    store_path = tmp_path / 'services.sqlite'
+
+    def run(portal=None, **kwargs):
+        fetched.clear()
+        monkeypatch.setattr(explore, 'search_portal', portal or FakePortal(results))
+        return explore.harvest_all_categories(store_path=store_path, **kwargs)
+
+    run.fetched = fetched
+    run.results = results
+    run.store_path = store_path
+    return run
+
+
+def test_harvest_fetches_each_deduped_url_once(harvest):
+    all_results = harvest()
+
+    assert len(harvest.fetched) == 152
+    assert len(set(harvest.fetched)) == 152
+    zoning = all_results['zoning']['items']
+    assert [item['id'] for item in zoning] == ['item901', 'item902', 'item903']
+    assert zoning[0]['service']['capabilities'] == 'Query'
+    assert 'service' not in zoning[2]
+
+    with ServiceStore(harvest.store_path) as store:
+        stored = [(category, item['id']) for category, item in store.category_items()]
+    assert len(stored) == 154
+    assert stored[-3:] == [('zoning', 'item901'), ('zoning', 'item902'), ('zoning', 'item903')]
+
+
+def test_incremental_harvest_skips_unchanged_services(harvest):
+    harvest()
+    harvest.results['zoning'][1]['modified'] = 2
+
+    harvest()
+    assert harvest.fetched == ['https://example.com/Zoning/FeatureServer']
+
+    harvest(incremental=False)
+    assert len(harvest.fetched) == 152
+
+
+def test_category_with_a_failed_page_is_not_saved(harvest):
+    harvest()
+    truncated = FakePortal(harvest.results, failing_starts=[101])
+    harvest.results['parcels'].append(_item(950, 'https://example.com/New/FeatureServer'))
+
+    harvest(portal=truncated)
+
+    with ServiceStore(harvest.store_path) as store:
+        parcels = [item['id'] for category, item in store.category_items() if category == 'parcels']
+    # The previous complete result is kept
+    assert len(parcels) == 151
+    assert 'https://example.com/New/FeatureServer' not in harvest.fetched
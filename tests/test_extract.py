@@ -1,5 +1,6 @@
 import pytest
 from ezesri import get_metadata, extract_layer, EsriLayerError, DEFAULT_MAX_BATCH_SIZE
+from ezesri.extract import _fetch_all_object_ids
 import requests
 
 # URL for a known public Esri feature layer
@@ -72,9 +73,10 @@ def test_extract_layer_with_bbox(mocker):
     
     assert not gdf.empty
     assert len(gdf) == 1
-    # Check that the bbox was passed to the query
-    assert 'geometry' in mock_make_request.call_args_list[0].kwargs['params']
-    assert mock_make_request.call_args_list[0].kwargs['params']['geometry'] == '-1,-1,1,1'
+    # Check that the bbox was passed to the query, in a POST body
+    id_query = mock_make_request.call_args_list[0]
+    assert id_query.kwargs['method'] == 'post'
+    assert id_query.kwargs['data']['geometry'] == '-1,-1,1,1'
 
 
 def test_extract_layer_pages_object_ids_past_transfer_limit(mocker):
@@ -110,7 +112,7 @@ def test_extract_layer_pages_object_ids_past_transfer_limit(mocker):
         ]},
     ]
 
-    responses = [oid_page_1, oid_page_2, *feature_responses]
+    responses = [oid_page_1, {'count': 5}, oid_page_2, *feature_responses]
     mock_make_request = mocker.patch('ezesri.extract.make_request')
     mock_make_request.return_value.json.side_effect = responses
 
@@ -118,12 +120,33 @@ def test_extract_layer_pages_object_ids_past_transfer_limit(mocker):
 
     assert len(gdf) == 5
     first_oid_params = mock_make_request.call_args_list[0].kwargs['params']
-    second_oid_params = mock_make_request.call_args_list[1].kwargs['params']
+    count_params = mock_make_request.call_args_list[1].kwargs['params']
+    second_oid_params = mock_make_request.call_args_list[2].kwargs['params']
     assert first_oid_params['orderByFields'] == 'OBJECTID ASC'
     assert 'resultOffset' not in first_oid_params
+    assert count_params['returnCountOnly'] == 'true'
+    assert 'returnIdsOnly' not in count_params
     assert second_oid_params['resultOffset'] == 3
 
 
+def test_object_id_paging_falls_back_to_sequential_without_count(mocker):
+    """Without a usable returnCountOnly answer, ID pages are fetched one at a time."""
+    pages = [
+        {'objectIds': [1, 2], 'exceededTransferLimit': True},
+        {'error': {'code': 400, 'message': 'returnCountOnly not supported'}},
+        {'objectIds': [3, 4], 'exceededTransferLimit': True},
+        {'objectIds': [5], 'exceededTransferLimit': False},
+    ]
+    mock_make_request = mocker.patch('ezesri.extract.make_request')
+    mock_make_request.return_value.json.side_effect = pages
+
+    ids = _fetch_all_object_ids(URL, {'where': '1=1'})
+
+    assert list(ids) == [1, 2, 3, 4, 5]
+    offsets = [c.kwargs['params'].get('resultOffset') for c in mock_make_request.call_args_list]
+    assert offsets == [None, None, 2, 4]
+
+
 def test_extract_layer_raises_on_metadata_error(mocker):
     """Esri error JSON in metadata must raise, not return an empty DataFrame."""
     mocker.patch(
@@ -228,3 +251,32 @@ def test_extract_layer_raises_when_single_feature_batch_fails(mocker):
 
     with pytest.raises(EsriLayerError, match='batch size 1'):
         extract_layer(URL, batch_size=2)
+
+
+def test_extract_layer_uses_cached_service_metadata(mocker):
+    """Layer definitions from /layers are reused instead of refetched per layer."""
+    from ezesri import cache_service_metadata, clear_metadata_cache
+
+    service_url = "https://example.com/arcgis/rest/services/Test/FeatureServer"
+    mock_make_request = mocker.patch('ezesri.extract.make_request')
+    mock_make_request.return_value.json.return_value = {
+        'layers': [{'id': 0, 'geometryType': 'esriGeometryPoint', 'maxRecordCount': 1000}],
+        'tables': [{'id': 1, 'maxRecordCount': 1000}],
+    }
+    mock_get_metadata = mocker.patch('ezesri.extract.get_metadata')
+
+    try:
+        assert cache_service_metadata(service_url + '/') == 2
+        assert mock_make_request.call_args.args[0] == f"{service_url}/layers"
+
+        mock_make_request.return_value.json.return_value = {'objectIds': []}
+        gdf = extract_layer(f"{service_url}/0")
+        assert gdf.empty
+        mock_get_metadata.assert_not_called()
+
+        clear_metadata_cache(service_url)
+        mock_get_metadata.return_value = {'geometryType': 'esriGeometryPoint'}
+        extract_layer(f"{service_url}/0")
+        mock_get_metadata.assert_called_once_with(f"{service_url}/0")
+    finally:
+        clear_metadata_cache()
@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'harvester'))
+
+from generate_directory import build_catalog, extract_place, search_tokens, write_sharded_catalog  # noqa: E402
+
+LAND = 'https://example.com/arcgis/rest/services/Land/FeatureServer'
+ZONING = 'https://example.com/arcgis/rest/services/Zoning/FeatureServer'
+ROADS = 'https://example.com/arcgis/rest/services/Roads/FeatureServer'
+
+
+def _item(title, url, views, owner='CityOfBoston', layers=1, **fields):
+    service = {'layers': [{'id': i, 'name': f'Layer {i}', 'geometryType': 'esriGeometryPolygon'} for i in range(layers)],
+               'capabilities': 'Query'}
+    return {'id': title.lower(), 'title': title, 'url': url, 'numViews': views, 'owner': owner,
+            'tags': [], 'service': service, **fields}
+
+
+ROWS = [
+    ('parcels', _item('Land_view', LAND, 10, layers=2)),
+    ('parcels', _item('Land Parcels', LAND, 50, owner='RiversideCounty', layers=2)),
+    ('parcels', _item('Unlinked', '', 5)),
+    ('zoning', _item('Zoning', ZONING, 30, layers=3)),
+    ('zoning', _item('Land again', LAND, 70, layers=2)),
+    ('roads', _item('Roads', ROADS, 20, owner='someone', accessInformation='© County of Riverside 2021')),
+]
+
+
+def _table(markdown, category):
+    section = markdown.split(f'## {category}\n', 1)[1].strip().split('\n\n', 1)[0]
+    return section.splitlines()[2:]
+
+
+def test_markdown_lists_each_url_once_per_category_from_its_most_viewed_item():
+    markdown = build_catalog(ROWS).markdown()
+
+    assert _table(markdown, 'Parcels') == [f'| Riverside County | Land Parcels | [Service]({LAND}) |']
+    assert _table(markdown, 'Zoning') == [
+        f'| Boston | Land again | [Service]({LAND}) |',
+        f'| Boston | Zoning | [Service]({ZONING}) |',
+    ]
+    # Every item counts in the summary, including duplicates and items without a URL
+    assert '| Services | 6 |' in markdown
+    assert '| Total layers | 11 |' in markdown
+    assert '| Parcels | 3 | 5 |' in markdown
+
+
+def test_catalog_keeps_the_first_category_that_found_a_service():
+    catalog = build_catalog(ROWS).catalog()
+
+    assert [(s['url'], s['categoryKey'], s['title']) for s in catalog['services']] == [
+        (ZONING, 'zoning', 'Zoning'),
+        (ROADS, 'roads', 'Roads'),
+        (LAND, 'parcels', 'Land'),
+    ]
+    assert catalog['categories'] == [
+        {'key': 'parcels', 'name': 'Parcels', 'count': 1, 'layers': 2},
+        {'key': 'roads', 'name': 'Roads', 'count': 1, 'layers': 1},
+        {'key': 'zoning', 'name': 'Zoning', 'count': 1, 'layers': 3},
+    ]
+    assert catalog['summary'] == {'totalServices': 3, 'totalLayers': 6, 'totalViews': 60, 'categoryCount': 3}
+
+
+def test_county_of_attribution_names_the_county():
+    assert extract_place({'owner': 'someone', 'accessInformation': '© County of Riverside 2021'}) == 'Riverside County'
+    assert extract_place({'owner': 'someone', 'accessInformation': '© City of Palo Alto, 2020'}) == 'Palo Alto'
+    assert build_catalog(ROWS).catalog()['services'][1]['place'] == 'Riverside County'
+
+
+def _read(directory, path):
+    return json.loads((directory / path).read_text(encoding='utf-8'))
+
+
+def test_sharded_catalog_decodes_back_to_the_services(tmp_path, monkeypatch):
+    import generate_directory
+    monkeypatch.setattr(generate_directory, 'TOP_SERVICES', 3)
+    rows = ROWS + [
+        ('roads', _item(f'_Road {n}', f'https://example.com/Road{n}/FeatureServer', n, layers=n % 3,
+                        tags=['Streets', f'zone{n}'])) for n in range(6)
+    ] + [('parcels', _item('Émile Zola Parcels', 'https://example.com/Zola/FeatureServer', 40, tags=['ÉCOLE']))]
+    catalog = build_catalog(rows).catalog()
+    (tmp_path / 'categories').mkdir()
+    (tmp_path / 'categories' / 'stale.json').write_text('[]')
+
+    written = write_sharded_catalog(catalog, tmp_path)
+
+    summary = _read(tmp_path, 'summary.json')
+    assert summary['summary'] == catalog['summary']
+    assert not (tmp_path / 'categories' / 'stale.json').exists()
+
+    # Ordinals number the services through the category shards in order
+    by_ordinal = []
+    for category in summary['categories']:
+        assert category['offset'] == len(by_ordinal)
+        shard = _read(tmp_path, category['shard'])
+        assert len(shard) == category['count']
+        assert all(s['categoryKey'] == category['key'] for s in shard)
+        assert [s['numViews'] for s in shard] == sorted((s['numViews'] for s in shard), reverse=True)
+        by_ordinal.extend(shard)
+    assert sorted(s['url'] for s in by_ordinal) == sorted(s['url'] for s in catalog['services'])
+
+    # Delta-encoded postings decode to exactly the services holding each token
+    decoded = {}
+    for shard in summary['indexShards']:
+        index = _read(tmp_path, f'index/{shard}.json')
+        assert index['tokens'] == sorted(index['tokens'])
+        for token, deltas in zip(index['tokens'], index['postings']):
+            assert shard == (token[0] if token[0] in 'abcdefghijklmnopqrstuvwxyz0123456789' else '_')
+            ordinals, ordinal = [], 0
+            for delta in deltas:
+                ordinal += delta
+                ordinals.append(ordinal)
+            decoded[token] = ordinals
+    expected = {}
+    for ordinal, service in enumerate(by_ordinal):
+        for token in search_tokens(service):
+            expected.setdefault(token, []).append(ordinal)
+    assert decoded == expected
+    assert [by_ordinal[o]['url'] for o in decoded['streets']] == [
+        f'https://example.com/Road{n}/FeatureServer' for n in range(5, -1, -1)
+    ]
+    assert '_' in summary['indexShards'] and 'école' in decoded
+    assert written['tokens'] == len(expected)
+
+    # The unfiltered directory's first services per sort
+    assert summary['top'] == {'views': 'top.json', 'title': 'top-title.json', 'layers': 'top-layers.json'}
+    assert _read(tmp_path, 'top.json') == catalog['services'][:3]
+    assert [s['title'] for s in _read(tmp_path, 'top-title.json')] == ['Land', 'Émile Zola Parcels', ' Road 0']
+    assert [s['layerCount'] for s in _read(tmp_path, 'top-layers.json')] == [3, 2, 2]
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+from shapely.geometry import Point, box, shape
+
+from ezesri import extract_layer
+from ezesri.geometry import geojson_to_esri, plan_spatial_filter
+from ezesri.testing import MockArcGISServer, SyntheticLayer
+
+
+def _circle(center, radius, vertices):
+    return Point(center).buffer(radius, quad_segs=max(1, vertices // 4))
+
+
+def test_polygon_rings_are_reoriented_for_esri():
+    geojson = {'type': 'Polygon', 'coordinates': [
+        [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]],   # counter-clockwise exterior (GeoJSON)
+        [[2, 2], [2, 4], [4, 4], [4, 2], [2, 2]],       # clockwise hole
+    ]}
+    esri, geometry_type = geojson_to_esri(geojson)
+
+    assert geometry_type == 'esriGeometryPolygon'
+    exterior, hole = esri['rings']
+    assert exterior[1] == [0.0, 10.0]  # now clockwise
+    assert hole[1] == [4.0, 2.0]       # now counter-clockwise
+    assert esri['spatialReference'] == {'wkid': 4326}
+
+
+@pytest.mark.parametrize('geojson, geometry_type, key', [
+    ({'type': 'Point', 'coordinates': [1, 2]}, 'esriGeometryPoint', 'x'),
+    ({'type': 'MultiPoint', 'coordinates': [[1, 2], [3, 4]]}, 'esriGeometryMultipoint', 'points'),
+    ({'type': 'LineString', 'coordinates': [[1, 2], [3, 4]]}, 'esriGeometryPolyline', 'paths'),
+    ({'type': 'MultiLineString', 'coordinates': [[[1, 2], [3, 4]], [[5, 6], [7, 8]]]}, 'esriGeometryPolyline', 'paths'),
+    ({'type': 'MultiPolygon', 'coordinates': [[[[0, 0], [1, 0], [1, 1], [0, 0]]]]}, 'esriGeometryPolygon', 'rings'),
+    ({'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': [1, 2]}}, 'esriGeometryPoint', 'x'),
+])
+def test_all_geojson_types_convert(geojson, geometry_type, key):
+    esri, converted_type = geojson_to_esri(geojson)
+    assert converted_type == geometry_type
+    assert key in esri
+
+
+def test_simple_filter_is_sent_exactly():
+    plan = plan_spatial_filter(json.dumps({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]}))
+
+    assert len(plan.queries) == 1
+    assert plan.queries[0]['geometryType'] == 'esriGeometryPolygon'
+    assert plan.refine_geometry is None
+
+
+def test_complex_filter_is_simplified_to_a_covering_outline():
+    circle = _circle((0, 0), 1, 4000)
+    plan = plan_spatial_filter(circle.__geo_interface__, max_vertices=100)
+
+    assert len(plan.queries) == 1
+    sent = json.loads(plan.queries[0]['geometry'])
+    assert sum(len(ring) for ring in sent['rings']) <= 100
+    assert shape({'type': 'Polygon', 'coordinates': sent['rings']}).covers(circle)
+    assert plan.refine_geometry.equals(circle)
+
+
+def test_raw_features_are_refined_without_geopandas():
+    circle = _circle((0, 0), 1, 4000)
+    plan = plan_spatial_filter(circle.__geo_interface__, max_vertices=100)
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0.5, 0.5]}, 'properties': {'id': 1}},
+        {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0.99, 0.99]}, 'properties': {'id': 2}},
+        {'type': 'Feature', 'geometry': None, 'properties': {'id': 3}},
+    ]
+
+    assert [f['properties']['id'] for f in plan.refine_features(features)] == [1]
+
+
+def test_sparse_complex_filter_is_split_into_tiles():
+    islands = _circle((0, 0), 0.5, 2000).union(_circle((10, 10), 0.5, 2000))
+    plan = plan_spatial_filter(islands.__geo_interface__, max_vertices=200)
+
+    assert 1 < len(plan.queries) <= 16
+    assert all(q['spatialRel'] == 'esriSpatialRelIntersects' for q in plan.queries)
+
+
+def test_esri_json_and_simple_syntax_pass_through():
+    plan = plan_spatial_filter({'xmin': 0, 'ymin': 0, 'xmax': 1, 'ymax': 1})
+    assert plan.queries[0]['geometryType'] == 'esriGeometryEnvelope'
+
+    plan = plan_spatial_filter('0,0,1,1')
+    assert plan.queries[0] == {'geometry': '0,0,1,1', 'geometryType': 'esriGeometryEnvelope',
+                               'inSR': '4326', 'spatialRel': 'esriSpatialRelIntersects'}
+
+
+def test_complex_filter_results_match_exact_filter():
+    # Points lie on a 0.01 degree grid starting at (-120, 30).
+    layer = SyntheticLayer('Points', count=400, geometry='point')
+    with MockArcGISServer({0: layer}) as server:
+        area = _circle((-118.5, 30.0), 0.75, 3000)
+        gdf = extract_layer(server.layer_url(0), geometry=area.__geo_interface__)
+
+    expected = [oid for oid in range(1, 401) if Point(layer.coordinates(oid)).intersects(area)]
+    assert sorted(gdf['OBJECTID']) == expected
+    assert len(expected) < 400
+
+
+def test_bbox_still_takes_precedence():
+    layer = SyntheticLayer('Points', count=100, geometry='point')
+    with MockArcGISServer({0: layer}) as server:
+        gdf = extract_layer(server.layer_url(0), bbox=(-120.0, 29.0, -119.5, 31.0))
+
+    assert sorted(gdf['OBJECTID']) == [oid for oid in range(1, 101) if box(-120.0, 29.0, -119.5, 31.0).intersects(Point(layer.coordinates(oid)))]
+
+
+def test_large_filter_id_query_is_posted():
+    layer = SyntheticLayer('Points', count=400, geometry='point')
+    with MockArcGISServer({0: layer}) as server:
+        area = _circle((-118.5, 30.0), 0.75, 3000)
+        extract_layer(server.layer_url(0), geometry=area.__geo_interface__)
+
+    id_queries = [r for r in server.request_log if r['params'].get('returnIdsOnly') == 'true']
+    assert id_queries
+    assert all(r['method'] == 'POST' for r in id_queries)
+    assert len(id_queries[0]['params']['geometry']) > 2048  # past common URL limits
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from ezesri.hedging import Hedger, LatencyTracker
+
+
+def _warmed_hedger(mode, latency=0.01, **kwargs):
+    hedger = Hedger(mode=mode, min_samples=5, budget=1.0, **kwargs)
+    for _ in range(5):
+        hedger.latencies.record(latency)
+        hedger.primary_count += 1
+    return hedger
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker()
+    for value in range(1, 101):
+        tracker.record(value / 100)
+    assert tracker.percentile(95) == 0.95
+    assert tracker.percentile(50) == 0.5
+
+
+def test_no_hedge_before_enough_samples():
+    hedger = Hedger(min_samples=5)
+    calls = []
+    assert hedger.run(lambda ids: calls.append(ids) or ids, [1, 2]) == [1, 2]
+    assert len(calls) == 1
+    assert hedger.hedge_count == 0
+    hedger.close()
+
+
+def test_duplicate_hedge_wins_over_straggler():
+    hedger = _warmed_hedger('duplicate')
+    release = threading.Event()
+    calls = []
+
+    def fetch(ids):
+        calls.append(ids)
+        if len(calls) == 1:
+            release.wait(5)  # the straggler
+            return ['slow']
+        return ['fast']
+
+    try:
+        assert hedger.run(fetch, [1, 2, 3]) == ['fast']
+        assert hedger.hedge_wins == 1
+    finally:
+        release.set()
+        hedger.close()
+
+
+def test_split_hedge_requests_two_halves():
+    hedger = _warmed_hedger('split')
+    release = threading.Event()
+    seen = []
+
+    def fetch(ids):
+        seen.append(list(ids))
+        if len(ids) == 4:
+            release.wait(5)
+        return list(ids)
+
+    try:
+        assert hedger.run(fetch, [1, 2, 3, 4]) == [1, 2, 3, 4]
+        assert sorted(seen[1:]) == [[1, 2], [3, 4]]
+    finally:
+        release.set()
+        hedger.close()
+
+
+def test_hedge_budget_limits_extra_requests():
+    hedger = _warmed_hedger('duplicate')
+    hedger.budget = 0.0
+    release = threading.Event()
+    calls = []
+
+    def fetch(ids):
+        calls.append(ids)
+        release.wait(0.1)
+        return ids
+
+    assert hedger.run(fetch, [1]) == [1]
+    assert len(calls) == 1
+    hedger.close()
+
+
+def test_errors_propagate_when_all_attempts_fail():
+    hedger = _warmed_hedger('duplicate', latency=0.0)
+
+    def fetch(ids):
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError, match='boom'):
+        hedger.run(fetch, [1])
+    hedger.close()
+
+
+def test_counters_and_budget_hold_under_concurrent_runs():
+    hedger = _warmed_hedger('duplicate', max_workers=8)
+    hedger.budget = 0.25
+    calls = []
+    lock = threading.Lock()
+
+    def fetch(ids):
+        with lock:
+            calls.append(ids)
+        threading.Event().wait(0.03)
+        return ids
+
+    threads = [threading.Thread(target=hedger.run, args=(fetch, [n])) for n in range(40)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert hedger.primary_count == 45
+        # Each hedge is reserved while fewer than a quarter of the primaries so far have been hedged
+        assert 0 < hedger.hedge_count <= 12
+        # Hedges still queued when their primary finishes are cancelled
+        assert 40 <= len(calls) <= 40 + hedger.hedge_count
+    finally:
+        hedger.close()
@@ -0,0 +1,35 @@
+import json
+import subprocess
+import sys
+
+# Keep in sync with benchmarks/import_time.py, which also enforces a time budget.
+HEAVY_MODULES = ["geopandas", "pandas", "shapely", "fiona", "pyogrio", "pyproj", "tqdm"]
+
+
+def _modules_loaded_by(code: str) -> set:
+    out = subprocess.run(
+        [sys.executable, "-c", code + "\nimport json, sys; print(json.dumps(sorted(sys.modules)))"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(json.loads(out.strip().splitlines()[-1]))
+
+
+def test_cli_import_does_not_load_geospatial_stack():
+    """`import ezesri.cli` must not pull in geopandas, pandas, shapely or fiona."""
+    loaded = _modules_loaded_by("import ezesri.cli")
+    assert [m for m in HEAVY_MODULES if m in loaded] == []
+
+
+def test_extract_layer_loads_geopandas_on_demand():
+    """The deferred imports resolve when a frame is actually built."""
+    code = (
+        "from unittest import mock\n"
+        "from ezesri.extract import extract_layer\n"
+        "with mock.patch('ezesri.extract.get_metadata', return_value={'geometryType': 'esriGeometryPoint'}), "
+        "mock.patch('ezesri.extract._fetch_all_object_ids', return_value=[]):\n"
+        "    df = extract_layer('http://example.com/0')\n"
+        "assert type(df).__name__ == 'GeoDataFrame'\n"
+    )
+    assert "geopandas" in _modules_loaded_by(code)
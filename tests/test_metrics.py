@@ -0,0 +1,58 @@
+import urllib.request
+
+import pytest
+
+from ezesri.metrics import MetricsCollector, disable_metrics, serve_prometheus
+from ezesri.profiling import add_listener, count, remove_listener, timed
+
+
+@pytest.fixture
+def collector():
+    collector = MetricsCollector(buckets=(0.1, 1.0))
+    add_listener(collector)
+    yield collector
+    remove_listener(collector)
+
+
+def test_collector_renders_counters_and_histograms(collector):
+    count('requests', host='example.com')
+    count('requests', host='example.com')
+    count('bytes', 2048, host='example.com')
+    count('batch_size_halvings')
+    count('features', 120)
+    collector.on_timing('http', 0.5, {'host': 'example.com'})
+
+    text = collector.render_prometheus()
+
+    assert 'ezesri_requests_total{host="example.com"} 2' in text
+    assert 'ezesri_response_bytes_total{host="example.com"} 2048' in text
+    assert 'ezesri_batch_size_halvings_total 1' in text
+    assert '# TYPE ezesri_request_duration_seconds histogram' in text
+    assert 'ezesri_request_duration_seconds_bucket{host="example.com",le="0.1"} 0' in text
+    assert 'ezesri_request_duration_seconds_bucket{host="example.com",le="1"} 1' in text
+    assert 'ezesri_request_duration_seconds_count{host="example.com"} 1' in text
+    assert collector.features_per_second() == pytest.approx(120 / 60.0)
+
+
+def test_rate_limiter_wait_is_recorded(collector):
+    from ezesri.utils import _SimpleRateLimiter
+
+    limiter = _SimpleRateLimiter(1000)
+    limiter.acquire()
+    limiter.acquire()
+
+    assert 'ezesri_rate_limit_wait_seconds_count 2' in collector.render_prometheus()
+
+
+def test_serve_prometheus_exposes_metrics_endpoint():
+    server = serve_prometheus(port=0)
+    try:
+        with timed('object_ids'):
+            pass
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode('utf-8')
+        assert 'ezesri_phase_duration_seconds_count{phase="object_ids"} 1' in body
+    finally:
+        server.shutdown()
+        disable_metrics()
@@ -0,0 +1,177 @@
+import os
+from array import array
+
+import pytest
+import requests
+
+from ezesri import EsriLayerError, FeatureStream, bulk_export, extract_layer, profile
+from ezesri.extract import _fetch_all_object_ids
+from ezesri.testing import MockArcGISServer, SyntheticLayer
+from ezesri.utils import make_request
+
+
+@pytest.fixture
+def server():
+    layers = {
+        0: SyntheticLayer('Points', count=250, geometry='point', max_record_count=100, max_ids_per_page=120),
+        1: SyntheticLayer('Parcels', count=40, geometry='polygon', vertices=6),
+        2: SyntheticLayer('Owners', count=30, geometry=None),
+    }
+    with MockArcGISServer(layers) as server:
+        yield server
+
+
+def test_extract_layer_against_mock_server(server):
+    gdf = extract_layer(server.layer_url(0))
+
+    assert len(gdf) == 250
+    assert sorted(gdf['OBJECTID']) == list(range(1, 251))
+    id_pages = [r for r in server.request_log if r['params'].get('returnIdsOnly') == 'true']
+    assert sorted(int(r['params'].get('resultOffset') or 0) for r in id_pages) == [0, 120, 240]
+
+
+def test_extract_table_against_mock_server(server):
+    df = extract_layer(server.layer_url(2))
+    assert len(df) == 30
+    assert 'geometry' not in df.columns
+
+
+def test_oversized_batches_are_shrunk(server):
+    server.layers[1].max_batch_features = 10
+
+    gdf = extract_layer(server.layer_url(1), batch_size=40)
+
+    assert len(gdf) == 40
+    assert all(geom.geom_type == 'Polygon' for geom in gdf.geometry)
+
+
+def test_pbf_is_rejected_like_a_server_without_pbf(server):
+    data = requests.get(f"{server.layer_url(0)}/query", params={'f': 'pbf', 'where': '1=1'}).json()
+    assert data['error']['code'] == 400
+
+
+def test_bulk_export_against_mock_server(server, tmp_path):
+    out_dir = tmp_path / 'export'
+    bulk_export(server.url, str(out_dir), output_format='csv', workers=2)
+
+    assert sorted(os.listdir(out_dir)) == ['Parcels.csv', 'Points.csv']
+    layer_metadata_requests = [r for r in server.request_log if r['path'].rstrip('/').endswith(('/0', '/1', '/2'))]
+    assert layer_metadata_requests == []
+
+
+def test_spill_to_disk_matches_in_memory_extract(server, tmp_path):
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    in_memory = extract_layer(server.layer_url(0))
+    spilled = extract_layer(server.layer_url(0), spill=True, spill_memory_mb=0.01, spill_dir=str(spill_dir))
+
+    assert list(spilled.columns) == list(in_memory.columns)
+    assert spilled['OBJECTID'].tolist() == in_memory['OBJECTID'].tolist()
+    assert spilled.geometry.geom_equals(in_memory.geometry).all()
+    assert spilled.crs == in_memory.crs
+    assert os.listdir(spill_dir) == []
+
+
+def test_spill_to_disk_for_table(server, tmp_path):
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    df = extract_layer(server.layer_url(2), spill=True, spill_dir=str(spill_dir))
+
+    assert len(df) == 30
+    assert 'geometry' not in df.columns
+    assert os.listdir(spill_dir) == []
+
+
+def test_object_id_pages_are_fetched_in_parallel_and_merged_in_order(server):
+    server.layers[0].max_ids_per_page = 30
+
+    ids = _fetch_all_object_ids(server.layer_url(0), {'where': '1=1', 'returnIdsOnly': 'true'})
+
+    assert list(ids) == list(range(1, 251))
+    assert isinstance(ids, array)
+    assert any(r['params'].get('returnCountOnly') == 'true' for r in server.request_log)
+
+
+def test_responses_are_gzipped_and_both_sizes_are_measured(server):
+    with profile() as profiler:
+        response = make_request(
+            f"{server.layer_url(0)}/query",
+            method='post',
+            data={'f': 'geojson', 'where': '1=1', 'objectIds': ','.join(map(str, range(1, 101)))},
+        )
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(response.json()['features']) == 100
+    assert profiler.counters['wire_bytes'] < profiler.counters['bytes']
+    tags = [e['tags'] for e in profiler.events if e['phase'] == 'http'][0]
+    assert tags['encoding'] == 'gzip'
+    assert tags['compression_ratio'] > 1
+    assert tags['request_bytes'] < len('1%2C' * 100)
+    assert server.request_log[-1]['params']['objectIds'].split(',')[:3] == ['1', '2', '3']
+
+
+def test_uncompressed_server_is_measured_at_ratio_one():
+    with MockArcGISServer({0: SyntheticLayer(count=10)}, compress=False) as server:
+        with profile() as profiler:
+            make_request(f"{server.layer_url(0)}/query", params={'f': 'json', 'where': '1=1'})
+
+    assert profiler.counters['wire_bytes'] == profiler.counters['bytes']
+
+
+def test_feature_stream_yields_raw_batches_in_order(server):
+    stream = FeatureStream(server.layer_url(0), batch_size=50, workers=4)
+
+    batches = list(stream)
+
+    assert len(stream) == 250
+    ids = [f['properties']['OBJECTID'] for batch in batches for f in batch]
+    assert ids == list(range(1, 251))
+    assert all(f['type'] == 'Feature' for batch in batches for f in batch)
+
+
+def test_feature_stream_for_table_yields_esri_json(server):
+    features = [f for batch in FeatureStream(server.layer_url(2)) for f in batch]
+
+    assert [f['attributes']['OBJECTID'] for f in features] == list(range(1, 31))
+
+
+def test_feature_stream_downloads_given_object_ids(server):
+    stream = FeatureStream(server.layer_url(0), object_ids=[120, 121, 122, 200], batch_size=2)
+    ids = [f['properties']['OBJECTID'] for batch in stream for f in batch]
+
+    assert len(stream) == 4
+    assert ids == [120, 121, 122, 200]
+    assert not any(entry['params'].get('returnIdsOnly') for entry in server.request_log)
+
+
+def test_feature_stream_uses_given_metadata(server):
+    metadata = FeatureStream(server.layer_url(0)).metadata
+    server.request_log.clear()
+
+    stream = FeatureStream(server.layer_url(0), metadata=metadata)
+
+    assert len(stream) == 250
+    assert all(entry['path'].endswith('/query') for entry in server.request_log)
+
+
+def test_parallel_batches_are_split_on_failure(server):
+    server.layers[1].max_batch_features = 10
+
+    stream = FeatureStream(server.layer_url(1), batch_size=40, workers=3)
+    ids = [f['properties']['OBJECTID'] for batch in stream for f in batch]
+
+    assert ids == list(range(1, 41))
+    assert stream.controller.size <= 10
+
+
+def test_feature_stream_raises_when_batches_keep_failing(server):
+    server.layers[2].max_batch_features = 0
+
+    with pytest.raises(EsriLayerError, match='batch size 1'):
+        list(FeatureStream(server.layer_url(2), batch_size=4, workers=2))
+
+
+def test_extract_layer_with_workers_matches_sequential(server):
+    gdf = extract_layer(server.layer_url(0), batch_size=30, workers=4)
+
+    assert gdf['OBJECTID'].tolist() == list(range(1, 251))
@@ -0,0 +1,151 @@
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from ezesri import export_partitioned, extract_layer
+from ezesri.partition import NULL_LABEL, TimeWindow, null_window, time_windows
+from ezesri.testing import MockArcGISServer, SyntheticLayer
+
+# 2025-01-01 00:00 to 2025-06-30 00:00 UTC, in epoch ms.
+START_MS = 1735689600000
+END_MS = 1751241600000
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def server():
+    layers = {
+        0: SyntheticLayer('Incidents', count=120, geometry='point', time_extent=(START_MS, END_MS)),
+        1: SyntheticLayer('Plain', count=10, geometry='point'),
+        2: SyntheticLayer('Undated', count=40, geometry='point', time_extent=(START_MS, END_MS), null_dates=7),
+        # timeInfo still advertises February to April; the data runs January to June
+        3: SyntheticLayer('Growing', count=120, geometry='point', time_extent=(START_MS, END_MS),
+                          advertised_time_extent=(1738368000000, 1743465600000)),
+    }
+    with MockArcGISServer(layers) as server:
+        yield server
+
+
+def _statistics_requests(server):
+    return [r for r in server.request_log if 'outStatistics' in r['params']]
+
+
+def test_month_windows_are_calendar_aligned():
+    windows = time_windows(utc(2024, 11, 15, 8), utc(2025, 2, 1), 'month')
+
+    assert [w.label for w in windows] == ['2024-11', '2024-12', '2025-01', '2025-02']
+    assert windows[1].start == utc(2024, 12, 1)
+    assert windows[1].end == utc(2025, 1, 1)
+
+
+def test_week_windows_start_on_monday():
+    windows = time_windows(utc(2025, 1, 1), utc(2025, 1, 14), 'week')
+
+    assert [w.label for w in windows] == ['2024-12-30', '2025-01-06', '2025-01-13']
+
+
+def test_unknown_partition_is_rejected():
+    with pytest.raises(ValueError):
+        time_windows(utc(2025, 1, 1), utc(2025, 2, 1), 'quarter')
+
+
+def test_window_where_clause_is_combined_with_the_user_filter():
+    window = TimeWindow(utc(2025, 1, 1), utc(2025, 2, 1), '2025-01')
+
+    assert window.where('EVENT_DATE') == (
+        "EVENT_DATE >= TIMESTAMP '2025-01-01 00:00:00' AND EVENT_DATE < TIMESTAMP '2025-02-01 00:00:00'"
+    )
+    assert window.where('EVENT_DATE', "STATUS = 'open'").startswith("(STATUS = 'open') AND EVENT_DATE >=")
+
+
+def test_null_window_selects_null_times():
+    assert null_window().where('EVENT_DATE') == 'EVENT_DATE IS NULL'
+    assert null_window().where('EVENT_DATE', "STATUS = 'open'") == "(STATUS = 'open') AND EVENT_DATE IS NULL"
+
+
+def test_partitioned_extract_matches_full_extract(server):
+    url = server.layer_url(0)
+
+    full = extract_layer(url)
+    partitioned = extract_layer(url, partition='month', partition_workers=3)
+
+    assert len(partitioned) == len(full) == 120
+    assert sorted(partitioned['OBJECTID']) == sorted(full['OBJECTID'])
+    queried = [r['params'].get('where', '') for r in server.request_log if r['params'].get('returnIdsOnly') == 'true']
+    assert sum('TIMESTAMP' in w for w in queried) == 6
+    assert len(_statistics_requests(server)) == 1
+
+
+def test_rows_outside_a_stale_time_extent_are_extracted(server):
+    gdf = extract_layer(server.layer_url(3), partition='month')
+
+    assert sorted(gdf['OBJECTID']) == list(range(1, 121))
+    queried = [r['params'].get('where', '') for r in server.request_log if r['params'].get('returnIdsOnly') == 'true']
+    assert sum('TIMESTAMP' in w for w in queried) == 6
+
+
+def test_time_field_outside_time_info_uses_statistics_for_the_extent(server):
+    # Field names are case-insensitive on the server
+    gdf = extract_layer(server.layer_url(0), time_field='event_date', partition='month')
+
+    assert len(gdf) == 120
+    stats = _statistics_requests(server)
+    assert len(stats) == 1
+    assert 'ezesri_min' in stats[0]['params']['outStatistics']
+
+
+def test_layer_without_time_field_is_rejected(server):
+    with pytest.raises(ValueError, match='not time-enabled'):
+        extract_layer(server.layer_url(1), partition='month')
+
+
+def test_export_partitioned_writes_one_file_per_window(server, tmp_path):
+    out = tmp_path / 'incidents'
+
+    paths = export_partitioned(server.layer_url(0), str(out), partition='month', workers=2)
+
+    assert sorted(os.path.basename(os.path.dirname(p)) for p in paths) == [
+        f'month=2025-0{m}' for m in range(1, 7)
+    ]
+    frames = [pd.read_parquet(p) for p in paths]
+    assert sum(len(f) for f in frames) == 120
+
+
+def test_incremental_export_refetches_only_the_latest_windows(server, tmp_path):
+    out = tmp_path / 'incidents'
+    url = server.layer_url(0)
+    export_partitioned(url, str(out), partition='month')
+    os.remove(out / 'month=2025-06' / 'part-0.parquet')
+    server.request_log.clear()
+
+    paths = export_partitioned(url, str(out), partition='month', incremental=True)
+
+    assert [os.path.basename(os.path.dirname(p)) for p in paths] == ['month=2025-05', 'month=2025-06']
+    id_queries = [r for r in server.request_log if r['params'].get('returnIdsOnly') == 'true']
+    assert len(id_queries) == 3  # the two latest windows and the null window
+
+
+def test_rows_with_null_times_are_extracted(server):
+    url = server.layer_url(2)
+
+    full = extract_layer(url)
+    partitioned = extract_layer(url, partition='month')
+
+    assert len(partitioned) == len(full) == 40
+    assert partitioned['EVENT_DATE'].isna().sum() == 7
+
+
+def test_export_partitioned_writes_null_times_to_the_default_partition(server, tmp_path):
+    out = tmp_path / 'undated'
+
+    paths = export_partitioned(server.layer_url(2), str(out), partition='month')
+
+    null_paths = [p for p in paths if f'month={NULL_LABEL}' in p]
+    assert len(null_paths) == 1
+    assert len(pd.read_parquet(null_paths[0])) == 7
+    assert sum(len(pd.read_parquet(p)) for p in paths) == 40
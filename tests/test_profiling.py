@@ -0,0 +1,81 @@
+import json
+
+import requests
+from click.testing import CliRunner
+
+from ezesri import extract_layer, profile
+from ezesri.cli import cli
+from ezesri.profiling import timed
+from ezesri.utils import make_request
+
+URL = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+
+
+def _mock_layer(mocker):
+    mocker.patch(
+        'ezesri.extract.get_metadata',
+        return_value={'geometryType': 'esriGeometryPoint', 'maxRecordCount': 2},
+    )
+    point = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [0, 0]}, 'properties': {}}
+    mock_make_request = mocker.patch('ezesri.extract.make_request')
+    mock_make_request.return_value.json.side_effect = [
+        {'objectIds': [1, 2, 3]},
+        {'features': [point, point]},
+        {'features': [point]},
+    ]
+    mock_make_request.return_value.content = b'x' * 10
+    return mock_make_request
+
+
+def test_timed_is_noop_without_listeners():
+    with timed('anything'):
+        pass
+
+
+def test_profile_records_extraction_phases(mocker):
+    _mock_layer(mocker)
+
+    with profile() as profiler:
+        extract_layer(URL)
+
+    assert profiler.phases['batch_query']['calls'] == 2
+    assert profiler.phases['object_ids']['calls'] == 1
+    assert profiler.phases['frame']['calls'] == 1
+    assert profiler.phases['json_decode']['calls'] == 3
+    assert profiler.counters['features'] == 3
+    assert 'batch_query' in profiler.report()
+
+
+def test_make_request_counts_requests_bytes_and_retries(mocker):
+    mocker.patch('ezesri.utils.time.sleep')
+    ok = requests.models.Response()
+    ok.status_code = 200
+    ok._content = b'{"ok": true}'
+    mocker.patch(
+        'ezesri.utils.requests.get',
+        side_effect=[requests.exceptions.ConnectionError('reset'), ok],
+    )
+
+    with profile() as profiler:
+        make_request(URL)
+
+    assert profiler.counters['requests'] == 1
+    assert profiler.counters['bytes'] == len(ok.content)
+    assert profiler.counters['retries'] == 1
+    assert profiler.phases['http']['calls'] == 2
+
+
+def test_fetch_profile_out_writes_json_trace(mocker):
+    _mock_layer(mocker)
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        result = runner.invoke(cli, [
+            'fetch', URL, '--format', 'csv', '--out', 'out.csv', '--profile', '--profile-out', 'trace.json',
+        ])
+        assert result.exit_code == 0, result.output
+        with open('trace.json') as f:
+            trace = json.load(f)
+
+    assert 'write:csv' in trace['phases']
+    assert trace['counters']['features'] == 3
+    assert 'Profile:' in result.output
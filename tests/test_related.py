@@ -0,0 +1,52 @@
+import pytest
+
+from ezesri import EsriLayerError, extract_related
+from ezesri.testing import MockArcGISServer, SyntheticLayer
+
+
+@pytest.fixture
+def server():
+    layers = {
+        0: SyntheticLayer('Parcels', count=50, geometry='polygon', vertices=5),
+        1: SyntheticLayer('Owners', count=120, geometry=None, max_record_count=40),
+    }
+    with MockArcGISServer(layers, relationships={3: (0, 1)}) as server:
+        yield server
+
+
+def _related_requests(server):
+    return [r for r in server.request_log if r['path'].endswith('/queryRelatedRecords')]
+
+
+def test_joined_frame_has_one_row_per_related_record(server):
+    gdf = extract_related(server.layer_url(0), 3)
+
+    assert len(gdf) == 120
+    assert sorted(gdf['OBJECTID_related'].tolist()) == list(range(1, 121))
+    assert (gdf['parent_OBJECTID'] == gdf['OBJECTID']).all()
+    assert gdf.geometry.notna().all()
+
+
+def test_related_records_are_requested_by_parent_object_id(server):
+    parents, related = extract_related(server.layer_url(0), 3, join=False)
+
+    requested = set()
+    for r in _related_requests(server):
+        requested.update(int(x) for x in r['params']['objectIds'].split(','))
+    assert requested == set(parents['OBJECTID'])
+    assert set(related['parent_OBJECTID']) <= requested
+
+
+def test_batches_over_the_transfer_limit_are_halved(server):
+    parents, related = extract_related(server.layer_url(0), 3, join=False)
+
+    assert len(parents) == 50
+    assert len(related) == 120
+    sizes = [len(r['params']['objectIds'].split(',')) for r in _related_requests(server)]
+    assert sizes[0] == 50
+    assert min(sizes) < 50
+
+
+def test_unknown_relationship_is_rejected(server):
+    with pytest.raises(EsriLayerError, match='no relationship 9'):
+        extract_related(server.layer_url(0), 9)
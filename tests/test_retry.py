@@ -0,0 +1,105 @@
+import pytest
+import requests
+
+from ezesri import RetryPolicy, CircuitOpenError, set_retry_policy
+from ezesri.retry import parse_retry_after
+from ezesri.utils import make_request
+
+URL = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+
+
+def _response(status=200, content=b'{"ok": true}', headers=None):
+    response = requests.models.Response()
+    response.status_code = status
+    response._content = content
+    response.headers.update(headers or {})
+    response.url = URL
+    return response
+
+
+@pytest.fixture
+def sleeps(mocker):
+    return mocker.patch('ezesri.utils.time.sleep')
+
+
+def test_retries_server_errors_then_succeeds(mocker, sleeps):
+    mock_get = mocker.patch('ezesri.utils.requests.get', side_effect=[_response(503), _response(200)])
+
+    response = make_request(URL)
+
+    assert response.status_code == 200
+    assert mock_get.call_count == 2
+    assert sleeps.call_count == 1
+
+
+def test_client_errors_are_not_retried(mocker, sleeps):
+    mock_get = mocker.patch('ezesri.utils.requests.get', return_value=_response(404))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_request(URL)
+
+    assert mock_get.call_count == 1
+    sleeps.assert_not_called()
+
+
+def test_retryable_esri_error_in_http_200_is_retried(mocker, sleeps):
+    busy = _response(200, b'{"error": {"code": 503, "message": "Service busy"}}')
+    mock_get = mocker.patch('ezesri.utils.requests.get', side_effect=[busy, _response(200)])
+
+    assert make_request(URL).json() == {'ok': True}
+    assert mock_get.call_count == 2
+
+
+def test_fatal_esri_error_is_returned_without_retry(mocker, sleeps):
+    bad_params = _response(200, b'{"error": {"code": 400, "message": "Invalid parameters"}}')
+    mock_get = mocker.patch('ezesri.utils.requests.get', return_value=bad_params)
+
+    assert make_request(URL).json()['error']['code'] == 400
+    assert mock_get.call_count == 1
+
+
+def test_exhausted_esri_retries_return_the_error_response(mocker, sleeps):
+    busy = _response(200, b'{"error": {"code": 503, "message": "Service busy"}}')
+    mocker.patch('ezesri.utils.requests.get', return_value=busy)
+
+    assert make_request(URL).json()['error']['code'] == 503
+    assert sleeps.call_count == 2
+
+
+def test_backoff_is_exponential_and_honors_retry_after(mocker, sleeps):
+    mocker.patch(
+        'ezesri.utils.requests.get',
+        side_effect=[_response(500), _response(429, headers={'Retry-After': '7'}), _response(500)],
+    )
+    policy = RetryPolicy(max_attempts=3, backoff_base=2.0, jitter=False)
+
+    with pytest.raises(requests.exceptions.RequestException, match='All retries failed'):
+        make_request(URL, retry_policy=policy)
+
+    assert [c.args[0] for c in sleeps.call_args_list] == [2.0, 7.0]
+
+
+def test_jittered_delay_stays_within_bounds():
+    policy = RetryPolicy(backoff_base=1.0, backoff_max=4.0)
+    for attempt in range(6):
+        assert 0 <= policy.compute_delay(attempt) <= 4.0
+
+
+def test_parse_retry_after_http_date():
+    response = _response(503, headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    assert parse_retry_after(response) == 0.0
+
+
+def test_circuit_breaker_fails_fast_after_consecutive_failures(mocker, sleeps):
+    mock_get = mocker.patch(
+        'ezesri.utils.requests.get',
+        side_effect=requests.exceptions.ConnectionError('refused'),
+    )
+    set_retry_policy(RetryPolicy(max_attempts=2, breaker_threshold=2, breaker_reset=60))
+
+    with pytest.raises(requests.exceptions.RequestException):
+        make_request(URL)
+    with pytest.raises(CircuitOpenError):
+        make_request(f"{URL}/query")
+
+    assert mock_get.call_count == 2
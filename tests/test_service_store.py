@@ -0,0 +1,122 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'harvester'))
+
+import service_store  # noqa: E402
+from service_store import FAILURE_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS, SERVICE_MAX_AGE_SECONDS, ServiceStore  # noqa: E402
+
+NOW = 1767225600.0
+URL = 'https://example.com/arcgis/rest/services/Parcels/FeatureServer'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [NOW]
+    monkeypatch.setattr(service_store.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    with ServiceStore(tmp_path / 'state' / 'services.sqlite') as store:
+        yield store
+
+
+def test_new_services_are_due(store):
+    assert store.due_services({URL: 100, URL + '2': None}) == [URL, URL + '2']
+
+
+def test_fetched_service_is_due_again_when_its_item_changes(store):
+    store.record_success(URL, 100, 200, {'layers': 3})
+
+    assert store.due_services({URL: 100}) == []
+    assert store.due_services({URL + '/': 100}) == []  # normalized URL
+    assert store.due_services({URL: 101}) == [URL]
+
+
+def test_fetched_service_is_due_again_after_max_age(store, clock):
+    store.record_success(URL, 100, 200, {'layers': 3})
+
+    clock[0] = NOW + SERVICE_MAX_AGE_SECONDS
+    assert store.due_services({URL: 100}) == []
+    clock[0] = NOW + SERVICE_MAX_AGE_SECONDS + 1
+    assert store.due_services({URL: 100}) == [URL]
+
+
+def test_full_harvest_ignores_history(store):
+    store.record_success(URL, 100, 200, {'layers': 3})
+    store.record_failure(URL + '2', 100, 500, 'Server error')
+
+    assert store.due_services({URL: 100, URL + '2': 100}, full=True) == [URL, URL + '2']
+
+
+def test_failures_back_off_exponentially_and_keep_the_last_summary(store, clock):
+    store.record_success(URL, 100, 200, {'layers': 3})
+
+    for failures, backoff in enumerate([1, 2, 4], start=1):
+        store.record_failure(URL, 100, 500, 'Server error')
+        row = store.conn.execute('SELECT * FROM services').fetchone()
+        assert row['failures'] == failures
+        assert row['retry_after'] == clock[0] + FAILURE_BACKOFF_SECONDS * backoff
+        assert store.summaries([URL]) == {URL: {'layers': 3}}
+
+        # Even an unchanged item waits out the backoff
+        assert store.due_services({URL: 100}) == []
+        clock[0] = row['retry_after']
+        assert store.due_services({URL: 100}) == [URL]
+
+    assert store.stats() == {'services': 1, 'ok': 0, 'failing': 1, 'backing_off': 0}
+
+
+def test_backoff_is_capped(store):
+    for _ in range(20):
+        store.record_failure(URL, None, None, 'Timed out')
+
+    row = store.conn.execute('SELECT * FROM services').fetchone()
+    assert row['retry_after'] == NOW + MAX_BACKOFF_SECONDS
+    assert store.summaries([URL]) == {URL: None}
+
+
+def test_success_clears_failures(store):
+    store.record_failure(URL, 100, 500, 'Server error')
+    store.record_success(URL, 100, 200, {'layers': 1})
+
+    assert store.stats() == {'services': 1, 'ok': 1, 'failing': 0, 'backing_off': 0}
+    assert store.due_services({URL: 100}) == []
+
+
+def test_category_items_join_items_with_their_service(store):
+    parcels = {'id': 'a', 'url': URL, 'title': 'Parcels', 'modified': 100}
+    zoning = {'id': 'b', 'url': 'https://example.com/Zoning/FeatureServer', 'title': 'Zoning'}
+    store.save_category('planning', [zoning, parcels, {'title': 'No id'}])
+    store.save_category('land', [parcels])
+    store.record_success(URL + '/', 100, 200, {'layers': 3})
+    store.commit()
+
+    items = list(store.category_items())
+
+    assert [(category, item['title']) for category, item in items] == [
+        ('land', 'Parcels'), ('planning', 'Zoning'), ('planning', 'Parcels'),
+    ]
+    assert items[0][1]['service'] == {'layers': 3}
+    assert 'service' not in items[1][1]
+
+
+def test_saving_a_category_replaces_its_results(store):
+    store.save_category('planning', [{'id': 'a', 'url': URL, 'title': 'Parcels'}, {'id': 'b', 'title': 'Zoning'}])
+    store.save_category('planning', [{'id': 'b', 'title': 'Zoning'}])
+
+    assert [item['title'] for _, item in store.category_items()] == ['Zoning']
+
+
+def test_store_persists_across_connections(tmp_path, clock):
+    path = tmp_path / 'services.sqlite'
+    with ServiceStore(path) as store:
+        store.record_success(URL, 100, 200, {'layers': 3})
+        store.commit()
+
+    with ServiceStore(path) as store:
+        assert store.summaries([URL]) == {URL: {'layers': 3}}
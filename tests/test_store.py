@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from ezesri import LayerStore, extract_layer
+from ezesri.store import store_key
+from ezesri.testing import MockArcGISServer, SyntheticLayer
+
+
+@pytest.fixture
+def server():
+    layers = {
+        0: SyntheticLayer('Points', count=120, geometry='point'),
+        1: SyntheticLayer('Owners', count=30, geometry=None),
+        2: SyntheticLayer('Unversioned', count=10, geometry='point', last_edit_date=None),
+    }
+    with MockArcGISServer(layers) as server:
+        yield server
+
+
+def _feature_queries(server):
+    return [r for r in server.request_log if r['path'].endswith('/query') and r['params'].get('objectIds')]
+
+
+def test_repeat_extract_is_served_from_store(server, tmp_path):
+    store = LayerStore(str(tmp_path / 'layers'))
+    first = extract_layer(server.layer_url(0), cache=store)
+    queries_after_first = len(_feature_queries(server))
+
+    second = extract_layer(server.layer_url(0), cache=store)
+
+    assert len(_feature_queries(server)) == queries_after_first
+    assert list(second.columns) == list(first.columns)
+    assert second['OBJECTID'].tolist() == first['OBJECTID'].tolist()
+    assert second.geometry.geom_equals(first.geometry).all()
+    assert second.crs == first.crs
+
+
+def test_edit_or_different_query_misses_store(server, tmp_path):
+    store = LayerStore(str(tmp_path / 'layers'))
+    extract_layer(server.layer_url(0), cache=store)
+    queries = len(_feature_queries(server))
+
+    extract_layer(server.layer_url(0), where='CATEGORY = 1', cache=store)
+    assert len(_feature_queries(server)) > queries
+    queries = len(_feature_queries(server))
+
+    server.layers[0].last_edit_date += 1000
+    extract_layer(server.layer_url(0), cache=store)
+    assert len(_feature_queries(server)) > queries
+
+
+def test_tables_are_stored(server, tmp_path):
+    store = LayerStore(str(tmp_path / 'layers'))
+    extract_layer(server.layer_url(1), cache=store)
+    df = extract_layer(server.layer_url(1), cache=store)
+
+    assert len(df) == 30
+    assert 'geometry' not in df.columns
+    assert len(store.entries()) == 1
+
+
+def test_layers_without_last_edit_date_are_not_stored(server, tmp_path):
+    store = LayerStore(str(tmp_path / 'layers'))
+    extract_layer(server.layer_url(2), cache=store)
+    assert store.entries() == []
+
+
+def test_store_key_requires_last_edit_date():
+    assert store_key('https://x/0', {'fields': []}) is None
+    key = store_key('https://x/0', {'editingInfo': {'lastEditDate': 1}}, where='1=1')
+    assert key == store_key('https://x/0/', {'editingInfo': {'lastEditDate': 1}}, where='1=1')
+    assert key != store_key('https://x/0', {'editingInfo': {'lastEditDate': 2}}, where='1=1')
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    import pandas as pd
+
+    store = LayerStore(str(tmp_path / 'layers'))
+    df = pd.DataFrame({'A': range(1000)})
+    store.put('old', df)
+    store.put('new', df)
+    os.utime(store._path('old'), (1, 1))
+    store.get_table('new')
+
+    store.max_bytes = os.path.getsize(store._path('new')) + 1
+    store.evict()
+
+    assert 'old' not in store
+    assert 'new' in store
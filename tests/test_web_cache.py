@@ -0,0 +1,135 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'web', 'lambda'))
+
+import cache  # noqa: E402
+from cache import LayerCache, LocalCacheStore  # noqa: E402
+
+NOW = 1767225600.0
+URL = 'https://example.com/arcgis/rest/services/Parcels/FeatureServer/0'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [NOW]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    return now
+
+
+class Upstream:
+    """Stands in for the layer's metadata and count queries, counting calls."""
+
+    def __init__(self, monkeypatch):
+        self.metadata = {'name': 'Parcels', 'editingInfo': {'lastEditDate': 1}}
+        self.count = 10
+        self.calls = []
+        monkeypatch.setattr(cache, '_fetch_metadata', self._fetch_metadata)
+        monkeypatch.setattr(cache, '_fetch_count', self._fetch_count)
+
+    def _fetch_metadata(self, url):
+        self.calls.append(('metadata', url))
+        return dict(self.metadata)
+
+    def _fetch_count(self, url):
+        self.calls.append(('count', url))
+        return self.count
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(cache, 'layer_cache', LayerCache(ttl=60, backing=LocalCacheStore(str(tmp_path / 'cache'))))
+    return Upstream(monkeypatch)
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    layer_cache = LayerCache(ttl=60, backing=LocalCacheStore(str(tmp_path)))
+    layer_cache.put('k', {'v': 1})
+
+    clock[0] = NOW + 59
+    assert layer_cache.get('k') == {'v': 1}
+    layer_cache.clear()
+    assert layer_cache.get('k') == {'v': 1}  # from the backing store
+
+    clock[0] = NOW + 60
+    assert layer_cache.get('k') is None
+    layer_cache.clear()
+    assert layer_cache.get('k') is None
+
+
+def test_backing_store_is_shared_between_caches(tmp_path, clock):
+    LayerCache(ttl=60, backing=LocalCacheStore(str(tmp_path))).put('k', [1, 2])
+
+    assert LayerCache(ttl=60, backing=LocalCacheStore(str(tmp_path))).get('k') == [1, 2]
+    assert LayerCache(ttl=60).get('k') is None
+
+
+def test_memory_is_bounded_to_the_most_recently_used_entries(clock):
+    layer_cache = LayerCache(ttl=60, max_entries=2)
+    layer_cache.put('a', 1)
+    layer_cache.put('b', 2)
+    layer_cache.put('a', 3)
+    layer_cache.put('c', 4)
+
+    assert layer_cache.get('b') is None
+    assert (layer_cache.get('a'), layer_cache.get('c')) == (3, 4)
+
+
+def test_uncacheable_values_are_fetched_every_time(tmp_path, clock):
+    layer_cache = LayerCache(ttl=60, backing=LocalCacheStore(str(tmp_path)))
+    results = iter([{'error': 'timed out'}, {'name': 'Parcels'}, {'name': 'Other'}])
+
+    def fetch():
+        return next(results)
+
+    def cacheable(value):
+        return 'error' not in value
+
+    assert layer_cache.get_or_fetch('k', fetch, cacheable) == {'error': 'timed out'}
+    assert os.listdir(tmp_path) == []
+    assert layer_cache.get_or_fetch('k', fetch, cacheable) == {'name': 'Parcels'}
+    assert layer_cache.get_or_fetch('k', fetch, cacheable) == {'name': 'Parcels'}
+
+
+def test_metadata_is_cached_per_normalized_url(upstream, clock):
+    assert cache.get_metadata(URL) == upstream.metadata
+    assert cache.get_metadata(URL + '/ ') == upstream.metadata
+    assert upstream.calls == [('metadata', URL)]
+
+    clock[0] = NOW + 60
+    cache.get_metadata(URL)
+    assert len(upstream.calls) == 2
+
+
+def test_metadata_errors_are_not_cached(upstream):
+    upstream.metadata = {'error': 'Failed to fetch metadata'}
+    cache.get_metadata(URL)
+    upstream.metadata = {'name': 'Parcels'}
+
+    assert cache.get_metadata(URL) == {'name': 'Parcels'}
+    assert cache.get_metadata(URL) == {'name': 'Parcels'}
+    assert len(upstream.calls) == 2
+
+
+def test_failed_counts_are_not_cached(upstream):
+    upstream.count = None
+    assert cache.get_feature_count(URL, upstream.metadata) is None
+    upstream.count = 10
+
+    assert cache.get_feature_count(URL, upstream.metadata) == 10
+    assert cache.get_feature_count(URL, upstream.metadata) == 10
+    assert len(upstream.calls) == 2
+
+
+def test_count_is_refetched_when_the_layer_is_edited(upstream):
+    assert cache.get_feature_count(URL, upstream.metadata) == 10
+    upstream.count = 11
+    assert cache.get_feature_count(URL, upstream.metadata) == 10
+
+    edited = {'editingInfo': {'lastEditDate': 2}}
+    assert cache.get_feature_count(URL, edited) == 11
+    assert cache.get_feature_count(URL, upstream.metadata) == 10
+    assert cache.get_feature_count(URL, {}) == 11
+    assert upstream.calls == [('count', URL)] * 3
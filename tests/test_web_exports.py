@@ -0,0 +1,134 @@
+import csv
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'web', 'lambda'))
+
+from exports import CsvEncoder, csv_chunks  # noqa: E402
+
+FIELDS = [
+    {'name': 'name', 'type': 'esriFieldTypeString'},
+    {'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+    {'name': 'Shape', 'type': 'esriFieldTypeGeometry'},
+    {'name': 'photo', 'type': 'esriFieldTypeBlob'},
+    {'name': 'area', 'type': 'esriFieldTypeDouble'},
+]
+
+
+def _metadata(geometry_type):
+    metadata = {'fields': FIELDS}
+    if geometry_type:
+        metadata['geometryType'] = f'esriGeometry{geometry_type}'
+    return metadata
+
+
+def _feature(oid, geometry):
+    return {'type': 'Feature', 'properties': {'OBJECTID': oid, 'name': f'n{oid}', 'area': None}, 'geometry': geometry}
+
+
+def _read(metadata, features, geometry='auto'):
+    """The CSV for ``features`` as a header and a list of dicts."""
+    reader = csv.DictReader(io.StringIO(''.join(csv_chunks([features], metadata, geometry))))
+    return reader.fieldnames, list(reader)
+
+
+SQUARE = [[0, 0], [4, 0], [4, 2], [0, 2], [0, 0]]
+HOLE = [[1, 0.5], [2, 0.5], [2, 1.5], [1, 1.5], [1, 0.5]]
+OFFSET_SQUARE = [[10, 10], [12, 10], [12, 12], [10, 12], [10, 10]]
+
+
+@pytest.mark.parametrize('geometry_type, geometry, columns', [
+    ('Point', 'auto', ['latitude', 'longitude']),
+    ('Point', 'centroid', ['latitude', 'longitude']),
+    ('Point', 'wkt', ['latitude', 'longitude', 'wkt']),
+    ('Polygon', 'auto', ['latitude', 'longitude']),
+    ('Polygon', 'centroid', ['centroid_latitude', 'centroid_longitude']),
+    ('Polyline', 'wkt', ['latitude', 'longitude', 'wkt']),
+    ('Polygon', 'none', []),
+    (None, 'wkt', []),
+])
+def test_header_lists_sorted_attribute_fields_then_geometry_columns(geometry_type, geometry, columns):
+    encoder = CsvEncoder(_metadata(geometry_type), geometry)
+
+    assert encoder.header() == ','.join(['OBJECTID', 'area', 'name'] + columns) + '\r\n'
+
+
+def test_unknown_geometry_option_is_rejected():
+    with pytest.raises(ValueError, match='Unknown CSV geometry option'):
+        CsvEncoder(_metadata('Point'), 'shapefile')
+
+
+def test_points_use_their_coordinates():
+    features = [_feature(1, {'type': 'Point', 'coordinates': [-71.06, 42.36]}), _feature(2, None)]
+
+    _, rows = _read(_metadata('Point'), features, 'wkt')
+
+    assert rows[0] == {'OBJECTID': '1', 'area': '', 'name': 'n1', 'latitude': '42.36', 'longitude': '-71.06',
+                       'wkt': 'POINT (-71.06 42.36)'}
+    assert rows[1] == {'OBJECTID': '2', 'area': '', 'name': 'n2', 'latitude': '', 'longitude': '', 'wkt': ''}
+
+
+def test_lines_use_their_centroid():
+    features = [
+        _feature(1, {'type': 'LineString', 'coordinates': [[0, 0], [2, 0], [2, 2]]}),
+        _feature(2, {'type': 'MultiLineString', 'coordinates': [[[0, 0], [0, 2]], [[4, 0], [4, 2]]]}),
+        _feature(3, None),
+    ]
+
+    columns, rows = _read(_metadata('Polyline'), features, 'wkt')
+
+    assert columns[-3:] == ['latitude', 'longitude', 'wkt']
+    assert [(r['latitude'], r['longitude'], r['wkt']) for r in rows] == [
+        ('0.5', '1.5', 'LINESTRING (0 0, 2 0, 2 2)'),
+        ('1.0', '2.0', 'MULTILINESTRING ((0 0, 0 2), (4 0, 4 2))'),
+        ('', '', ''),
+    ]
+
+
+def test_polygons_use_their_centroid():
+    features = [
+        _feature(1, {'type': 'Polygon', 'coordinates': [SQUARE]}),
+        _feature(2, None),
+        _feature(3, {'type': 'Polygon', 'coordinates': [SQUARE, HOLE]}),
+        _feature(4, {'type': 'MultiPolygon', 'coordinates': [[SQUARE], [OFFSET_SQUARE]]}),
+    ]
+
+    _, rows = _read(_metadata('Polygon'), features, 'wkt')
+
+    assert [(r['latitude'], r['longitude']) for r in rows[:2]] == [('1.0', '2.0'), ('', '')]
+    # Area-weighted: the hole pulls the centroid right, the smaller square up and right
+    assert (float(rows[2]['latitude']), float(rows[2]['longitude'])) == pytest.approx((1, 14.5 / 7))
+    assert (float(rows[3]['latitude']), float(rows[3]['longitude'])) == pytest.approx((52 / 12, 5))
+    assert rows[0]['wkt'] == 'POLYGON ((0 0, 4 0, 4 2, 0 2, 0 0))'
+    assert rows[2]['wkt'] == 'POLYGON ((0 0, 4 0, 4 2, 0 2, 0 0), (1 0.5, 2 0.5, 2 1.5, 1 1.5, 1 0.5))'
+    assert rows[3]['wkt'] == 'MULTIPOLYGON (((0 0, 4 0, 4 2, 0 2, 0 0)), ((10 10, 12 10, 12 12, 10 12, 10 10)))'
+
+
+def test_centroid_option_renames_the_columns():
+    features = [_feature(1, {'type': 'Polygon', 'coordinates': [SQUARE]})]
+
+    _, rows = _read(_metadata('Polygon'), features, 'centroid')
+
+    assert rows == [{'OBJECTID': '1', 'area': '', 'name': 'n1', 'centroid_latitude': '1.0', 'centroid_longitude': '2.0'}]
+
+
+def test_batch_of_null_geometries_has_empty_geometry_columns():
+    _, rows = _read(_metadata('Polygon'), [_feature(1, None), _feature(2, {'type': 'Polygon', 'coordinates': []})], 'wkt')
+
+    assert [(r['latitude'], r['longitude'], r['wkt']) for r in rows] == [('', '', ''), ('', '', '')]
+
+
+def test_tables_and_none_have_attributes_only():
+    features = [_feature(1, {'type': 'Polygon', 'coordinates': [SQUARE]})]
+
+    assert _read(_metadata(None), features)[1] == [{'OBJECTID': '1', 'area': '', 'name': 'n1'}]
+    assert _read(_metadata('Polygon'), features, 'none')[1] == [{'OBJECTID': '1', 'area': '', 'name': 'n1'}]
+
+
+def test_esri_json_attributes_are_read():
+    encoder = CsvEncoder(_metadata(None))
+
+    assert encoder.rows([{'attributes': {'OBJECTID': 7, 'name': 'x', 'extra': 1}}]) == '7,,x\r\n'
@@ -0,0 +1,304 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'web', 'lambda'))
+
+import jobs  # noqa: E402
+from cache import layer_cache  # noqa: E402
+from exports import buffer_or_upload, concatenate_objects, csv_chunks, geojson_chunks  # noqa: E402
+
+from ezesri import FeatureStream  # noqa: E402
+from ezesri.testing import MockArcGISServer, SyntheticLayer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    layers = {
+        0: SyntheticLayer('Points', count=230, geometry='point', max_record_count=40),
+        1: SyntheticLayer('Parcels', count=55, geometry='polygon', vertices=6),
+    }
+    layer_cache.clear()
+    with MockArcGISServer(layers) as server:
+        yield server
+    layer_cache.clear()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_CHUNK_FEATURES', 50)
+    return jobs.LocalJobStore(str(tmp_path / 'jobs'))
+
+
+def inline_dispatch(store):
+    """Runs dispatched steps immediately, like JOB_RUNNER=inline."""
+    dispatched = []
+
+    def dispatch(step):
+        dispatched.append(step)
+        try:
+            jobs.run_step(store, step, dispatch)
+        except Exception:
+            pass
+
+    dispatch.steps = dispatched
+    return dispatch
+
+
+def _result(store, status):
+    assert status['status'] == 'done', status
+    with open(status['downloadUrl'][len('file://'):], 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def test_geojson_job_matches_extract(server, store):
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, inline_dispatch(store))
+    status = jobs.job_status(store, status['jobId'])
+
+    stream = FeatureStream(server.layer_url(0))
+    assert _result(store, status) == ''.join(geojson_chunks(stream, stream.has_geometry))
+    assert status['progress'] == {'chunks': 5, 'chunksDone': 5, 'featureCount': 230, 'featuresDone': 230}
+    assert json.loads(_result(store, status))['metadata']['featureCount'] == 230
+
+
+def test_csv_job_matches_extract(server, store):
+    params = {'url': server.layer_url(1), 'format': 'csv', 'csv_geometry': 'wkt'}
+    status = jobs.submit_job(store, params, inline_dispatch(store))
+    status = jobs.job_status(store, status['jobId'])
+
+    stream = FeatureStream(server.layer_url(1))
+    assert _result(store, status) == ''.join(csv_chunks(stream, stream.metadata, 'wkt'))
+
+
+def test_job_with_no_features(server, store):
+    server.layers[2] = SyntheticLayer('Empty', count=0)
+    status = jobs.submit_job(store, {'url': server.layer_url(2)}, inline_dispatch(store))
+    status = jobs.job_status(store, status['jobId'])
+    assert json.loads(_result(store, status))['features'] == []
+
+
+def test_failed_chunk_is_retried(server, store, monkeypatch):
+    failures = []
+    real_stream = jobs.FeatureStream
+
+    def flaky_stream(url, **kwargs):
+        if not failures and 101 in kwargs.get('object_ids', ()):
+            failures.append(url)
+            raise RuntimeError('connection reset')
+        return real_stream(url, **kwargs)
+
+    monkeypatch.setattr(jobs, 'FeatureStream', flaky_stream)
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, inline_dispatch(store))
+    job_id = status['jobId']
+
+    assert jobs.job_status(store, job_id)['status'] == 'done'
+    assert store.get_json(jobs._chunk_key(job_id, 2))['attempts'] == 2
+    assert store.get_json(jobs._chunk_key(job_id, 1))['attempts'] == 1
+    assert len(json.loads(_result(store, jobs.job_status(store, job_id)))['features']) == 230
+
+
+def test_chunk_out_of_attempts_fails_job(server, store, monkeypatch):
+    real_stream = jobs.FeatureStream
+
+    def broken_stream(url, **kwargs):
+        if 101 in kwargs.get('object_ids', ()):
+            raise RuntimeError('connection reset')
+        return real_stream(url, **kwargs)
+
+    monkeypatch.setattr(jobs, 'FeatureStream', broken_stream)
+    dispatch = inline_dispatch(store)
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, dispatch)
+    status = jobs.job_status(store, status['jobId'])
+
+    assert status['status'] == 'failed'
+    assert status['error'] == 'connection reset'
+    assert [s.get('chunk') for s in dispatch.steps].count(2) == jobs.MAX_CHUNK_ATTEMPTS
+    assert store.get_json(f"{status['jobId']}/result.json") is None
+
+
+def test_assembly_has_a_single_winner(server, store, monkeypatch):
+    finalize = jobs.finalize_if_complete
+    monkeypatch.setattr(jobs, 'finalize_if_complete', lambda *args: False)
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, inline_dispatch(store))
+    job = store.get_json(f"{status['jobId']}/job.json")
+    assert jobs.job_status(store, job['id'])['progress']['chunksDone'] == job['chunks']
+
+    assembled = []
+    monkeypatch.setattr(jobs, 'assemble', lambda store, job, attempt, dispatch: assembled.append(attempt))
+    barrier = threading.Barrier(8)
+    wins = []
+
+    def claim():
+        barrier.wait()
+        wins.append(finalize(store, job, lambda step: None))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert wins.count(True) == 1
+    assert assembled == [0]
+
+
+def test_stale_running_chunk_is_dispatched_again(server, store, monkeypatch):
+    steps = []
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, steps.append)
+    job_id = status['jobId']
+    jobs.run_step(store, steps.pop(), steps.append)
+    assert len(steps) == 5
+
+    # Chunk 0 started and its invocation died without recording anything
+    jobs._put_chunk_state(store, job_id, 0, {'status': 'running', 'attempts': 1})
+    steps.clear()
+    assert jobs.job_status(store, job_id, dispatch=steps.append)['status'] == 'running'
+    assert steps == []
+
+    later = time.time() + jobs.JOB_STEP_TIMEOUT + 1
+    monkeypatch.setattr(jobs.time, 'time', lambda: later)
+    jobs.job_status(store, job_id, dispatch=steps.append)
+    jobs.job_status(store, job_id, dispatch=steps.append)
+
+    assert steps == [{'jobId': job_id, 'step': 'chunk', 'chunk': index} for index in range(5)]
+    assert store.get_json(jobs._chunk_key(job_id, 0))['status'] == 'retrying'
+
+
+def test_stale_chunk_out_of_attempts_fails(server, store, monkeypatch):
+    steps = []
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, steps.append)
+    job_id = status['jobId']
+    jobs.run_step(store, steps.pop(), steps.append)
+    jobs._put_chunk_state(store, job_id, 3, {'status': 'running', 'attempts': jobs.MAX_CHUNK_ATTEMPTS})
+
+    later = time.time() + jobs.JOB_STEP_TIMEOUT + 1
+    monkeypatch.setattr(jobs.time, 'time', lambda: later)
+    status = jobs.job_status(store, job_id, dispatch=steps.append)
+
+    assert status['status'] == 'failed'
+    assert status['error'] == 'Chunk 3 timed out'
+
+
+def test_stale_assembly_is_dispatched_again(server, store, monkeypatch):
+    monkeypatch.setattr(jobs, 'assemble', lambda store, job, attempt, dispatch: None)
+    status = jobs.submit_job(store, {'url': server.layer_url(0)}, inline_dispatch(store))
+    job_id = status['jobId']
+    monkeypatch.undo()
+    monkeypatch.setattr(jobs, 'JOB_CHUNK_FEATURES', 50)
+
+    # Every chunk is done but the assembly died before writing anything
+    assert store.get_json(f"{job_id}/result.json") is None
+    later = time.time() + jobs.JOB_STEP_TIMEOUT + 1
+    monkeypatch.setattr(jobs.time, 'time', lambda: later)
+    steps = []
+    jobs.job_status(store, job_id, dispatch=steps.append)
+    assert steps == [{'jobId': job_id, 'step': 'assemble', 'attempt': 1}]
+
+    jobs.run_step(store, steps[0], steps.append)
+    stream = FeatureStream(server.layer_url(0))
+    assert _result(store, jobs.job_status(store, job_id)) == ''.join(geojson_chunks(stream, stream.has_geometry))
+
+
+class FakeS3:
+    """The multipart upload calls concatenate_objects makes, on in-memory objects."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.uploads = {}
+        self.part_sizes = []
+        self.copied = []
+        self.aborted = []
+
+    def create_multipart_upload(self, Bucket, Key, **options):
+        self.uploads['u1'] = {}
+        return {'UploadId': 'u1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{PartNumber}"'}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange):
+        start, end = map(int, CopySourceRange[len('bytes='):].split('-'))
+        self.uploads[UploadId][PartNumber] = self.objects[CopySource['Key']][start:end + 1]
+        self.copied.append(PartNumber)
+        return {'CopyPartResult': {'ETag': f'"{PartNumber}"'}}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = map(int, Range[len('bytes='):].split('-'))
+        return {'Body': io.BytesIO(self.objects[Key][start:end + 1])}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = [self.uploads[UploadId][p['PartNumber']] for p in MultipartUpload['Parts']]
+        self.part_sizes = [len(part) for part in parts]
+        self.objects[Key] = b''.join(parts)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        del self.uploads[UploadId]
+        self.aborted.append(Key)
+
+
+def test_concatenate_objects_copies_large_parts():
+    objects = {'a': b'a' * 25, 'b': b'b' * 3, 'c': b'c' * 12, 'd': b'd' * 4}
+    client = FakeS3(objects)
+    segments = [b'[', ('a', 0, 25), ('b', 1, 2), ('c', 0, 12), ('d', 0, 4), b']']
+
+    size = concatenate_objects(client, 'bucket', 'out', segments, 'text/plain', min_part_size=10)
+
+    expected = b'[' + b'a' * 25 + b'bb' + b'c' * 12 + b'dddd' + b']'
+    assert objects['out'] == expected
+    assert size == len(expected)
+    assert all(part >= 10 for part in client.part_sizes[:-1])
+    assert client.copied
+
+
+def test_concatenate_objects_with_only_small_segments():
+    client = FakeS3({'a': b'abc'})
+    concatenate_objects(client, 'bucket', 'out', [b'x', ('a', 1, 2)], 'text/plain', min_part_size=10)
+    assert client.objects['out'] == b'xbc'
+    assert client.part_sizes == [3]
+
+
+def test_small_export_is_buffered():
+    client = FakeS3({})
+    data, upload, size = buffer_or_upload(['ab', 'cd'], client, 'bucket', 'out', 'text/csv', 'x.csv', threshold=10)
+
+    assert (data, upload, size) == (b'abcd', None, 4)
+    assert client.uploads == {}
+
+
+def test_large_export_is_uploaded_in_parts():
+    client = FakeS3({})
+    chunks = [f'{n:04d}' for n in range(10)]
+
+    data, upload, size = buffer_or_upload(chunks, client, 'bucket', 'out', 'text/csv', 'x.csv', threshold=6, part_size=12)
+
+    assert data == b''
+    assert size == 40
+    assert client.objects['out'] == ''.join(chunks).encode('utf-8')
+    assert client.part_sizes == [12, 12, 12, 4]
+    assert len(upload.parts) == 4
+
+
+def test_export_without_bucket_is_buffered():
+    data, upload, _ = buffer_or_upload(['x' * 50], None, None, 'out', 'text/csv', 'x.csv', threshold=10)
+    assert upload is None and data == b'x' * 50
+
+
+def test_failed_export_aborts_the_upload():
+    client = FakeS3({})
+
+    def chunks():
+        yield 'x' * 20
+        yield 'y' * 20
+        raise RuntimeError('layer query failed')
+
+    with pytest.raises(RuntimeError, match='layer query failed'):
+        buffer_or_upload(chunks(), client, 'bucket', 'out', 'text/csv', 'x.csv', threshold=10, part_size=15)
+
+    assert client.aborted == ['out']
+    assert 'out' not in client.objects
@@ -0,0 +1,38 @@
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..', 'web', 'lambda')
+sys.path.insert(0, LAMBDA_DIR)
+
+_spec = importlib.util.spec_from_file_location('handler_streaming', os.path.join(LAMBDA_DIR, 'handler-streaming.py'))
+handler_streaming = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(handler_streaming)
+
+HEADERS = {'Content-Type': 'text/csv'}
+
+
+def _prelude(status_code, headers):
+    return json.dumps({'statusCode': status_code, 'headers': headers}).encode('utf-8') + b'\x00' * 8
+
+
+def test_stream_sends_the_prelude_then_the_body():
+    stream = handler_streaming.http_integration_stream(200, HEADERS, iter(['a,b\r\n', '', '1,2\r\n']))
+
+    assert list(stream) == [_prelude(200, HEADERS), b'a,b\r\n', b'1,2\r\n']
+
+
+def test_body_error_after_the_first_chunk_is_raised_from_the_stream():
+    def chunks():
+        yield 'a,b\r\n'
+        raise RuntimeError('batch 2 failed')
+
+    stream = handler_streaming.http_integration_stream(200, HEADERS, chunks())
+
+    assert next(stream) == _prelude(200, HEADERS)
+    assert next(stream) == b'a,b\r\n'
+    with pytest.raises(RuntimeError, match='batch 2 failed'):
+        next(stream)
@@ -1,66 +1,59 @@
 'use client'
 
-import { useState, useEffect, useMemo } from 'react'
+import { useState, useEffect } from 'react'
 import Header from '@/components/Header'
 import Footer from '@/components/Footer'
 import DirectorySearch, { SortOption } from '@/components/DirectorySearch'
 import ServiceCard from '@/components/ServiceCard'
+import {
+  CatalogSummary,
+  Service,
+  categoryOf,
+  loadCategory,
+  loadServices,
+  loadSummary,
+  loadTopServices,
+  searchOrdinals,
+} from '@/lib/catalog'
 
-interface Layer {
-  id: number
-  name: string
-  type: string | null
-}
-
-interface Service {
-  id: string
-  title: string
-  place: string
-  category: string
-  categoryKey: string
-  url: string
-  description: string
-  owner: string
-  numViews: number
-  tags: string[]
-  layers: Layer[]
-  layerCount: number
-  capabilities: string
-  maxRecordCount: number | null
-}
-
-interface CategoryStat {
-  key: string
-  name: string
-  count: number
-  layers: number
-}
-
-interface Catalog {
-  generated: string
-  summary: {
-    totalServices: number
-    totalLayers: number
-    totalViews: number
-    categoryCount: number
+// Sorts in place. The catalog shards are already ordered by views.
+function sortServices(services: Service[], sortBy: SortOption) {
+  switch (sortBy) {
+    case 'views':
+      services.sort((a, b) => b.numViews - a.numViews)
+      break
+    case 'title':
+      services.sort((a, b) => {
+        // Case-insensitive, ignore leading special characters
+        const aTitle = a.title.replace(/^[^a-zA-Z0-9]+/, '').toLowerCase()
+        const bTitle = b.title.replace(/^[^a-zA-Z0-9]+/, '').toLowerCase()
+        return aTitle.localeCompare(bTitle)
+      })
+      break
+    case 'layers':
+      services.sort((a, b) => b.layerCount - a.layerCount)
+      break
   }
-  categories: CategoryStat[]
-  services: Service[]
 }
 
 export default function DirectoryPage() {
-  const [catalog, setCatalog] = useState<Catalog | null>(null)
+  const [catalog, setCatalog] = useState<CatalogSummary | null>(null)
+  const [topServices, setTopServices] = useState<Service[]>([])
+  // Null while the default view (most viewed, no filters) shows top services
+  const [results, setResults] = useState<{ services: Service[]; total: number } | null>(null)
   const [isLoading, setIsLoading] = useState(true)
+  const [isSearching, setIsSearching] = useState(false)
   const [searchQuery, setSearchQuery] = useState('')
   const [selectedCategories, setSelectedCategories] = useState<Set<string>>(new Set())
   const [expandedId, setExpandedId] = useState<string | null>(null)
   const [sortBy, setSortBy] = useState<SortOption>('views')
 
   useEffect(() => {
-    fetch('/catalog.json')
-      .then(res => res.json())
-      .then(data => {
-        setCatalog(data)
+    loadSummary()
+      .then(async summary => {
+        const top = await loadTopServices(summary)
+        setCatalog(summary)
+        setTopServices(top)
         setIsLoading(false)
       })
       .catch(err => {
@@ -69,49 +62,64 @@ export default function DirectoryPage() {
       })
   }, [])
 
-  const filteredServices = useMemo(() => {
-    if (!catalog) return []
-
-    let services = [...catalog.services]
+  // Load only the shards the current search, filters and sort need
+  useEffect(() => {
+    if (!catalog) return
 
-    // Filter by category
-    if (selectedCategories.size > 0) {
-      services = services.filter(s => selectedCategories.has(s.categoryKey))
+    const query = searchQuery.trim()
+    if (!query && selectedCategories.size === 0 && sortBy === 'views') {
+      setResults(null)
+      setIsSearching(false)
+      return
     }
 
-    // Filter by search query
-    if (searchQuery.trim()) {
-      const query = searchQuery.toLowerCase()
-      services = services.filter(s =>
-        s.title.toLowerCase().includes(query) ||
-        s.place.toLowerCase().includes(query) ||
-        s.description.toLowerCase().includes(query) ||
-        s.tags.some(t => t.toLowerCase().includes(query)) ||
-        s.category.toLowerCase().includes(query)
-      )
-    }
+    let cancelled = false
+    setIsSearching(true)
 
-    // Sort
-    switch (sortBy) {
-      case 'views':
-        services.sort((a, b) => b.numViews - a.numViews)
-        break
-      case 'title':
-        services.sort((a, b) => {
-          // Case-insensitive, ignore leading special characters
-          const aTitle = a.title.replace(/^[^a-zA-Z0-9]+/, '').toLowerCase()
-          const bTitle = b.title.replace(/^[^a-zA-Z0-9]+/, '').toLowerCase()
-          return aTitle.localeCompare(bTitle)
-        })
-        break
-      case 'layers':
-        services.sort((a, b) => b.layerCount - a.layerCount)
-        break
+    const search = async () => {
+      let services: Service[]
+      if (!query && selectedCategories.size === 0) {
+        // Only a sort: its first services are precomputed for the whole catalog
+        services = await loadTopServices(catalog, sortBy)
+        return { services, total: catalog.summary.totalServices }
+      }
+      if (query) {
+        let ordinals = await searchOrdinals(catalog, query)
+        if (selectedCategories.size > 0) {
+          ordinals = ordinals.filter(o => selectedCategories.has(categoryOf(catalog, o).key))
+        }
+        services = await loadServices(catalog, ordinals)
+      } else {
+        const keys = selectedCategories.size > 0
+          ? Array.from(selectedCategories)
+          : catalog.categories.map(c => c.key)
+        services = (await Promise.all(keys.map(key => loadCategory(catalog, key)))).flat()
+      }
+      sortServices(services, sortBy)
+      return { services, total: services.length }
     }
 
-    return services
+    search()
+      .then(found => {
+        if (cancelled) return
+        setResults(found)
+        setIsSearching(false)
+      })
+      .catch(err => {
+        console.error('Failed to search catalog:', err)
+        if (cancelled) return
+        setResults({ services: [], total: 0 })
+        setIsSearching(false)
+      })
+
+    return () => {
+      cancelled = true
+    }
   }, [catalog, searchQuery, selectedCategories, sortBy])
 
+  const filteredServices = results?.services ?? topServices
+  const resultCount = results ? results.total : catalog?.summary.totalServices ?? 0
+
   const toggleCategory = (key: string) => {
     setSelectedCategories(prev => {
       const next = new Set(prev)
@@ -206,14 +214,15 @@ export default function DirectoryPage() {
               selectedCategories={selectedCategories}
               onToggleCategory={toggleCategory}
               onClearFilters={clearFilters}
-              resultCount={filteredServices.length}
+              resultCount={resultCount}
+              isSearching={isSearching}
               sortBy={sortBy}
               onSortChange={setSortBy}
             />
 
             {/* Results */}
             <div className="mt-8">
-              {filteredServices.length === 0 ? (
+              {filteredServices.length === 0 && !isSearching ? (
                 <div className="text-center py-16">
                   <div className="w-16 h-16 mx-auto mb-6 rounded-2xl bg-ink-900/50 flex items-center justify-center">
                     <svg className="w-8 h-8 text-ink-600" fill="none" viewBox="0 0 24 24" stroke="currentColor">
@@ -235,9 +244,9 @@ export default function DirectoryPage() {
                       )}
                     />
                   ))}
-                  {filteredServices.length > 100 && (
+                  {resultCount > 100 && (
                     <div className="text-center py-8 text-ink-400">
-                      Showing first 100 of {filteredServices.length.toLocaleString()} results.
+                      Showing first 100 of {resultCount.toLocaleString()} results.
                       Use search to narrow down.
                     </div>
                   )}
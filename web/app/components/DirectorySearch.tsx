@@ -1,9 +1,4 @@
-interface CategoryStat {
-  key: string
-  name: string
-  count: number
-  layers: number
-}
+import { CategoryStat } from '@/lib/catalog'
 
 export type SortOption = 'views' | 'title' | 'layers'
 
@@ -15,6 +10,7 @@ interface DirectorySearchProps {
   onToggleCategory: (key: string) => void
   onClearFilters: () => void
   resultCount: number
+  isSearching?: boolean
   sortBy: SortOption
   onSortChange: (sort: SortOption) => void
 }
@@ -33,6 +29,7 @@ export default function DirectorySearch({
   onToggleCategory,
   onClearFilters,
   resultCount,
+  isSearching = false,
   sortBy,
   onSortChange,
 }: DirectorySearchProps) {
@@ -94,8 +91,12 @@ export default function DirectorySearch({
       {/* Results count, sort, and clear */}
       <div className="flex items-center justify-between text-sm">
         <span className="text-ink-400">
-          {resultCount.toLocaleString()} {resultCount === 1 ? 'service' : 'services'}
-          {hasFilters && ' found'}
+          {isSearching ? 'Searching...' : (
+            <>
+              {resultCount.toLocaleString()} {resultCount === 1 ? 'service' : 'services'}
+              {hasFilters && ' found'}
+            </>
+          )}
         </span>
         <div className="flex items-center gap-4">
           {hasFilters && (
@@ -0,0 +1,188 @@
+/**
+ * Loader and search for the sharded directory catalog in public/catalog/,
+ * written by harvester/generate_directory.py:
+ *
+ * - summary.json: totals, and each category's shard and first ordinal
+ * - top.json: the most viewed services, for the first paint
+ * - top-<sort>.json: the first services in another sort order, for sorting
+ *   the directory without a filter
+ * - categories/<key>.json: a category's services, most viewed first
+ * - index/<c>.json: inverted search index for tokens starting with c
+ *
+ * Services are numbered (ordinals) across the category shards in order, so
+ * a search posting maps to a shard through the category offsets. Shards are
+ * fetched on demand and cached for the session.
+ */
+
+const CATALOG_PATH = '/catalog'
+
+export interface Layer {
+  id: number
+  name: string
+  type: string | null
+}
+
+export interface Service {
+  id: string
+  title: string
+  place: string
+  category: string
+  categoryKey: string
+  url: string
+  description: string
+  owner: string
+  numViews: number
+  tags: string[]
+  layers: Layer[]
+  layerCount: number
+  capabilities: string
+  maxRecordCount: number | null
+}
+
+export interface CategoryStat {
+  key: string
+  name: string
+  count: number
+  layers: number
+}
+
+export interface CategoryShard extends CategoryStat {
+  shard: string
+  offset: number
+}
+
+export interface CatalogSummary {
+  generated: string
+  version: string
+  summary: {
+    totalServices: number
+    totalLayers: number
+    totalViews: number
+    categoryCount: number
+  }
+  categories: CategoryShard[]
+  // Shard of the first services in each sort order ('views', 'title', 'layers')
+  top: Record<string, string>
+  indexShards: string[]
+}
+
+interface IndexShard {
+  tokens: string[]
+  // Sorted ordinals per token, delta-encoded
+  postings: number[][]
+}
+
+const shardCache = new Map<string, Promise<unknown>>()
+
+// Shard URLs carry the catalog version, so a regenerated catalog never
+// mixes with cached shards of the previous one.
+function loadShard<T>(summary: CatalogSummary, path: string): Promise<T> {
+  const url = `${CATALOG_PATH}/${path}?v=${summary.version}`
+  let pending = shardCache.get(url)
+  if (!pending) {
+    pending = fetch(url).then(res => {
+      if (!res.ok) throw new Error(`Failed to load ${path}: ${res.status}`)
+      return res.json()
+    })
+    pending.catch(() => shardCache.delete(url))
+    shardCache.set(url, pending)
+  }
+  return pending as Promise<T>
+}
+
+export async function loadSummary(): Promise<CatalogSummary> {
+  const res = await fetch(`${CATALOG_PATH}/summary.json`, { cache: 'no-cache' })
+  if (!res.ok) throw new Error(`Failed to load catalog summary: ${res.status}`)
+  return res.json()
+}
+
+// The first services of the whole catalog in `sort` order (most viewed by default)
+export function loadTopServices(summary: CatalogSummary, sort = 'views'): Promise<Service[]> {
+  return loadShard<Service[]>(summary, summary.top?.[sort] ?? 'top.json')
+}
+
+export function loadCategory(summary: CatalogSummary, key: string): Promise<Service[]> {
+  const category = summary.categories.find(c => c.key === key)
+  return category ? loadShard<Service[]>(summary, category.shard) : Promise.resolve([])
+}
+
+// Same rule as SEARCH_TOKEN in generate_directory.py: runs of letters and digits
+const TOKEN_PATTERN = new RegExp('[\\p{L}\\p{N}]+', 'gu')
+
+export function tokenize(query: string): string[] {
+  return query.toLowerCase().match(TOKEN_PATTERN) ?? []
+}
+
+function indexShardOf(token: string): string {
+  return /^[a-z0-9]$/.test(token[0]) ? token[0] : '_'
+}
+
+function lowerBound(sorted: string[], target: string): number {
+  let lo = 0
+  let hi = sorted.length
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1
+    if (sorted[mid] < target) lo = mid + 1
+    else hi = mid
+  }
+  return lo
+}
+
+// Ordinals of services with a token starting with `prefix`
+async function matchPrefix(summary: CatalogSummary, prefix: string): Promise<Set<number>> {
+  const matches = new Set<number>()
+  const shard = indexShardOf(prefix)
+  if (!summary.indexShards.includes(shard)) return matches
+
+  const index = await loadShard<IndexShard>(summary, `index/${shard}.json`)
+  for (let i = lowerBound(index.tokens, prefix); i < index.tokens.length && index.tokens[i].startsWith(prefix); i++) {
+    let ordinal = 0
+    for (const delta of index.postings[i]) {
+      ordinal += delta
+      matches.add(ordinal)
+    }
+  }
+  return matches
+}
+
+/**
+ * Ordinals of the services matching every word of `query`, in ordinal order.
+ * A word matches a service when it starts one of the tokens of its title,
+ * place, category or tags, so results update as a word is typed.
+ */
+export async function searchOrdinals(summary: CatalogSummary, query: string): Promise<number[]> {
+  const words = Array.from(new Set(tokenize(query)))
+  if (words.length === 0) return []
+
+  const sets = await Promise.all(words.map(word => matchPrefix(summary, word)))
+  sets.sort((a, b) => a.size - b.size)
+  const [smallest, ...rest] = sets
+  return Array.from(smallest)
+    .filter(ordinal => rest.every(set => set.has(ordinal)))
+    .sort((a, b) => a - b)
+}
+
+export function categoryOf(summary: CatalogSummary, ordinal: number): CategoryShard {
+  const { categories } = summary
+  let lo = 0
+  let hi = categories.length - 1
+  while (lo < hi) {
+    const mid = (lo + hi + 1) >>> 1
+    if (categories[mid].offset <= ordinal) lo = mid
+    else hi = mid - 1
+  }
+  return categories[lo]
+}
+
+// Loads the shards holding `ordinals` and returns their services in the same order
+export async function loadServices(summary: CatalogSummary, ordinals: number[]): Promise<Service[]> {
+  const categories = Array.from(new Set(ordinals.map(ordinal => categoryOf(summary, ordinal))))
+  const shards = new Map<string, Service[]>()
+  await Promise.all(categories.map(async category => {
+    shards.set(category.key, await loadShard<Service[]>(summary, category.shard))
+  }))
+  return ordinals.map(ordinal => {
+    const category = categoryOf(summary, ordinal)
+    return shards.get(category.key)![ordinal - category.offset]
+  })
+}
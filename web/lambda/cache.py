@@ -0,0 +1,207 @@
+"""
+Layer metadata and feature count cache for the Lambda handlers.
+
+Entries are kept in memory for the life of a warm container and, when a
+backing store is configured, in S3 (CACHE_BUCKET) or a local directory
+(CACHE_DIR) so other containers and cold starts can reuse them. Every entry
+expires after CACHE_TTL_SECONDS. Errors are never cached.
+
+Counts are keyed by the layer's ``editingInfo.lastEditDate`` as well as its
+URL, so an edit seen in refreshed metadata also refreshes the count.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+import requests
+
+logger = logging.getLogger()
+
+# How long metadata and counts are served from the cache.
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', 300))
+
+# Entries kept in memory per container; the oldest are dropped beyond this.
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+
+CACHE_DIR = os.environ.get('CACHE_DIR')
+CACHE_BUCKET = os.environ.get('CACHE_BUCKET')
+
+
+class LocalCacheStore:
+    """Keeps cache entries as JSON files in a local directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, f"{key}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key: str, entry: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.json")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+
+class S3CacheStore:
+    """Keeps cache entries as JSON objects in an S3 bucket under ``prefix``."""
+
+    def __init__(self, client, bucket: str, prefix: str = 'cache/'):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def put(self, key: str, entry: dict):
+        self.client.put_object(
+            Bucket=self.bucket, Key=f"{self.prefix}{key}.json",
+            Body=json.dumps(entry).encode('utf-8'), ContentType='application/json'
+        )
+
+
+class LayerCache:
+    """
+    A TTL cache of JSON values in memory, in front of an optional backing store.
+
+    Backing store failures are logged and treated as misses, so the cache
+    never turns an upstream success into an error.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, backing=None, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.backing = backing
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry['expires'] > now:
+            return entry['value']
+
+        if self.backing is None:
+            return None
+        try:
+            entry = self.backing.get(key)
+        except Exception as e:
+            logger.warning(f"Cache read failed: {e}")
+            return None
+        if entry is None or entry.get('expires', 0) <= now:
+            return None
+        self._remember(key, entry)
+        return entry['value']
+
+    def put(self, key: str, value: Any):
+        entry = {'expires': time.time() + self.ttl, 'value': value}
+        self._remember(key, entry)
+        if self.backing is not None:
+            try:
+                self.backing.put(key, entry)
+            except Exception as e:
+                logger.warning(f"Cache write failed: {e}")
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Any], cacheable: Callable[[Any], bool] = lambda v: True):
+        """Returns the cached value for ``key``, or calls ``fetch`` and caches its result if ``cacheable``."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = fetch()
+        if value is not None and cacheable(value):
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key: str, entry: dict):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+
+def default_backing():
+    """The backing store configured by CACHE_DIR or CACHE_BUCKET, if any."""
+    if CACHE_DIR:
+        return LocalCacheStore(CACHE_DIR)
+    if CACHE_BUCKET:
+        import boto3
+
+        return S3CacheStore(boto3.client('s3'), CACHE_BUCKET)
+    return None
+
+
+layer_cache = LayerCache(backing=default_backing())
+
+
+def _normalize_url(url: str) -> str:
+    return url.strip().rstrip('/')
+
+
+def _fetch_metadata(url: str) -> dict:
+    try:
+        response = requests.get(url, params={'f': 'json'}, timeout=30)
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Failed to fetch metadata: {e}")
+        return {"error": str(e)}
+
+
+def get_metadata(url: str) -> dict:
+    """Layer metadata (``f=json``), from the cache when fresh. Failures return ``{"error": ...}``."""
+    return layer_cache.get_or_fetch(
+        LayerCache.key('metadata', _normalize_url(url)),
+        lambda: _fetch_metadata(url),
+        cacheable=lambda metadata: isinstance(metadata, dict) and 'error' not in metadata
+    )
+
+
+def _fetch_count(url: str) -> Optional[int]:
+    try:
+        response = requests.get(
+            f"{_normalize_url(url)}/query",
+            params={'where': '1=1', 'returnCountOnly': 'true', 'f': 'json'},
+            timeout=30
+        )
+        if response.ok:
+            return response.json().get('count')
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning(f"Could not get feature count: {e}")
+    return None
+
+
+def get_feature_count(url: str, metadata: dict) -> Optional[int]:
+    """The layer's total feature count, from the cache when fresh, or None if the query fails."""
+    last_edit = (metadata.get('editingInfo') or {}).get('lastEditDate')
+    return layer_cache.get_or_fetch(
+        LayerCache.key('count', _normalize_url(url), last_edit),
+        lambda: _fetch_count(url),
+        cacheable=lambda count: isinstance(count, int)
+    )
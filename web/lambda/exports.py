@@ -0,0 +1,384 @@
+"""
+Export encoders and S3 upload helpers shared by the Lambda handlers.
+"""
+
+import csv
+import io
+import json
+import logging
+from typing import Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger()
+
+# Multipart upload part size. S3 requires at least 5MB for every part but the last.
+S3_PART_SIZE_BYTES = 8 * 1024 * 1024
+S3_MIN_PART_BYTES = 5 * 1024 * 1024
+
+_SKIPPED_FIELD_TYPES = ('esriFieldTypeGeometry', 'esriFieldTypeBlob', 'esriFieldTypeRaster')
+
+FORMATS = {
+    'geojson': ("application/geo+json", "export.geojson"),
+    'csv': ("text/csv", "export.csv"),
+}
+
+
+def geojson_header() -> str:
+    return '{"type": "FeatureCollection", "features": ['
+
+
+def geojson_footer(count: int, has_geometry: bool) -> str:
+    return '], "metadata": ' + json.dumps({"featureCount": count, "hasGeometry": has_geometry}) + '}'
+
+
+def geojson_fragment(features: list) -> str:
+    """Encodes features as the comma-separated body of a ``features`` array."""
+    return ', '.join(json.dumps(f) for f in features)
+
+
+def geojson_chunks(batches: Iterable[list], has_geometry: bool) -> Iterator[str]:
+    """
+    Encodes feature batches as one GeoJSON FeatureCollection, a batch at a time.
+
+    The collection's ``metadata`` member is written after the features, once
+    the final count is known.
+    """
+    yield geojson_header()
+    count = 0
+    for features in batches:
+        if not features:
+            continue
+        encoded = geojson_fragment(features)
+        yield encoded if count == 0 else ', ' + encoded
+        count += len(features)
+    yield geojson_footer(count, has_geometry)
+
+
+CSV_GEOMETRY_OPTIONS = ('auto', 'centroid', 'wkt', 'none')
+
+
+_RAGGED_TYPES = {
+    'esriGeometryPoint': 'Point',
+    'esriGeometryMultipoint': 'Point',
+    'esriGeometryPolyline': 'LineString',
+    'esriGeometryPolygon': 'Polygon',
+}
+
+
+def _ragged_geometries(features: list, kind: str):
+    """
+    Builds shapely geometries for a batch of GeoJSON features in one call.
+
+    ``kind`` is 'Point', 'LineString' or 'Polygon'; single and multi-part
+    geometries of that kind are accepted. The coordinates are flattened into
+    one array with part offsets and passed to shapely.from_ragged_array(),
+    which is several times faster than building each geometry with shape().
+    Single-part geometries are unwrapped from the multi-part type afterwards.
+    Features without a (matching) geometry come back as None.
+    """
+    import numpy as np
+    import shapely
+    from shapely import GeometryType
+
+    points = []
+    coord_offsets, part_offsets, geom_offsets = [0], [0], [0]
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        geometry_type = geometry.get('type')
+        coordinates = geometry.get('coordinates') or []
+        if geometry_type == kind:
+            coordinates = [coordinates] if coordinates else []
+        elif geometry_type != f"Multi{kind}":
+            coordinates = []
+
+        if kind == 'Polygon':
+            for polygon in coordinates:
+                for ring in polygon:
+                    points.extend(ring)
+                    coord_offsets.append(len(points))
+                part_offsets.append(len(coord_offsets) - 1)
+            geom_offsets.append(len(part_offsets) - 1)
+        elif kind == 'LineString':
+            for line in coordinates:
+                points.extend(line)
+                coord_offsets.append(len(points))
+            part_offsets.append(len(coord_offsets) - 1)
+        else:
+            points.extend(coordinates)
+            coord_offsets.append(len(points))
+
+    if not points:
+        return np.array([None] * len(features), dtype=object)
+    coords = np.array([(p[0], p[1]) for p in points], dtype=float)
+    if kind == 'Polygon':
+        offsets = (coord_offsets, part_offsets, geom_offsets)
+        geometry_type = GeometryType.MULTIPOLYGON
+    elif kind == 'LineString':
+        offsets = (coord_offsets, part_offsets)
+        geometry_type = GeometryType.MULTILINESTRING
+    else:
+        offsets = (coord_offsets,)
+        geometry_type = GeometryType.MULTIPOINT
+    geoms = shapely.from_ragged_array(geometry_type, coords, tuple(np.array(o) for o in offsets))
+
+    single = shapely.get_num_geometries(geoms) == 1
+    geoms[single] = shapely.get_geometry(geoms[single], 0)
+    geoms[shapely.is_empty(geoms)] = None
+    return geoms
+
+
+class CsvEncoder:
+    """
+    Encodes features as CSV rows with columns from the layer's field definitions.
+
+    Columns are the field names, sorted, followed by the geometry columns, so
+    the header is known before the first batch arrives. ``geometry`` selects
+    the geometry columns:
+
+    - ``auto``: latitude/longitude of points, or of the centroid of lines and
+      polygons (the default)
+    - ``centroid``: the same, under centroid_latitude/centroid_longitude for
+      lines and polygons
+    - ``wkt``: latitude/longitude as for ``auto``, plus a ``wkt`` column
+    - ``none``: attributes only
+
+    Tables have no geometry columns. Centroids and WKT for lines and polygons
+    are computed a batch at a time with shapely.
+    """
+
+    def __init__(self, metadata: dict, geometry: str = 'auto'):
+        if geometry not in CSV_GEOMETRY_OPTIONS:
+            raise ValueError(f"Unknown CSV geometry option '{geometry}'. Available: {', '.join(CSV_GEOMETRY_OPTIONS)}")
+        self.fields = sorted(
+            f['name'] for f in metadata.get('fields') or []
+            if f.get('name') and f.get('type') not in _SKIPPED_FIELD_TYPES
+        )
+        geometry_type = metadata.get('geometryType')
+        if geometry_type is None or geometry == 'none':
+            self.include_latlon = self.include_wkt = False
+        else:
+            self.include_latlon = True
+            self.include_wkt = geometry == 'wkt'
+        self.is_point = geometry_type == 'esriGeometryPoint'
+        self.ragged_type = _RAGGED_TYPES.get(geometry_type)
+        if self.ragged_type is None:
+            self.include_latlon = self.include_wkt = False
+
+        geometry_columns = []
+        if self.include_latlon:
+            if geometry == 'centroid' and not self.is_point:
+                geometry_columns += ['centroid_latitude', 'centroid_longitude']
+            else:
+                geometry_columns += ['latitude', 'longitude']
+        if self.include_wkt:
+            geometry_columns.append('wkt')
+        self.columns = self.fields + geometry_columns
+
+        self._output = io.StringIO()
+        self._writer = csv.writer(self._output)
+
+    def header(self) -> str:
+        self._writer.writerow(self.columns)
+        return self._drain()
+
+    def rows(self, features: list) -> str:
+        fields = self.fields
+        rows = []
+        for feature in features:
+            attributes = feature.get('properties') or feature.get('attributes') or {}
+            rows.append([attributes.get(name) for name in fields])
+
+        if self.include_latlon:
+            for row, geometry_values in zip(rows, self._geometry_values(features)):
+                row.extend(geometry_values)
+
+        self._writer.writerows(rows)
+        return self._drain()
+
+    def _geometry_values(self, features: list) -> list:
+        """Per feature: latitude, longitude and, if requested, WKT."""
+        if self.is_point and not self.include_wkt:
+            values = []
+            for feature in features:
+                coords = (feature.get('geometry') or {}).get('coordinates') or []
+                values.append([coords[1], coords[0]] if len(coords) >= 2 else [None, None])
+            return values
+
+        import numpy as np
+        import shapely
+
+        geoms = _ragged_geometries(features, self.ragged_type)
+        centroids = shapely.centroid(geoms)
+        lats = shapely.get_y(centroids).tolist()
+        lons = shapely.get_x(centroids).tolist()
+        missing = np.isnan(lats).tolist()
+        wkts = shapely.to_wkt(geoms, rounding_precision=-1).tolist() if self.include_wkt else None
+
+        values = []
+        for i in range(len(features)):
+            row = [None, None] if missing[i] else [lats[i], lons[i]]
+            if wkts is not None:
+                row.append(wkts[i])
+            values.append(row)
+        return values
+
+    def _drain(self) -> str:
+        text = self._output.getvalue()
+        self._output.seek(0)
+        self._output.truncate()
+        return text
+
+
+def csv_chunks(batches: Iterable[list], metadata: dict, geometry: str = 'auto') -> Iterator[str]:
+    """Encodes feature batches as CSV, a batch at a time."""
+    encoder = CsvEncoder(metadata, geometry)
+    yield encoder.header()
+    for features in batches:
+        if features:
+            yield encoder.rows(features)
+
+
+class S3MultipartUpload:
+    """Uploads an export to S3 in parts as it is produced."""
+
+    def __init__(self, client, bucket: str, key: str, content_type: str, filename: Optional[str] = None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        options = {'ContentType': content_type}
+        if filename:
+            options['ContentDisposition'] = f'attachment; filename="{filename}"'
+        response = client.create_multipart_upload(Bucket=bucket, Key=key, **options)
+        self.upload_id = response['UploadId']
+        self.parts = []
+
+    def upload_part(self, data: bytes):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def copy_part(self, source_key: str, start: int, length: int):
+        """Adds ``length`` bytes of another object in the bucket, from ``start``, as a part copied by S3."""
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part_copy(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            CopySource={'Bucket': self.bucket, 'Key': source_key},
+            CopySourceRange=f"bytes={start}-{start + length - 1}"
+        )
+        self.parts.append({'ETag': response['CopyPartResult']['ETag'], 'PartNumber': part_number})
+
+    def complete(self):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload {self.upload_id}: {e}")
+
+
+def buffer_or_upload(chunks: Iterable[str], client, bucket: Optional[str], key: str, content_type: str,
+                     filename: Optional[str], threshold: int,
+                     part_size: int = S3_PART_SIZE_BYTES) -> Tuple[bytes, Optional[S3MultipartUpload], int]:
+    """
+    Encodes ``chunks`` and either keeps them in memory or streams them to S3.
+
+    Output is buffered until it passes ``threshold`` bytes. Smaller exports
+    are returned as ``(data, None, size)``; larger ones switch to a multipart
+    upload to ``key`` that sends a part whenever ``part_size`` bytes have
+    accumulated, so memory use does not grow with the export, and return
+    ``(b'', upload, size)`` once it is complete. Without ``bucket`` everything
+    is buffered. The upload is aborted if encoding or uploading fails.
+    """
+    buffer = bytearray()
+    size = 0
+    upload = None
+    try:
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            size += len(data)
+            buffer += data
+            if upload is None and bucket and len(buffer) > threshold:
+                upload = S3MultipartUpload(client, bucket, key, content_type, filename)
+            if upload is not None and len(buffer) >= part_size:
+                upload.upload_part(bytes(buffer))
+                buffer.clear()
+        if upload is not None:
+            upload.upload_part(bytes(buffer))
+            upload.complete()
+    except Exception:
+        if upload is not None:
+            upload.abort()
+        raise
+    if upload is not None:
+        return b'', upload, size
+    return bytes(buffer), None, size
+
+
+def read_range(client, bucket: str, key: str, start: int, length: int) -> bytes:
+    """Reads ``length`` bytes of an S3 object from ``start``."""
+    response = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{start + length - 1}")
+    return response['Body'].read()
+
+
+def concatenate_objects(client, bucket: str, key: str, segments: Iterable, content_type: str,
+                        filename: Optional[str] = None, min_part_size: int = S3_MIN_PART_BYTES) -> int:
+    """
+    Writes the concatenation of ``segments`` to an S3 object with a multipart upload.
+
+    A segment is either ``bytes`` or a ``(source_key, start, length)`` range
+    of an object in the same bucket. Ranges of at least ``min_part_size``
+    are copied by S3 (UploadPartCopy) without passing through the function.
+    Literal bytes, smaller ranges and the bytes needed to fill a part up to
+    the minimum are downloaded and uploaded, so at most about
+    ``min_part_size`` bytes are held in memory. Returns the object size in bytes.
+    """
+    upload = S3MultipartUpload(client, bucket, key, content_type, filename)
+    buffer = bytearray()
+    size = 0
+
+    def flush():
+        upload.upload_part(bytes(buffer))
+        buffer.clear()
+
+    try:
+        for segment in segments:
+            if isinstance(segment, bytes):
+                size += len(segment)
+                buffer += segment
+                if len(buffer) >= min_part_size:
+                    flush()
+                continue
+            source_key, start, length = segment
+            size += length
+            while length > 0:
+                if not buffer and length >= min_part_size:
+                    upload.copy_part(source_key, start, length)
+                    break
+                take = min(length, min_part_size - len(buffer))
+                buffer += read_range(client, bucket, source_key, start, take)
+                start += take
+                length -= take
+                if len(buffer) >= min_part_size:
+                    flush()
+        # Only the last part may be smaller than the minimum
+        if buffer or not upload.parts:
+            flush()
+        upload.complete()
+    except Exception:
+        upload.abort()
+        raise
+    return size
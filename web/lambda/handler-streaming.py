@@ -1,303 +1,251 @@
 """
 AWS Lambda handler with streaming response support for large payloads.
+
+The managed Python runtime only returns buffered responses, so this module
+also implements the Lambda Runtime API loop itself. When started as a script
+(see stream-bootstrap and template-streaming.yaml) it posts each response in
+streaming mode: the status line and headers first, then the GeoJSON header,
+each /query batch's features and the footer (or CSV rows) as soon as the
+batch arrives. Time to first byte is one batch rather than the whole
+extraction, and the 6MB buffered response limit no longer applies.
+
+lambda_handler() serves the same routes buffered, for `sam local` and
+invocations outside a Function URL.
 """
 
-import csv
-import io
+import base64
 import json
 import logging
-from typing import Dict, Any, Optional
-from urllib.parse import parse_qs, urlparse
-from awslambdaric.lambda_context import LambdaContext
-import awslambdaric
+import os
+from typing import Dict, Any, Iterable, Iterator, Tuple
+from urllib.parse import parse_qs
 
 import requests
+from ezesri import EsriLayerError, FeatureStream
+
+from cache import get_metadata
+from exports import CSV_GEOMETRY_OPTIONS, csv_chunks, geojson_chunks
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-MAX_FEATURES = 100000
-
-
-def geojson_to_csv(geojson: dict) -> str:
-    """Convert GeoJSON to CSV."""
-    features = geojson.get('features', [])
-    if not features:
-        return ""
-    
-    all_fields = set()
-    for feature in features:
-        props = feature.get('properties', {})
-        if props:
-            all_fields.update(props.keys())
-    
-    field_names = sorted(all_fields)
-    has_geometry = features[0].get('geometry') is not None
-    geom_type = features[0].get('geometry', {}).get('type', '') if has_geometry else ''
-    include_latlon = geom_type == 'Point'
-    
-    output = io.StringIO()
-    
-    if include_latlon:
-        columns = field_names + ['latitude', 'longitude']
-    else:
-        columns = field_names
-    
-    writer = csv.DictWriter(output, fieldnames=columns, extrasaction='ignore')
-    writer.writeheader()
-    
-    for feature in features:
-        row = feature.get('properties', {}) or {}
-        
-        if include_latlon and feature.get('geometry'):
-            coords = feature['geometry'].get('coordinates', [])
-            if len(coords) >= 2:
-                row['longitude'] = coords[0]
-                row['latitude'] = coords[1]
-        
-        writer.writerow(row)
-    
-    return output.getvalue()
-
-
-def get_metadata(url: str) -> dict:
-    """Fetch layer metadata."""
-    params = {'f': 'json'}
-    try:
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to fetch metadata: {e}")
-        return {"error": str(e)}
-
-
-def extract_layer(url: str, where: str = '1=1', bbox: Optional[tuple] = None, max_features: int = MAX_FEATURES) -> Dict[str, Any]:
-    """Extract features from Esri layer."""
-    metadata = get_metadata(url)
-    if "error" in metadata:
-        return {"error": metadata["error"]}
-    
-    has_geometry = metadata.get('geometryType') is not None
-    max_record_count = metadata.get('maxRecordCount', 1000)
-    
-    params = {
-        'f': 'json',
-        'where': where,
-        'returnIdsOnly': 'true'
-    }
-    
-    if bbox and has_geometry:
-        params['geometry'] = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
-        params['geometryType'] = 'esriGeometryEnvelope'
-        params['inSR'] = '4326'
-        params['spatialRel'] = 'esriSpatialRelIntersects'
-    
+# Streamed exports are not held in memory, so the cap only guards against
+# extractions that cannot finish within the function timeout.
+MAX_FEATURES = int(os.environ.get('MAX_FEATURES', 1000000))
+
+# Feature batches requested concurrently from the Esri server.
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+
+# Separates the JSON prelude (status code and headers) from the body in a
+# streamed Function URL response.
+HTTP_INTEGRATION_DELIMITER = b'\x00' * 8
+HTTP_INTEGRATION_CONTENT_TYPE = 'application/vnd.awslambda.http-integration-response'
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+}
+
+
+def json_response(status_code: int, body: dict) -> Tuple[int, Dict[str, str], Iterable[str]]:
+    headers = {"Content-Type": "application/json", **CORS_HEADERS}
+    return status_code, headers, [json.dumps(body)]
+
+
+def parse_params(event: Dict[str, Any]) -> dict:
+    """Merges query string and body parameters (body takes precedence)."""
+    query_params = event.get('queryStringParameters') or {}
+    body_params = {}
+
+    method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
+    if method == 'POST' and event.get('body'):
+        body = event['body']
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+
+        headers = event.get('headers') or {}
+        content_type = headers.get('content-type') or headers.get('Content-Type') or ''
+
+        if 'application/json' in content_type:
+            body_params = json.loads(body)
+        else:
+            parsed = parse_qs(body)
+            body_params = {k: v[0] for k, v in parsed.items()}
+
+    return {**query_params, **body_params}
+
+
+def handle_extract(params: dict) -> Tuple[int, Dict[str, str], Iterable[str]]:
+    """
+    Validates an /extract request and returns its status, headers and body chunks.
+
+    Metadata and object IDs are fetched up front (with the library's retries
+    and ID paging) so errors still get a 400; features are only requested,
+    several batches at a time, as the body is consumed.
+    """
+    url = params.get('url')
+    if not url:
+        return json_response(400, {"error": "Missing 'url' parameter"})
+
+    where = params.get('where', '1=1')
+    format_type = params.get('format', 'geojson').lower()
+    if format_type not in ('geojson', 'csv'):
+        return json_response(400, {"error": f"Format '{format_type}' not supported"})
+    csv_geometry = (params.get('csv_geometry') or 'auto').lower()
+    if csv_geometry not in CSV_GEOMETRY_OPTIONS:
+        return json_response(400, {"error": f"Invalid csv_geometry '{csv_geometry}'. Available: {', '.join(CSV_GEOMETRY_OPTIONS)}"})
+
+    bbox = None
+    bbox_str = params.get('bbox')
+    if bbox_str:
+        try:
+            bbox = tuple(map(float, bbox_str.split(',')))
+            if len(bbox) != 4:
+                raise ValueError("bbox must have 4 values")
+        except (ValueError, AttributeError) as e:
+            return json_response(400, {"error": f"Invalid bbox: {e}"})
+
     try:
-        r = requests.get(f"{url}/query", params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Failed to get object IDs: {e}"}
-    
-    if 'error' in data:
-        return {"error": f"Esri API error: {data['error']}"}
-    
-    object_ids = data.get('objectIds', [])
-    
-    if not object_ids:
-        return {
-            "type": "FeatureCollection",
-            "features": [],
-            "metadata": {"featureCount": 0}
-        }
-    
-    total_features = len(object_ids)
-    if total_features > max_features:
-        return {
-            "error": f"Layer has {total_features:,} features, which exceeds limit of {max_features:,}. Add a filter to reduce the count.",
-            "featureCount": total_features,
+        stream = FeatureStream(url, where=where, bbox=bbox, workers=BATCH_WORKERS, metadata=get_metadata(url))
+    except (EsriLayerError, requests.exceptions.RequestException) as e:
+        return json_response(400, {"error": str(e)})
+
+    if len(stream) > MAX_FEATURES:
+        return json_response(400, {
+            "error": f"Layer has {len(stream):,} features, which exceeds limit of {MAX_FEATURES:,}. Add a filter to reduce the count.",
+            "featureCount": len(stream),
             "limitExceeded": True
-        }
-    
-    all_features = []
-    
-    for i in range(0, len(object_ids), max_record_count):
-        batch = object_ids[i:i + max_record_count]
-        params = {
-            'f': 'geojson' if has_geometry else 'json',
-            'where': where,
-            'objectIds': ','.join(map(str, batch)),
-            'outFields': '*',
-        }
-        if has_geometry:
-            params['returnGeometry'] = 'true'
-            params['outSR'] = '4326'
-        
-        try:
-            r = requests.post(f"{url}/query", data=params, timeout=120)
-            r.raise_for_status()
-            features_json = r.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch batch: {e}")
-            continue
-        
-        if 'error' in features_json:
-            logger.error(f"Esri error in batch: {features_json['error']}")
-            continue
-        
-        features = features_json.get('features', [])
-        all_features.extend(features)
-    
-    return {
-        "type": "FeatureCollection",
-        "features": all_features,
-        "metadata": {
-            "featureCount": len(all_features),
-            "hasGeometry": has_geometry
-        }
+        })
+
+    if format_type == 'geojson':
+        content_type, filename = "application/geo+json", "export.geojson"
+        chunks = geojson_chunks(stream, stream.has_geometry)
+    else:
+        content_type, filename = "text/csv", "export.csv"
+        chunks = csv_chunks(stream, stream.metadata, csv_geometry)
+
+    headers = {
+        "Content-Type": content_type,
+        "Content-Disposition": f"attachment; filename=\"{filename}\"",
+        "Access-Control-Expose-Headers": "Content-Disposition",
+        **CORS_HEADERS,
     }
+    return 200, headers, chunks
+
+
+def handle_request(event: Dict[str, Any]) -> Tuple[int, Dict[str, str], Iterable[str]]:
+    """Routes a Function URL event. Returns the status code, headers and body chunks."""
+    logger.info(f"Event: {json.dumps(event)[:500]}")
+
+    http_info = event.get('requestContext', {}).get('http', {})
+    method = http_info.get('method', 'GET')
+    path = http_info.get('path', '/')
+
+    # Handle OPTIONS for CORS
+    if method == 'OPTIONS':
+        return 200, {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers": "Content-Type",
+        }, [""]
+
+    params = parse_params(event)
+
+    if path == '/metadata' or path.endswith('/metadata'):
+        url = params.get('url')
+        if not url:
+            return json_response(400, {"error": "Missing 'url' parameter"})
+        metadata = get_metadata(url)
+        return json_response(400 if "error" in metadata else 200, metadata)
+
+    if path == '/extract' or path.endswith('/extract'):
+        return handle_extract(params)
+
+    return json_response(200, {
+        "service": "ezesri",
+        "version": "2.0.0",
+        "formats": ["geojson", "csv"],
+        "streaming": True,
+        "endpoints": {
+            "/metadata": "GET - Fetch layer metadata",
+            "/extract": "POST - Extract layer data"
+        }
+    })
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    """Lambda handler for Function URL."""
+    """Buffered Lambda handler for Function URL (used when not running the streaming loop)."""
     try:
-        logger.info(f"Event: {json.dumps(event)[:500]}")
-        
-        request_context = event.get('requestContext', {})
-        http_info = request_context.get('http', {})
-        method = http_info.get('method', 'GET')
-        path = http_info.get('path', '/')
-        
-        # Handle OPTIONS for CORS
-        if method == 'OPTIONS':
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                },
-                "body": ""
-            }
-        
-        query_params = event.get('queryStringParameters') or {}
-        body_params = {}
-        
-        if method == 'POST' and event.get('body'):
-            body = event['body']
-            if event.get('isBase64Encoded'):
-                import base64
-                body = base64.b64decode(body).decode('utf-8')
-            
-            headers = event.get('headers') or {}
-            content_type = headers.get('content-type') or headers.get('Content-Type') or ''
-            
-            if 'application/json' in content_type:
-                body_params = json.loads(body)
-            else:
-                parsed = parse_qs(body)
-                body_params = {k: v[0] for k, v in parsed.items()}
-        
-        params = {**query_params, **body_params}
-        
-        # Route requests
-        if path == '/metadata' or path.endswith('/metadata'):
-            url = params.get('url')
-            if not url:
-                return {"statusCode": 400, "body": json.dumps({"error": "Missing 'url' parameter"})}
-            
-            metadata = get_metadata(url)
-            if "error" in metadata:
-                return {"statusCode": 400, "body": json.dumps(metadata)}
-            
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                },
-                "body": json.dumps(metadata)
-            }
-        
-        elif path == '/extract' or path.endswith('/extract'):
-            url = params.get('url')
-            if not url:
-                return {"statusCode": 400, "body": json.dumps({"error": "Missing 'url' parameter"})}
-            
-            where = params.get('where', '1=1')
-            format_type = params.get('format', 'geojson').lower()
-            
-            bbox = None
-            bbox_str = params.get('bbox')
-            if bbox_str:
-                try:
-                    bbox = tuple(map(float, bbox_str.split(',')))
-                    if len(bbox) != 4:
-                        raise ValueError("bbox must have 4 values")
-                except (ValueError, AttributeError) as e:
-                    return {"statusCode": 400, "body": json.dumps({"error": f"Invalid bbox: {e}"})}
-            
-            result = extract_layer(url, where=where, bbox=bbox)
-            
-            if "error" in result:
-                return {"statusCode": 400, "body": json.dumps(result)}
-            
-            if format_type == 'geojson':
-                body_content = json.dumps(result)
-                return {
-                    "statusCode": 200,
-                    "headers": {
-                        "Content-Type": "application/geo+json",
-                        "Content-Disposition": "attachment; filename=\"export.geojson\"",
-                        "Access-Control-Allow-Origin": "*",
-                        "Access-Control-Expose-Headers": "Content-Disposition",
-                    },
-                    "body": body_content
-                }
-            elif format_type == 'csv':
-                csv_data = geojson_to_csv(result)
-                return {
-                    "statusCode": 200,
-                    "headers": {
-                        "Content-Type": "text/csv",
-                        "Content-Disposition": "attachment; filename=\"export.csv\"",
-                        "Access-Control-Allow-Origin": "*",
-                        "Access-Control-Expose-Headers": "Content-Disposition",
-                    },
-                    "body": csv_data
-                }
-            else:
-                return {"statusCode": 400, "body": json.dumps({"error": f"Format '{format_type}' not supported"})}
-        
-        else:
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                },
-                "body": json.dumps({
-                    "service": "ezesri",
-                    "version": "2.0.0",
-                    "formats": ["geojson", "csv"],
-                    "endpoints": {
-                        "/metadata": "GET - Fetch layer metadata",
-                        "/extract": "POST - Extract layer data"
-                    }
-                })
-            }
-        
+        status_code, headers, chunks = handle_request(event)
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": ''.join(chunks)
+        }
     except Exception as e:
         logger.error(f"Unhandled error: {e}", exc_info=True)
         return {
             "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-            },
+            "headers": {"Content-Type": "application/json", **CORS_HEADERS},
             "body": json.dumps({
                 "error": "Internal server error",
                 "message": str(e)
             })
         }
+
+
+def http_integration_stream(status_code: int, headers: Dict[str, str], chunks: Iterable[str]) -> Iterator[bytes]:
+    """
+    Encodes a streamed Function URL response: a JSON prelude with the status
+    code and headers, eight null bytes, then the body as it is produced.
+
+    The status has already been sent when a batch fails, so an error after
+    the first byte is raised out of the body: the chunked upload to the
+    Runtime API is aborted without its final chunk, and the client sees a
+    failed transfer instead of a truncated file that looks complete.
+    """
+    yield json.dumps({"statusCode": status_code, "headers": headers}).encode('utf-8') + HTTP_INTEGRATION_DELIMITER
+    for chunk in chunks:
+        if chunk:
+            yield chunk.encode('utf-8')
+
+
+def run_runtime_loop():
+    """Polls the Lambda Runtime API and streams each invocation's response."""
+    runtime_api = f"http://{os.environ['AWS_LAMBDA_RUNTIME_API']}/2018-06-01/runtime"
+    session = requests.Session()
+
+    while True:
+        invocation = session.get(f"{runtime_api}/invocation/next", timeout=None)
+        request_id = invocation.headers['Lambda-Runtime-Aws-Request-Id']
+        try:
+            status_code, headers, chunks = handle_request(invocation.json())
+        except Exception as e:
+            logger.error(f"Unhandled error: {e}", exc_info=True)
+            status_code, headers, chunks = json_response(500, {
+                "error": "Internal server error",
+                "message": str(e)
+            })
+
+        try:
+            # A generator body is sent with chunked transfer encoding, so each
+            # chunk reaches the client as soon as it is yielded.
+            session.post(
+                f"{runtime_api}/invocation/{request_id}/response",
+                data=http_integration_stream(status_code, headers, chunks),
+                headers={
+                    "Lambda-Runtime-Function-Response-Mode": "streaming",
+                    "Content-Type": HTTP_INTEGRATION_CONTENT_TYPE,
+                },
+                timeout=None
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to send response for {request_id}: {e}")
+        except Exception as e:
+            # Raised by the body after the response started; requests closes
+            # the connection, so the stream ends as an error
+            logger.error(f"Streaming response for {request_id} failed after it started: {e}", exc_info=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_runtime_loop()
@@ -5,26 +5,39 @@ Provides endpoints for extracting data from Esri REST services.
 Supports GeoJSON and CSV export. Shapefile/GeoParquet require additional setup.
 """
 
-import csv
-import io
 import json
 import logging
 import base64
 import os
+import re
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable
 from urllib.parse import parse_qs, urlparse
 
 import boto3
 import requests
+from ezesri import EsriLayerError, FeatureStream
+
+from cache import get_feature_count, get_metadata
+from exports import CSV_GEOMETRY_OPTIONS, buffer_or_upload, csv_chunks, geojson_chunks
+from jobs import JobError, LocalJobStore, S3JobStore, job_status, run_step, submit_job
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Feature count limit to prevent timeout/payload issues on massive layers
+# Feature count limit for responses returned directly (no export bucket).
+# These are built in memory and capped by the Lambda response size anyway.
 MAX_FEATURES = 100000
 
+# Feature count limit for exports streamed to S3. Memory stays bounded by
+# S3_PART_SIZE_BYTES regardless of the export size, so this is only a guard
+# against extractions that cannot finish within the function timeout.
+MAX_STREAMED_FEATURES = int(os.environ.get('MAX_STREAMED_FEATURES', 2000000))
+
+# Feature batches requested concurrently from the Esri server.
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+
 # S3 configuration
 s3_client = boto3.client('s3')
 EXPORT_BUCKET = os.environ.get('EXPORT_BUCKET')
@@ -32,92 +45,28 @@ EXPORT_BUCKET = os.environ.get('EXPORT_BUCKET')
 # Size threshold for using S3 (1MB) - responses larger than this go to S3
 S3_THRESHOLD_BYTES = 1024 * 1024
 
+# Job state directory for local runs; jobs are kept in EXPORT_BUCKET otherwise.
+JOB_STORE_DIR = os.environ.get('JOB_STORE_DIR')
 
-def geojson_to_csv(geojson: dict) -> str:
-    """
-    Convert GeoJSON FeatureCollection to CSV string.
-    
-    Flattens properties and optionally includes geometry as WKT or lat/lon.
-    """
-    features = geojson.get('features', [])
-    if not features:
-        return ""
-    
-    # Collect all unique field names from all features
-    all_fields = set()
-    for feature in features:
-        props = feature.get('properties', {})
-        if props:
-            all_fields.update(props.keys())
-    
-    # Sort fields for consistent column order
-    field_names = sorted(all_fields)
-    
-    # Check if we have point geometry - if so, add lat/lon columns
-    has_geometry = features[0].get('geometry') is not None
-    geom_type = features[0].get('geometry', {}).get('type', '') if has_geometry else ''
-    include_latlon = geom_type == 'Point'
-    
-    # Build CSV
-    output = io.StringIO()
-    
-    # Add lat/lon columns for point data
-    if include_latlon:
-        columns = field_names + ['latitude', 'longitude']
-    else:
-        columns = field_names
-    
-    writer = csv.DictWriter(output, fieldnames=columns, extrasaction='ignore')
-    writer.writeheader()
-    
-    for feature in features:
-        row = feature.get('properties', {}) or {}
-        
-        # Add lat/lon for point geometries
-        if include_latlon and feature.get('geometry'):
-            coords = feature['geometry'].get('coordinates', [])
-            if len(coords) >= 2:
-                row['longitude'] = coords[0]
-                row['latitude'] = coords[1]
-        
-        writer.writerow(row)
-    
-    return output.getvalue()
+# 'lambda' runs job steps as asynchronous invocations of the job step function;
+# 'inline' runs them in the submitting request (for sam local).
+JOB_RUNNER = os.environ.get('JOB_RUNNER', 'lambda')
 
+# The function running job steps, with a longer timeout than the API function.
+# Defaults to this function.
+JOB_FUNCTION_NAME = os.environ.get('JOB_FUNCTION_NAME') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
 
-def get_metadata(url: str) -> dict:
-    """Fetches layer metadata from an Esri REST API endpoint."""
-    params = {'f': 'json'}
-    try:
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to fetch metadata: {e}")
-        return {"error": str(e)}
+JOB_PATH = re.compile(r'/jobs/([0-9a-f]+)(/result)?/?$')
+
+_lambda_client = None
 
 
-def summarize_metadata(metadata: dict) -> dict:
+def summarize_metadata(metadata: dict, url: str) -> dict:
     """Creates a structured summary from metadata."""
     if "error" in metadata:
         return metadata
     
-    # Get feature count
-    feature_count = None
-    try:
-        # Try to get actual count via query
-        base_url = metadata.get('_source_url', '')
-        if base_url:
-            count_response = requests.get(
-                f"{base_url}/query",
-                params={'where': '1=1', 'returnCountOnly': 'true', 'f': 'json'},
-                timeout=30
-            )
-            if count_response.ok:
-                count_data = count_response.json()
-                feature_count = count_data.get('count')
-    except Exception as e:
-        logger.warning(f"Could not get feature count: {e}")
+    feature_count = get_feature_count(url, metadata)
     
     # Extract fields info
     fields = []
@@ -153,103 +102,52 @@ def summarize_metadata(metadata: dict) -> dict:
     }
 
 
-def extract_layer(
-    url: str,
-    where: str = '1=1',
-    bbox: Optional[tuple] = None,
-    max_features: int = MAX_FEATURES
-) -> Dict[str, Any]:
+def feature_limit_error(total_features: int, max_features: int) -> Dict[str, Any]:
+    return {
+        "error": f"Layer has {total_features:,} features, which exceeds the web app limit of {max_features:,}. Add a filter to reduce the count, or use the Python CLI for unlimited extraction: pip install ezesri",
+        "featureCount": total_features,
+        "limitExceeded": True
+    }
+
+
+def write_export(chunks: Iterable[str], filename: str, content_type: str) -> Dict[str, Any]:
     """
-    Extracts features from an Esri layer and returns as GeoJSON.
-    
-    Returns dict with 'type': 'FeatureCollection' and 'features' array.
+    Encodes an export and either returns it or streams it to S3.
+
+    Exports up to S3_THRESHOLD_BYTES are returned in the response; larger
+    ones are uploaded in parts as they are encoded (see buffer_or_upload()).
+    Without EXPORT_BUCKET everything is buffered.
     """
-    # Get metadata first
-    metadata = get_metadata(url)
-    if "error" in metadata:
-        return {"error": metadata["error"]}
-    
-    has_geometry = metadata.get('geometryType') is not None
-    max_record_count = metadata.get('maxRecordCount', 1000)
-    
-    # Get object IDs first
-    params = {
-        'f': 'json',
-        'where': where,
-        'returnIdsOnly': 'true'
-    }
-    
-    if bbox and has_geometry:
-        params['geometry'] = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
-        params['geometryType'] = 'esriGeometryEnvelope'
-        params['inSR'] = '4326'
-        params['spatialRel'] = 'esriSpatialRelIntersects'
-    
-    try:
-        r = requests.get(f"{url}/query", params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Failed to get object IDs: {e}"}
-    
-    if 'error' in data:
-        return {"error": f"Esri API error: {data['error']}"}
-    
-    object_ids = data.get('objectIds', [])
-    
-    if not object_ids:
-        return {
-            "type": "FeatureCollection",
-            "features": [],
-            "metadata": {"featureCount": 0}
-        }
-    
-    # Check feature count limit
-    total_features = len(object_ids)
-    if total_features > max_features:
+    s3_key = f"exports/{uuid.uuid4()}/{filename}"
+    data, upload, size = buffer_or_upload(
+        chunks, s3_client, EXPORT_BUCKET, s3_key, content_type, filename, S3_THRESHOLD_BYTES
+    )
+
+    if upload is None:
         return {
-            "error": f"Layer has {total_features:,} features, which exceeds the web app limit of {max_features:,}. Add a filter to reduce the count, or use the Python CLI for unlimited extraction: pip install ezesri",
-            "featureCount": total_features,
-            "limitExceeded": True
-        }
-    
-    # Fetch features in batches
-    all_features = []
-    
-    for i in range(0, len(object_ids), max_record_count):
-        batch = object_ids[i:i + max_record_count]
-        params = {
-            'f': 'geojson' if has_geometry else 'json',
-            'where': where,
-            'objectIds': ','.join(map(str, batch)),
-            'outFields': '*',
+            "statusCode": 200,
+            "body": data.decode('utf-8'),
+            "contentType": content_type,
+            "filename": filename,
+            "isRaw": True
         }
-        if has_geometry:
-            params['returnGeometry'] = 'true'
-            params['outSR'] = '4326'
-        
-        try:
-            r = requests.post(f"{url}/query", data=params, timeout=120)
-            r.raise_for_status()
-            features_json = r.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch batch: {e}")
-            continue
-        
-        if 'error' in features_json:
-            logger.error(f"Esri error in batch: {features_json['error']}")
-            continue
-        
-        features = features_json.get('features', [])
-        all_features.extend(features)
-    
+
+    # Generate presigned URL (valid for 15 minutes)
+    presigned_url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': EXPORT_BUCKET, 'Key': upload.key},
+        ExpiresIn=900
+    )
+    logger.info(f"Streamed {size} bytes to S3 in {len(upload.parts)} parts, returning presigned URL")
     return {
-        "type": "FeatureCollection",
-        "features": all_features,
-        "metadata": {
-            "featureCount": len(all_features),
-            "hasGeometry": has_geometry
-        }
+        "statusCode": 200,
+        "body": {
+            "downloadUrl": presigned_url,
+            "filename": filename,
+            "size": size,
+            "expiresIn": 900
+        },
+        "contentType": "application/json"
     }
 
 
@@ -276,9 +174,7 @@ def handle_metadata(url: str) -> Dict[str, Any]:
             "body": metadata
         }
     
-    # Add source URL for count query
-    metadata['_source_url'] = url
-    summary = summarize_metadata(metadata)
+    summary = summarize_metadata(metadata, url)
     
     return {
         "statusCode": 200,
@@ -313,22 +209,10 @@ def handle_extract(params: dict) -> Dict[str, Any]:
                 "body": {"error": f"Invalid bbox format: {e}. Expected: xmin,ymin,xmax,ymax"}
             }
     
-    # Extract the layer
-    result = extract_layer(url, where=where, bbox=bbox)
-    
-    if "error" in result:
-        return {
-            "statusCode": 400,
-            "body": result
-        }
-    
-    # Prepare response content based on format
     if format_type == 'geojson':
-        content = json.dumps(result)
         content_type = "application/geo+json"
         filename = "export.geojson"
     elif format_type == 'csv':
-        content = geojson_to_csv(result)
         content_type = "text/csv"
         filename = "export.csv"
     else:
@@ -337,65 +221,117 @@ def handle_extract(params: dict) -> Dict[str, Any]:
             "body": {"error": f"Format '{format_type}' is not yet supported. Available formats: geojson, csv"}
         }
     
-    content_bytes = content.encode('utf-8')
-    content_size = len(content_bytes)
+    csv_geometry = (params.get('csv_geometry') or 'auto').lower()
+    if csv_geometry not in CSV_GEOMETRY_OPTIONS:
+        return {
+            "statusCode": 400,
+            "body": {"error": f"Invalid csv_geometry '{csv_geometry}'. Available: {', '.join(CSV_GEOMETRY_OPTIONS)}"}
+        }
     
-    # If response is large, upload to S3 and return presigned URL
-    if content_size > S3_THRESHOLD_BYTES and EXPORT_BUCKET:
-        try:
-            # Generate unique filename
-            export_id = str(uuid.uuid4())
-            s3_key = f"exports/{export_id}/{filename}"
-            
-            # Upload to S3
-            s3_client.put_object(
-                Bucket=EXPORT_BUCKET,
-                Key=s3_key,
-                Body=content_bytes,
-                ContentType=content_type,
-                ContentDisposition=f'attachment; filename="{filename}"'
-            )
-            
-            # Generate presigned URL (valid for 15 minutes)
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': EXPORT_BUCKET, 'Key': s3_key},
-                ExpiresIn=900
-            )
-            
-            logger.info(f"Uploaded {content_size} bytes to S3, returning presigned URL")
-            
-            return {
-                "statusCode": 200,
-                "body": {
-                    "downloadUrl": presigned_url,
-                    "filename": filename,
-                    "size": content_size,
-                    "expiresIn": 900
-                },
-                "contentType": "application/json"
-            }
-        
-        except Exception as e:
-            logger.error(f"Failed to upload to S3: {e}")
-            # Fall through to direct response if S3 fails
+    # Metadata (usually cached by an earlier /metadata call) and object IDs
+    # are fetched up front; features are only requested as the export is written.
+    try:
+        stream = FeatureStream(url, where=where, bbox=bbox, workers=BATCH_WORKERS, metadata=get_metadata(url))
+    except (EsriLayerError, requests.exceptions.RequestException) as e:
+        return {
+            "statusCode": 400,
+            "body": {"error": str(e)}
+        }
+    
+    # Exports that go to S3 are streamed with bounded memory, so only
+    # directly returned responses need the smaller cap.
+    max_features = MAX_STREAMED_FEATURES if EXPORT_BUCKET else MAX_FEATURES
+    if len(stream) > max_features:
+        return {
+            "statusCode": 400,
+            "body": feature_limit_error(len(stream), max_features)
+        }
     
-    # Return directly for small responses
     if format_type == 'geojson':
+        chunks = geojson_chunks(stream, stream.has_geometry)
+    else:
+        chunks = csv_chunks(stream, stream.metadata, csv_geometry)
+    
+    try:
+        return write_export(chunks, filename, content_type)
+    except EsriLayerError as e:
+        logger.error(f"Extraction failed: {e}")
         return {
-            "statusCode": 200,
-            "body": result,
-            "contentType": "application/geo+json",
-            "filename": filename
+            "statusCode": 502,
+            "body": {"error": str(e)}
         }
-    else:  # CSV
+    except Exception as e:
+        logger.error(f"Failed to upload to S3: {e}")
         return {
-            "statusCode": 200,
-            "body": content,
-            "contentType": "text/csv",
-            "filename": filename,
-            "isRaw": True
+            "statusCode": 500,
+            "body": {"error": f"Export upload failed: {e}"}
+        }
+
+
+def get_job_store():
+    if JOB_STORE_DIR:
+        return LocalJobStore(JOB_STORE_DIR)
+    if EXPORT_BUCKET:
+        return S3JobStore(s3_client, EXPORT_BUCKET)
+    return None
+
+
+def dispatch_job_step(step: dict):
+    """Starts one job step, as an asynchronous invocation of the job step function or inline."""
+    global _lambda_client
+    if JOB_RUNNER == 'inline':
+        # Failed chunks dispatch their own retries, which run inline too
+        try:
+            run_step(get_job_store(), step, dispatch_job_step)
+        except Exception as e:
+            logger.error(f"Job step {step} failed: {e}")
+        return
+    if _lambda_client is None:
+        _lambda_client = boto3.client('lambda')
+    _lambda_client.invoke(
+        FunctionName=JOB_FUNCTION_NAME,
+        InvocationType='Event',
+        Payload=json.dumps({"jobStep": step})
+    )
+
+
+def handle_jobs(method: str, path: str, params: dict) -> Dict[str, Any]:
+    """Handle /jobs (submit) and /jobs/{id}[/result] (status, result URL)."""
+    store = get_job_store()
+    if store is None:
+        return {
+            "statusCode": 503,
+            "body": {"error": "Export jobs require EXPORT_BUCKET to be configured"}
         }
+    
+    match = JOB_PATH.search(path)
+    try:
+        if match is None:
+            if method != 'POST':
+                return {"statusCode": 405, "body": {"error": "Submit jobs with POST /jobs"}}
+            return {"statusCode": 202, "body": submit_job(store, params, dispatch_job_step)}
+        
+        status = job_status(store, match.group(1), dispatch=dispatch_job_step)
+        if match.group(2) and status['status'] != 'done':
+            return {"statusCode": 409, "body": status}
+        return {"statusCode": 200, "body": status}
+    except JobError as e:
+        not_found = str(e).startswith('Unknown job')
+        return {"statusCode": 404 if not_found else 400, "body": {"error": str(e)}}
+    except (EsriLayerError, requests.exceptions.RequestException) as e:
+        return {"statusCode": 400, "body": {"error": str(e)}}
+
+
+def job_step_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Runs one export job step, invoked asynchronously by dispatch_job_step.
+
+    Errors propagate so the invocation is reported as failed; failed chunks
+    have already dispatched their retry.
+    """
+    logger.info(f"Job step: {json.dumps(event['jobStep'])}")
+    run_step(get_job_store(), event["jobStep"], dispatch_job_step)
+    return {"status": "ok"}
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -404,6 +340,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     Supports both API Gateway and Lambda Function URL event formats.
     """
+    # Job steps sent to this function (no JOB_FUNCTION_NAME) bypass the
+    # API error handling below
+    if event.get("jobStep"):
+        return job_step_handler(event, context)
+    
     try:
         # Log event for debugging
         logger.info(f"Event: {json.dumps(event)[:500]}")
@@ -468,6 +409,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result = handle_metadata(params.get('url'))
         elif path == '/extract' or path.endswith('/extract'):
             result = handle_extract(params)
+        elif path.endswith('/jobs') or JOB_PATH.search(path):
+            result = handle_jobs(method, path, params)
         elif path == '/' or path == '':
             # Health check / info endpoint
             result = {
@@ -478,7 +421,10 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     "formats": ["geojson", "csv"],
                     "endpoints": {
                         "/metadata": "GET - Fetch layer metadata",
-                        "/extract": "POST - Extract layer data (GeoJSON or CSV)"
+                        "/extract": "POST - Extract layer data (GeoJSON or CSV)",
+                        "/jobs": "POST - Start an export job for a large layer",
+                        "/jobs/{id}": "GET - Job status and progress",
+                        "/jobs/{id}/result": "GET - Download URL of a finished job"
                     }
                 }
             }
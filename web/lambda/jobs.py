@@ -0,0 +1,564 @@
+"""
+Asynchronous export jobs for the ezesri web API.
+
+A job splits a layer's object IDs into chunks small enough to download within
+one invocation of the job step function. Every unit of work is a step,
+dispatched as its own asynchronous invocation:
+
+- ``start`` queues and dispatches the chunk steps, DISPATCH_WORKERS at a time
+- ``chunk`` downloads one slice of the object IDs and writes its encoded
+  features to a part object; the step that completes the last chunk claims
+  and runs the assembly
+- ``assemble`` concatenates the parts into the final export. On S3 the parts
+  are copied server-side (UploadPartCopy), so assembly does not download
+  the export.
+
+A failed chunk re-dispatches itself until MAX_CHUNK_ATTEMPTS. Steps that die
+without recording a failure (a timeout, a lost invocation) are found by
+status polls once they have made no progress for JOB_STEP_TIMEOUT, and are
+dispatched again or failed. Claims are objects created only if they do not
+exist, so each retry and the assembly have a single winner. Clients poll the
+job for progress and fetch the result URL when it is done.
+
+Job state lives in a JobStore: S3 in production, or a local directory for
+`sam local` and tests (JOB_STORE_DIR).
+
+Layout under the store:
+
+    <job>/job.json              request, object ID count, chunking
+    <job>/ids.bin               object IDs (little-endian int64), fetched once at submit
+    <job>/chunks/<n>.json       per-chunk state
+    <job>/done/<n>.json         marker per finished chunk, counted by listing
+    <job>/parts/<n>             per-chunk encoded features
+    <job>/claims/<name>.json    single-winner claims for retries and assembly
+    <job>/result.json           assembly state and, once done, the export key
+    <job>/<filename>            the assembled export
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from ezesri import FeatureStream
+
+from cache import get_metadata
+from exports import (
+    CSV_GEOMETRY_OPTIONS,
+    FORMATS,
+    CsvEncoder,
+    concatenate_objects,
+    geojson_footer,
+    geojson_fragment,
+    geojson_header,
+    read_range,
+)
+
+logger = logging.getLogger()
+
+# Object IDs per chunk. Each chunk must download within one invocation.
+JOB_CHUNK_FEATURES = int(os.environ.get('JOB_CHUNK_FEATURES', 20000))
+
+# Hard cap on job size; larger layers should be filtered or use the CLI.
+MAX_JOB_FEATURES = int(os.environ.get('MAX_JOB_FEATURES', 10000000))
+
+# A chunk (or the assembly) is attempted at most this many times.
+MAX_CHUNK_ATTEMPTS = 3
+
+# The job step function's timeout. A step with no progress for longer than
+# this is presumed dead and is retried.
+JOB_STEP_TIMEOUT = int(os.environ.get('JOB_STEP_TIMEOUT', 900))
+
+# Feature batches requested concurrently within a chunk.
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+
+# Chunk steps dispatched, and chunk states read, concurrently.
+DISPATCH_WORKERS = 16
+
+RESULT_URL_EXPIRES = 3600
+
+# Separator between GeoJSON features. Parts after the first start with it.
+_SEPARATOR = ', '
+
+_ID_BYTES = 8
+
+
+class JobError(Exception):
+    """Raised for job requests that cannot be served (unknown job, bad input)."""
+
+
+class LocalJobStore:
+    """Keeps job state in a local directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, *key.split('/'))
+
+    def get_json(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_json(self, key: str, value: Any):
+        self.put_bytes(key, json.dumps(value).encode('utf-8'))
+
+    def create_json(self, key: str, value: Any) -> bool:
+        """Writes ``value`` only if ``key`` does not exist yet. Returns whether it was written."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+        return True
+
+    def put_bytes(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_range(self, key: str, start: int, length: int) -> bytes:
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    def count_keys(self, prefix: str) -> int:
+        """Number of objects directly under the ``prefix`` directory."""
+        try:
+            return sum(1 for name in os.listdir(self._path(prefix)) if not name.endswith('.tmp'))
+        except FileNotFoundError:
+            return 0
+
+    def concatenate(self, key: str, segments: list, content_type: str, filename: str) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = 0
+        with open(path, 'wb') as f:
+            for segment in segments:
+                data = segment if isinstance(segment, bytes) else self.get_range(*segment)
+                size += len(data)
+                f.write(data)
+        return size
+
+    def result_url(self, key: str) -> str:
+        return 'file://' + os.path.abspath(self._path(key))
+
+
+class S3JobStore:
+    """Keeps job state in an S3 bucket under ``prefix``."""
+
+    def __init__(self, client, bucket: str, prefix: str = 'jobs/'):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get_json(self, key: str) -> Optional[dict]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def put_json(self, key: str, value: Any):
+        self.put_bytes(key, json.dumps(value).encode('utf-8'))
+
+    def create_json(self, key: str, value: Any) -> bool:
+        """Writes ``value`` only if ``key`` does not exist yet (a conditional put)."""
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.prefix + key,
+                Body=json.dumps(value).encode('utf-8'), IfNoneMatch='*'
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+        return True
+
+    def put_bytes(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def get_range(self, key: str, start: int, length: int) -> bytes:
+        return read_range(self.client, self.bucket, self.prefix + key, start, length)
+
+    def count_keys(self, prefix: str) -> int:
+        """Number of objects under ``prefix``, by listing (1,000 keys per request)."""
+        paginator = self.client.get_paginator('list_objects_v2')
+        return sum(page.get('KeyCount', 0) for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix))
+
+    def concatenate(self, key: str, segments: list, content_type: str, filename: str) -> int:
+        segments = [
+            segment if isinstance(segment, bytes) else (self.prefix + segment[0], segment[1], segment[2])
+            for segment in segments
+        ]
+        return concatenate_objects(self.client, self.bucket, self.prefix + key, segments, content_type, filename)
+
+    def result_url(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self.prefix + key},
+            ExpiresIn=RESULT_URL_EXPIRES
+        )
+
+
+def _chunk_key(job_id: str, index: int) -> str:
+    return f"{job_id}/chunks/{index:05d}.json"
+
+
+def _done_key(job_id: str, index: int) -> str:
+    return f"{job_id}/done/{index:05d}.json"
+
+
+def _part_key(job_id: str, index: int) -> str:
+    return f"{job_id}/parts/{index:05d}"
+
+
+def _claim_key(job_id: str, name: str) -> str:
+    return f"{job_id}/claims/{name}.json"
+
+
+def _ids_key(job_id: str) -> str:
+    return f"{job_id}/ids.bin"
+
+
+def _put_chunk_state(store, job_id: str, index: int, state: dict) -> dict:
+    state = {**state, 'updatedAt': time.time()}
+    store.put_json(_chunk_key(job_id, index), state)
+    return state
+
+
+def _put_result(store, job_id: str, result: dict) -> dict:
+    result = {**result, 'updatedAt': time.time()}
+    store.put_json(f"{job_id}/result.json", result)
+    return result
+
+
+def _load_job(store, job_id: str) -> dict:
+    job = store.get_json(f"{job_id}/job.json")
+    if job is None:
+        raise JobError(f"Unknown job {job_id}")
+    return job
+
+
+def submit_job(store, params: dict, dispatch: Callable[[dict], None]) -> dict:
+    """
+    Creates a job for an export request and dispatches its start step.
+
+    The object IDs are fetched once here, so every chunk covers a fixed slice
+    of them. They are stored as one binary object that chunks read by byte
+    range. Raises JobError for invalid requests and EsriLayerError if the
+    layer cannot be queried.
+    """
+    url = params.get('url')
+    if not url:
+        raise JobError("Missing 'url' parameter")
+    format_type = (params.get('format') or 'geojson').lower()
+    if format_type not in FORMATS:
+        raise JobError(f"Format '{format_type}' is not supported. Available formats: {', '.join(FORMATS)}")
+    csv_geometry = (params.get('csv_geometry') or 'auto').lower()
+    if csv_geometry not in CSV_GEOMETRY_OPTIONS:
+        raise JobError(f"Invalid csv_geometry '{csv_geometry}'. Available: {', '.join(CSV_GEOMETRY_OPTIONS)}")
+    where = params.get('where') or '1=1'
+    bbox = None
+    if params.get('bbox'):
+        try:
+            bbox = tuple(map(float, params['bbox'].split(',')))
+            if len(bbox) != 4:
+                raise ValueError("bbox must have 4 values")
+        except (ValueError, AttributeError) as e:
+            raise JobError(f"Invalid bbox format: {e}. Expected: xmin,ymin,xmax,ymax")
+
+    stream = FeatureStream(url, where=where, bbox=bbox, metadata=get_metadata(url))
+    total = len(stream)
+    if total > MAX_JOB_FEATURES:
+        raise JobError(f"Layer has {total:,} features, which exceeds the job limit of {MAX_JOB_FEATURES:,}.")
+
+    job_id = uuid.uuid4().hex
+    content_type, filename = FORMATS[format_type]
+    job = {
+        'id': job_id,
+        'url': url,
+        'where': where,
+        'format': format_type,
+        'csvGeometry': csv_geometry,
+        'contentType': content_type,
+        'filename': filename,
+        'total': total,
+        'chunkSize': JOB_CHUNK_FEATURES,
+        'chunks': max(1, -(-total // JOB_CHUNK_FEATURES)),
+        'hasGeometry': stream.has_geometry,
+        'metadata': {
+            'geometryType': stream.metadata.get('geometryType'),
+            'fields': stream.metadata.get('fields') or [],
+        },
+        'createdAt': time.time(),
+    }
+    ids = array('q', stream.object_ids)
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    store.put_bytes(_ids_key(job_id), ids.tobytes())
+    store.put_json(f"{job_id}/job.json", job)
+
+    dispatch({'jobId': job_id, 'step': 'start'})
+    return job_status(store, job_id)
+
+
+def run_step(store, step: dict, dispatch: Callable[[dict], None]):
+    """Runs one dispatched job step: ``{'jobId', 'step': 'start' | 'chunk' | 'assemble', ...}``."""
+    job = _load_job(store, step['jobId'])
+    kind = step.get('step')
+    if kind == 'start':
+        start_job(store, job, dispatch)
+    elif kind == 'chunk':
+        run_chunk(store, job, int(step['chunk']), dispatch)
+    elif kind == 'assemble':
+        assemble(store, job, int(step.get('attempt', 0)), dispatch)
+    else:
+        raise JobError(f"Unknown job step {kind!r}")
+
+
+def start_job(store, job: dict, dispatch: Callable[[dict], None]):
+    """Queues and dispatches every chunk that has no state yet."""
+    states = _chunk_states(store, job)
+
+    def queue(index: int):
+        _put_chunk_state(store, job['id'], index, {'status': 'queued', 'attempts': 0})
+        dispatch({'jobId': job['id'], 'step': 'chunk', 'chunk': index})
+
+    pending = [index for index, state in enumerate(states) if state is None]
+    with ThreadPoolExecutor(max_workers=DISPATCH_WORKERS) as executor:
+        list(executor.map(queue, pending))
+
+
+def _chunk_ids(store, job: dict, index: int) -> array:
+    first = index * job['chunkSize']
+    count = min(job['chunkSize'], job['total'] - first)
+    ids = array('q')
+    if count > 0:
+        ids.frombytes(store.get_range(_ids_key(job['id']), first * _ID_BYTES, count * _ID_BYTES))
+        if sys.byteorder == 'big':
+            ids.byteswap()
+    return ids
+
+
+def run_chunk(store, job: dict, index: int, dispatch: Callable[[dict], None]):
+    """
+    Downloads and encodes one chunk of a job, then assembles the export if it was the last.
+
+    A failure is recorded on the chunk, which is dispatched again until
+    MAX_CHUNK_ATTEMPTS. The error is always re-raised, so the invocation
+    is reported as failed.
+    """
+    job_id = job['id']
+    state = store.get_json(_chunk_key(job_id, index)) or {'attempts': 0}
+    if state.get('status') in ('done', 'failed'):
+        return
+
+    attempts = state.get('attempts', 0) + 1
+    _put_chunk_state(store, job_id, index, {'status': 'running', 'attempts': attempts})
+
+    try:
+        stream = FeatureStream(
+            job['url'], where=job['where'], object_ids=_chunk_ids(store, job, index),
+            workers=BATCH_WORKERS, metadata=get_metadata(job['url'])
+        )
+        count = 0
+        pieces = []
+        encoder = CsvEncoder(job['metadata'], job['csvGeometry']) if job['format'] == 'csv' else None
+        for features in stream:
+            if not features:
+                continue
+            pieces.append(encoder.rows(features) if encoder else geojson_fragment(features))
+            count += len(features)
+        if encoder:
+            text = ''.join(pieces)
+        else:
+            # The separator before this chunk's features lives in its part,
+            # so the parts can be concatenated as they are
+            text = _SEPARATOR.join(pieces)
+            if text and index > 0:
+                text = _SEPARATOR + text
+        data = text.encode('utf-8')
+        store.put_bytes(_part_key(job_id, index), data)
+    except Exception as e:
+        failed = attempts >= MAX_CHUNK_ATTEMPTS
+        logger.error(f"Job {job_id} chunk {index} failed (attempt {attempts}): {e}")
+        _put_chunk_state(store, job_id, index, {
+            'status': 'failed' if failed else 'retrying', 'attempts': attempts, 'error': str(e)
+        })
+        if not failed:
+            dispatch({'jobId': job_id, 'step': 'chunk', 'chunk': index})
+        raise
+
+    _put_chunk_state(store, job_id, index, {'status': 'done', 'attempts': attempts, 'features': count, 'bytes': len(data)})
+    store.put_json(_done_key(job_id, index), {})
+    finalize_if_complete(store, job, dispatch)
+
+
+def _chunk_states(store, job: dict) -> List[Optional[dict]]:
+    """Every chunk's state (None until the start step queues it), read concurrently."""
+    keys = [_chunk_key(job['id'], i) for i in range(job['chunks'])]
+    with ThreadPoolExecutor(max_workers=min(DISPATCH_WORKERS, len(keys))) as executor:
+        return list(executor.map(store.get_json, keys))
+
+
+def finalize_if_complete(store, job: dict, dispatch: Callable[[dict], None]) -> bool:
+    """Assembles the export once every chunk is done. Only one caller wins the claim."""
+    if store.count_keys(f"{job['id']}/done/") < job['chunks']:
+        return False
+    if not store.create_json(_claim_key(job['id'], 'assembly-0'), {'claimedAt': time.time()}):
+        return False
+    assemble(store, job, 0, dispatch)
+    return True
+
+
+def assemble(store, job: dict, attempt: int, dispatch: Callable[[dict], None]):
+    """
+    Concatenates the header, the chunk parts and the footer into the export.
+
+    The caller holds the claim for ``attempt``. If the assembly fails, the
+    next attempt is claimed and dispatched, until MAX_CHUNK_ATTEMPTS.
+    """
+    job_id = job['id']
+    _put_result(store, job_id, {'status': 'assembling', 'attempt': attempt})
+    states = _chunk_states(store, job)
+    total = sum(s.get('features', 0) for s in states)
+
+    is_csv = job['format'] == 'csv'
+    header = CsvEncoder(job['metadata'], job['csvGeometry']).header() if is_csv else geojson_header()
+    segments = [header.encode('utf-8')]
+    for index, state in enumerate(states):
+        size = state.get('bytes', 0)
+        if not size:
+            continue
+        # The first GeoJSON part written drops its leading separator
+        skip = len(_SEPARATOR) if not is_csv and index > 0 and len(segments) == 1 else 0
+        segments.append((_part_key(job_id, index), skip, size - skip))
+    if not is_csv:
+        segments.append(geojson_footer(total, job['hasGeometry']).encode('utf-8'))
+
+    key = f"{job_id}/{job['filename']}"
+    try:
+        size = store.concatenate(key, segments, job['contentType'], job['filename'])
+    except Exception as e:
+        logger.error(f"Job {job_id} assembly failed (attempt {attempt + 1}): {e}")
+        error = f"Assembling the export failed: {e}"
+        if attempt + 1 >= MAX_CHUNK_ATTEMPTS:
+            _put_result(store, job_id, {'status': 'failed', 'attempt': attempt, 'error': error})
+        elif store.create_json(_claim_key(job_id, f'assembly-{attempt + 1}'), {'claimedAt': time.time()}):
+            _put_result(store, job_id, {'status': 'assembling', 'attempt': attempt + 1, 'error': error})
+            dispatch({'jobId': job_id, 'step': 'assemble', 'attempt': attempt + 1})
+        raise
+    _put_result(store, job_id, {
+        'status': 'done', 'attempt': attempt, 'key': key, 'size': size, 'features': total, 'finishedAt': time.time()
+    })
+
+
+def _retry_stale_steps(store, job: dict, states: List[Optional[dict]], result: Optional[dict],
+                       dispatch: Callable[[dict], None]) -> Optional[dict]:
+    """
+    Dispatches again (or fails) steps with no progress for JOB_STEP_TIMEOUT.
+
+    ``states`` is updated in place; returns the possibly updated result.
+    """
+    job_id = job['id']
+    now = time.time()
+
+    def stale(record: dict) -> bool:
+        return now - record.get('updatedAt', 0) > JOB_STEP_TIMEOUT
+
+    if any(state is None for state in states) and now - job['createdAt'] > JOB_STEP_TIMEOUT:
+        # The start step died before queueing every chunk; one retry per timeout period
+        if store.create_json(_claim_key(job_id, f'start-{int(now // JOB_STEP_TIMEOUT)}'), {'claimedAt': now}):
+            dispatch({'jobId': job_id, 'step': 'start'})
+
+    for index, state in enumerate(states):
+        if state is None or state['status'] in ('done', 'failed') or not stale(state):
+            continue
+        # Keyed by the stale state, so concurrent polls retry it only once
+        if not store.create_json(_claim_key(job_id, f"chunk-{index:05d}-{int(state['updatedAt'] * 1000)}"), {'claimedAt': now}):
+            continue
+        attempts = state.get('attempts', 0)
+        if state['status'] == 'running' and attempts >= MAX_CHUNK_ATTEMPTS:
+            states[index] = _put_chunk_state(store, job_id, index, {
+                'status': 'failed', 'attempts': attempts, 'error': f"Chunk {index} timed out"
+            })
+            continue
+        error = 'Timed out' if state['status'] == 'running' else state.get('error') or 'Not started'
+        states[index] = _put_chunk_state(store, job_id, index, {'status': 'retrying', 'attempts': attempts, 'error': error})
+        dispatch({'jobId': job_id, 'step': 'chunk', 'chunk': index})
+
+    # An assembly that died, or the last chunk dying between finishing and claiming it
+    if result is None and states and all(state and state['status'] == 'done' for state in states):
+        result = {'status': 'assembling', 'attempt': 0, 'updatedAt': max(state['updatedAt'] for state in states)}
+    if result and result.get('status') == 'assembling' and stale(result):
+        attempt = result.get('attempt', 0) + 1
+        if store.create_json(_claim_key(job_id, f'assembly-{attempt}'), {'claimedAt': now}):
+            if attempt >= MAX_CHUNK_ATTEMPTS:
+                return _put_result(store, job_id, {'status': 'failed', 'attempt': attempt, 'error': "Assembling the export timed out"})
+            result = _put_result(store, job_id, {'status': 'assembling', 'attempt': attempt})
+            dispatch({'jobId': job_id, 'step': 'assemble', 'attempt': attempt})
+    return result
+
+
+def job_status(store, job_id: str, dispatch: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Returns a job's status, progress and, once it is done, its download URL.
+
+    With ``dispatch``, steps with no progress for JOB_STEP_TIMEOUT are
+    dispatched again first, or failed once they are out of attempts.
+    """
+    job = _load_job(store, job_id)
+    states = _chunk_states(store, job)
+    result = store.get_json(f"{job_id}/result.json")
+    if dispatch is not None:
+        result = _retry_stale_steps(store, job, states, result, dispatch)
+
+    done = [s for s in states if s and s.get('status') == 'done']
+    failed = [s for s in states if s and s.get('status') == 'failed']
+    if result and result.get('status') == 'failed':
+        failed.append(result)
+    if failed:
+        status = 'failed'
+    elif result and result.get('status') == 'done':
+        status = 'done'
+    elif any(s and s.get('status') != 'queued' for s in states):
+        status = 'running'
+    else:
+        status = 'queued'
+
+    body = {
+        'jobId': job_id,
+        'status': status,
+        'format': job['format'],
+        'progress': {
+            'chunks': job['chunks'],
+            'chunksDone': len(done),
+            'featureCount': job['total'],
+            'featuresDone': sum(s.get('features', 0) for s in done),
+        },
+    }
+    if failed:
+        body['error'] = failed[0].get('error')
+    if status == 'done':
+        body['downloadUrl'] = store.result_url(result['key'])
+        body['filename'] = job['filename']
+        body['size'] = result.get('size')
+        body['expiresIn'] = RESULT_URL_EXPIRES
+    return body